@@ -13,10 +13,16 @@ from engine.schemas.data_broker import Pipeline
 from engine.schemas.enums import OrderDirection, OrderExecutionReportStatus, SessionPeriod, OrderType
 from engine.candles.candles_uploader import LocalCandlesUploader
 import pandas as pd
+import numpy as np
 from decimal import Decimal
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, replace
+from typing import Optional, Iterator, Union
 from datetime import datetime, timedelta
+from threading import Event
+from bisect import bisect_left, bisect_right
+
+
+price_columns = ['open', 'close', 'high', 'low']
 
 
 class TMockClient(local_api.Client):
@@ -29,7 +35,8 @@ class TMockClient(local_api.Client):
             market_order_price: str = 'open',
             buy_price_end_period: str = 'low',
             sell_price_end_period: str = 'high',
-            cash: float = 100000
+            cash: float = 100000,
+            fast_forward: bool = False
     ):
         super().__init__(t_invest)
 
@@ -38,6 +45,8 @@ class TMockClient(local_api.Client):
         self.market_order_price = market_order_price
         self.buy_price_end_period = buy_price_end_period
         self.sell_price_end_period = sell_price_end_period
+        # skip minutes in which none of the traded types of instruments is in a session
+        self.fast_forward = fast_forward
 
         self.period: TPeriod = TPeriod(time_period=period)
         self.period_duration = 0
@@ -45,17 +54,27 @@ class TMockClient(local_api.Client):
         self._cash = cash
 
         self.uid_to_tickers = {ticker.uid: ticker for ticker in tickers}
+        self.types_instruments = list(set([ticker.type_instrument for ticker in tickers]))
 
         self.candle_data: dict = {
             ticker:
                 LocalCandlesUploader.upload_candles(ticker=ticker) for ticker in tickers
         }
-        self.current_candles = {ticker: {} for ticker in self.candle_data.keys()}
+        self.tickers = list(self.candle_data.keys())
+        self.ticker_positions = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+        # prices of every ticker as a contiguous (n, 4) array with columns of price_columns
+        self.prices = {
+            ticker: np.ascontiguousarray(candles_df[price_columns].to_numpy(dtype=np.float64))
+            for ticker, candles_df in self.candle_data.items()
+        }
         self.last_candles_idx = {ticker: 0 for ticker in self.candle_data.keys()}
 
         for ticker, candles_df in self.candle_data.items():
             self.last_candles_idx[ticker] = (candles_df.index <= self.period.time_period).argmin() - 1
-            self.current_candles[ticker] = candles_df.iloc[self.last_candles_idx[ticker]].to_dict()
+
+        self._current_prices: np.ndarray = None
+        self._order_books: dict[TTicker, local_api.GetOrderBookResponse] = {}
 
         for ticker in self.candle_data.keys():
             LocalCandlesUploader.candles_in_memory[ticker] = \
@@ -74,63 +93,84 @@ class TMockClient(local_api.Client):
     def __exit__(self, exc_type, exc_val, exc_tb):
         return False
 
-    def next_period(self):
-        for order in self.services.orders.order_history:
-            ticker = self.uid_to_tickers[order.instrument_id]
+    # prices of the current candles of all tickers, a (number of tickers, 4) array
+    def current_prices(self) -> np.ndarray:
+        if self._current_prices is None:
+            self._current_prices = np.array(
+                [self.prices[ticker][self.last_candles_idx[ticker]] for ticker in self.tickers]
+            ).reshape(len(self.tickers), len(price_columns))
 
-            if (self.period.instrument_session[ticker.type_instrument]
-                    == SessionPeriod.CLOSED):
-                continue
+        return self._current_prices
 
-            if order.status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW:
-                p = round(order.price, 9)
-                mid = (round(Decimal(self.current_candles[ticker]['high']), 9)
-                       + round(Decimal(self.current_candles[ticker]['low']), 9) ) / 2
-
-                if self.buy_price_end_period == 'mid':
-                    p_buy = mid
-                else:
-                    p_buy = round(Decimal(self.current_candles[ticker][self.buy_price_end_period]), 9)
-
-                if self.sell_price_end_period == 'mid':
-                    p_sell = mid
-                else:
-                    p_sell = round(Decimal(self.current_candles[ticker][self.sell_price_end_period]), 9)
-
-                if self.market_order_price == 'mid':
-                    p_market = mid
-                else:
-                    p_market = round(Decimal(self.current_candles[ticker][self.market_order_price]), 9)
-
-                if order.order_type == OrderType.ORDER_TYPE_LIMIT:
-                    if ((order.direction == OrderDirection.ORDER_DIRECTION_BUY and p >= p_buy)
-                            or (order.direction == OrderDirection.ORDER_DIRECTION_SELL and p <= p_sell)):
-                        order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
-                        order.executed_order_price = p
-                        order.lots_executed = order.quantity
-                        order.executed_commission = Decimal(0)
-                        order.total_order_amount = order.quantity * p * ticker.lot
-
-                        self._cash += float(order.quantity * p * ticker.lot
-                                            * (-1 if order.direction == OrderDirection.ORDER_DIRECTION_BUY else 1))
-                elif order.order_type == OrderType.ORDER_TYPE_MARKET:
-                    order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
-                    order.executed_order_price = p_market
-                    order.lots_executed = order.quantity
-                    order.executed_commission = Decimal(0)
-                    order.total_order_amount = order.quantity * p_market * ticker.lot
-
-                    self._cash += float(order.quantity * p_market * ticker.lot
-                                        * (-1 if order.direction == OrderDirection.ORDER_DIRECTION_BUY else 1))
+    def price_of(self, price_type: str) -> np.ndarray:
+        prices = self.current_prices()
 
-        for ticker, candles_df in self.candle_data.items():
+        if price_type == 'mid':
+            return (prices[:, price_columns.index('high')] + prices[:, price_columns.index('low')]) / 2
+
+        return prices[:, price_columns.index(price_type)]
+
+    def _execute_orders(self):
+        orders = self.services.orders
+
+        if len(orders.open_orders) == 0:
+            return
+
+        p_buy = self.price_of(self.buy_price_end_period)
+        p_sell = self.price_of(self.sell_price_end_period)
+        p_market = self.price_of(self.market_order_price)
+
+        filled_ids = []
+
+        for position, ticker in enumerate(self.tickers):
             if self.period.instrument_session[ticker.type_instrument] == SessionPeriod.CLOSED:
                 continue
 
+            filled_ids += orders.pop_crossed_orders(ticker.uid, p_buy.item(position), p_sell.item(position))
+
+        # orders are executed in the order of their posting
+        for order_id in sorted(filled_ids):
+            order = orders.order_history[order_id]
+            ticker = self.uid_to_tickers[order.instrument_id]
+
+            if order.order_type == OrderType.ORDER_TYPE_MARKET:
+                p = round(Decimal(p_market.item(self.ticker_positions[ticker])), 9)
+            else:
+                p = round(order.price, 9)
+
+            order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
+            order.executed_order_price = p
+            order.lots_executed = order.quantity
+            order.executed_commission = Decimal(0)
+            order.total_order_amount = order.quantity * p * ticker.lot
+            orders.state_changes.append(order_id)
+
+            self._cash += float(order.quantity * p * ticker.lot
+                                * (-1 if order.direction == OrderDirection.ORDER_DIRECTION_BUY else 1))
+
+    def next_period(self):
+        self._execute_orders()
+
+        tickers_in_session = [
+            ticker for ticker in self.tickers
+            if self.period.instrument_session[ticker.type_instrument] != SessionPeriod.CLOSED
+        ]
+
+        for ticker in tickers_in_session:
+            if self.last_candles_idx[ticker] + 1 >= self.prices[ticker].shape[0]:
+                raise StopIteration
+
+        for ticker in tickers_in_session:
             self.last_candles_idx[ticker] += 1
-            self.current_candles[ticker] = candles_df.iloc[self.last_candles_idx[ticker]].to_dict()
 
-        self.period.next_period(update_with_cur_time=False)
+        self._current_prices = None
+        self._order_books = {}
+
+        # candles are consumed only in sessions, so skipped minutes do not move last_candles_idx
+        if self.fast_forward:
+            self.period.skip_closed_periods(self.types_instruments)
+        else:
+            self.period.next_period(update_with_cur_time=False)
 
     def get_account(self, account_type):
         return MockUsers(self.services).account
@@ -190,7 +230,83 @@ class MockClientServices(local_api.Services):
             from_,
             to=None
     ):
-        pass
+        if to is None:
+            to = self.client.period.time_period + timedelta(minutes=1)
+
+        return self._candles_window(uid, from_, to)
+
+    # the candles with trades of the window up to the current period, as the api returns them
+    def _candles_window(
+            self,
+            uid: str,
+            from_: datetime,
+            to: datetime
+    ) -> pd.DataFrame:
+        ticker = self.client.uid_to_tickers[uid]
+        candles = self.client.candle_data[ticker].iloc[:self.client.last_candles_idx[ticker] + 1]
+        candles = candles[(candles.index >= from_) & (candles.index < to) & (candles['volume'] > 0)]
+
+        return candles[['open', 'high', 'low', 'close', 'volume']].reset_index()
+
+    # the candles with trades of the periods passed since the subscription, each period followed by its top of book
+    def market_data_events(
+            self,
+            uids: list[str],
+            stop: Event
+    ) -> Iterator[Union[local_api.Candle, local_api.GetOrderBookResponse]]:
+        tickers = [self.client.uid_to_tickers[uid] for uid in uids if uid in self.client.uid_to_tickers.keys()]
+        sent_idx = {ticker: self.client.last_candles_idx[ticker] for ticker in tickers}
+
+        def events():
+            while not stop.is_set():
+                for ticker in tickers:
+                    last_idx = self.client.last_candles_idx[ticker]
+
+                    if last_idx == sent_idx[ticker]:
+                        continue
+
+                    candles = self.client.candle_data[ticker].iloc[sent_idx[ticker] + 1:last_idx + 1]
+                    sent_idx[ticker] = last_idx
+
+                    for candle in candles[candles['volume'] > 0].itertuples():
+                        yield local_api.Candle(
+                            instrument_uid=ticker.uid,
+                            time=candle.Index,
+                            open=candle.open,
+                            high=candle.high,
+                            low=candle.low,
+                            close=candle.close,
+                            volume=candle.volume
+                        )
+
+                    yield replace(self.market_data.get_order_book(instrument_id=ticker.uid), instrument_uid=ticker.uid)
+
+                # the periods are moved by the trading loop
+                stop.wait(0.01)
+
+        return events()
+
+    # the states of the orders executed or cancelled since the subscription
+    def order_state_events(
+            self,
+            account_id: str,
+            stop: Event
+    ) -> Iterator[Optional[OrderState]]:
+        position = len(self.orders.state_changes)
+
+        def events():
+            nonlocal position
+
+            yield None
+
+            while not stop.is_set():
+                while position < len(self.orders.state_changes):
+                    yield self.orders.get_order_state(order_id=str(self.orders.state_changes[position]))
+                    position += 1
+
+                stop.wait(0.01)
+
+        return events()
 
 
 class MockService:
@@ -218,9 +334,74 @@ class MockOrders(MockService, local_api.OrdersService):
 
     def __init__(self, client):
         super().__init__(client)
+        # every posted order, the order id is the position in the history
         self.order_history = []
+        self.open_orders: dict[int, MockOrder] = {}
+        # open limit orders by (instrument, direction): ascending prices in increments of the instrument
+        # and ids of the orders with these prices
+        self.limit_orders: dict[tuple[str, OrderDirection], tuple[list[int], list[int]]] = {}
+        self.market_orders: dict[str, list[int]] = {}
+        # ids of the orders in the order they were executed or cancelled
+        self.state_changes: list[int] = []
         self.id = 0
 
+    # the price in increments of the price of the instrument, so that prices are compared on the grid of the exchange
+    def _increments(self, instrument_id: str, price) -> int:
+        min_incr = round(Decimal(self.client.uid_to_tickers[instrument_id].min_price_increment), 9)
+
+        return int((round(Decimal(price), 9) / min_incr).to_integral_value())
+
+    def _add_open_order(self, order_id: int, order: MockOrder):
+        self.open_orders[order_id] = order
+
+        if order.order_type == OrderType.ORDER_TYPE_MARKET:
+            self.market_orders.setdefault(order.instrument_id, []).append(order_id)
+        elif order.order_type == OrderType.ORDER_TYPE_LIMIT:
+            prices, ids = self.limit_orders.setdefault((order.instrument_id, order.direction), ([], []))
+            price = self._increments(order.instrument_id, order.price)
+            i = bisect_right(prices, price)
+
+            prices.insert(i, price)
+            ids.insert(i, order_id)
+
+    def _remove_open_order(self, order_id: int):
+        order = self.open_orders.pop(order_id)
+
+        if order.order_type == OrderType.ORDER_TYPE_MARKET:
+            self.market_orders[order.instrument_id].remove(order_id)
+        elif order.order_type == OrderType.ORDER_TYPE_LIMIT:
+            prices, ids = self.limit_orders[(order.instrument_id, order.direction)]
+            i = bisect_left(prices, self._increments(order.instrument_id, order.price))
+
+            while ids[i] != order_id:
+                i += 1
+
+            del prices[i], ids[i]
+
+    # removes from the open orders and returns ids of market orders and limit orders crossed by the prices,
+    # all rounded to the increment of the price of the instrument
+    def pop_crossed_orders(self, instrument_id: str, p_buy: float, p_sell: float) -> list[int]:
+        crossed_ids = self.market_orders.pop(instrument_id, [])
+
+        if (instrument_id, OrderDirection.ORDER_DIRECTION_BUY) in self.limit_orders.keys():
+            prices, ids = self.limit_orders[(instrument_id, OrderDirection.ORDER_DIRECTION_BUY)]
+            i = bisect_left(prices, self._increments(instrument_id, p_buy))
+
+            crossed_ids += ids[i:]
+            del prices[i:], ids[i:]
+
+        if (instrument_id, OrderDirection.ORDER_DIRECTION_SELL) in self.limit_orders.keys():
+            prices, ids = self.limit_orders[(instrument_id, OrderDirection.ORDER_DIRECTION_SELL)]
+            i = bisect_right(prices, self._increments(instrument_id, p_sell))
+
+            crossed_ids += ids[:i]
+            del prices[:i], ids[:i]
+
+        for order_id in crossed_ids:
+            del self.open_orders[order_id]
+
+        return crossed_ids
+
     def post_order(self, *args, quantity: int = 0, price: Decimal = None,
                    direction: OrderDirection = OrderDirection.ORDER_DIRECTION_UNSPECIFIED,
                    account_id: str = "", order_type: OrderType = OrderType.ORDER_TYPE_UNSPECIFIED,
@@ -236,6 +417,8 @@ class MockOrders(MockService, local_api.OrdersService):
                       executed_commission=None, total_order_amount=None)
         )
 
+        self._add_open_order(self.id, self.order_history[-1])
+
         self.id += 1
 
         return PostOrderResponse(
@@ -253,8 +436,12 @@ class MockOrders(MockService, local_api.OrdersService):
     ) -> local_api.CancelOrderResponse:
         order_id = int(order_id)
 
-        if self.order_history[order_id].status != OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL:
+        if self.order_history[order_id].status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW:
             self.order_history[order_id].status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED
+            self.state_changes.append(order_id)
+
+        if order_id in self.open_orders.keys():
+            self._remove_open_order(order_id)
 
     def get_order_state(
             self, *,
@@ -296,26 +483,20 @@ class MockMarketData(MockService, local_api.MarketDataService):
     ) -> local_api.GetOrderBookResponse:
         ticker = self.client.uid_to_tickers[instrument_id]
 
-        mid = (self.client.current_candles[ticker]['low'] + self.client.current_candles[ticker]['high']) / 2
+        # the order book only changes with the candles, so it is built once per period
+        if ticker not in self.client._order_books.keys():
+            position = self.client.ticker_positions[ticker]
 
-        if self.client.bid_orderbook_price == 'mid':
-            p_bid = mid
-        else:
-            p_bid = self.client.current_candles[ticker][self.client.bid_orderbook_price]
+            self.client._order_books[ticker] = local_api.GetOrderBookResponse(
+                bids=[local_api.Order(price=self.client.price_of(self.client.bid_orderbook_price)[position].item(),
+                                      quantity=1000000)],
+                asks=[local_api.Order(price=self.client.price_of(self.client.ask_orderbook_price)[position].item(),
+                                      quantity=1000000)],
+                depth=1,
+                instrument_uid=''
+            )
 
-        if self.client.ask_orderbook_price == 'mid':
-            p_ask = mid
-        else:
-            p_ask = self.client.current_candles[ticker][self.client.ask_orderbook_price]
-
-        return local_api.GetOrderBookResponse(
-            bids=[local_api.Order(price=p_bid,
-                                  quantity=1000000)],
-            asks=[local_api.Order(price=p_ask,
-                                  quantity=1000000)],
-            depth=1,
-            instrument_uid=''
-        )
+        return self.client._order_books[ticker]
 
 
 @dataclass
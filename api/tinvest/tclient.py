@@ -6,17 +6,20 @@ import pandas as pd
 from engine.schemas.datatypes import Broker
 from engine.schemas.constants import instrument_path
 from tinkoff.invest.constants import INVEST_GRPC_API, INVEST_GRPC_API_SANDBOX
-from tinkoff.invest import CandleInterval, RequestError
+from tinkoff.invest import CandleInterval, RequestError, MarketDataRequest, SubscribeCandlesRequest, \
+    SubscribeOrderBookRequest, SubscriptionAction, SubscriptionInterval, CandleInstrument, OrderBookInstrument
 from api.tinvest.tperiod import TPeriod
 from api.tinvest.tticker import TTicker
 from api.tinvest.datatypes import SessionAuction, AccountType, InstrumentType
 from api.tinvest.utils import quotation_to_float, quotation_to_decimal, to_quotation
 from api.broker_list import t_invest
 from typing_extensions import Self
+from typing import Optional, Iterator, Union
 from decimal import Decimal
 from dataclasses import asdict
 from datetime import datetime, timedelta
 from time import sleep
+from threading import Event
 import os
 
 
@@ -31,25 +34,36 @@ class TClient(t_api.Client, local_api.Client):
             sandbox: bool = True,
             restart_sandbox_account: bool = False,
             trade: bool = False,
-            period_duration: int = 5,
+            period_duration: int = 60,
+            target: str = None,
+            order_threads: int = 8,
+            stream_order_states: bool = None,
             **kwargs
     ):
-        target = INVEST_GRPC_API
+        api_target = INVEST_GRPC_API
 
         if sandbox:
-            target = INVEST_GRPC_API_SANDBOX
+            api_target = INVEST_GRPC_API_SANDBOX
             token = os.environ.get('TOKEN_SANDBOX')
         elif trade:
             token = os.environ.get('TOKEN_TRADE')
         else:
             token = os.environ.get("TOKEN_NO_TRADE")
 
+        # another server, e.g. a local fake one, instead of the api
+        if target is None:
+            target = api_target
+
         super().__init__(token=token, target=target, **kwargs)
         self.period = TPeriod()
-        self._period_duration = period_duration
+        # seconds of a period of trading, the strategies are run once a period
+        self.period_duration = period_duration
         self.TickerWrapper = TTicker
         self.sandbox = sandbox
         self._restart_sandbox_account = restart_sandbox_account
+        self.order_threads = order_threads
+        # the states of the orders are streamed outside the sandbox by default
+        self.stream_order_states = not sandbox if stream_order_states is None else stream_order_states
 
     def __enter__(self) -> Self:
         channel = self._channel.__enter__()
@@ -235,6 +249,139 @@ class TServices(t_services.Services, local_api.Services):
 
         return pd.DataFrame(candle_dict)
 
+    def _candles_window(
+            self,
+            uid: str,
+            from_: datetime,
+            to: datetime
+    ) -> pd.DataFrame:
+        candles = self.market_data.get_candles(
+            instrument_id=uid,
+            from_=from_,
+            to=to,
+            interval=CandleInterval.CANDLE_INTERVAL_1_MIN
+        ).candles
+
+        return pd.DataFrame({
+            'open': [quotation_to_float(candle.open) for candle in candles],
+            'high': [quotation_to_float(candle.high) for candle in candles],
+            'low': [quotation_to_float(candle.low) for candle in candles],
+            'close': [quotation_to_float(candle.close) for candle in candles],
+            'volume': [candle.volume for candle in candles],
+            'time': [candle.time for candle in candles]
+        })
+
+    # the metadata of a RequestError carries the limit as "<requests>, <requests>;w=<seconds>"
+    @staticmethod
+    def rate_limit(error: Exception) -> Optional[local_api.RateLimit]:
+        if not isinstance(error, RequestError) or len(error.args) < 3 or error.args[2] is None:
+            return None
+
+        metadata = error.args[2]
+
+        if metadata.ratelimit_reset is None:
+            return None
+
+        try:
+            limit = int(str(metadata.ratelimit_limit).split(',')[0])
+        except ValueError:
+            limit = None
+
+        return local_api.RateLimit(
+            limit=limit,
+            remaining=metadata.ratelimit_remaining,
+            reset=metadata.ratelimit_reset
+        )
+
+    # completed candles and the top of book, the stream is subscribed to both when the method is called
+    def market_data_events(
+            self,
+            uids: list[str],
+            stop: Event
+    ) -> Iterator[Union[local_api.Candle, local_api.GetOrderBookResponse]]:
+        def requests():
+            yield MarketDataRequest(subscribe_candles_request=SubscribeCandlesRequest(
+                subscription_action=SubscriptionAction.SUBSCRIPTION_ACTION_SUBSCRIBE,
+                instruments=[CandleInstrument(
+                    instrument_id=uid,
+                    interval=SubscriptionInterval.SUBSCRIPTION_INTERVAL_ONE_MINUTE
+                ) for uid in uids],
+                waiting_close=True
+            ))
+            yield MarketDataRequest(subscribe_order_book_request=SubscribeOrderBookRequest(
+                subscription_action=SubscriptionAction.SUBSCRIPTION_ACTION_SUBSCRIBE,
+                instruments=[OrderBookInstrument(instrument_id=uid, depth=1) for uid in uids]
+            ))
+
+            # the stream is open as long as the requests are
+            stop.wait()
+
+        responses = self.market_data_stream.market_data_stream(requests())
+
+        def events():
+            for response in responses:
+                if stop.is_set():
+                    return
+
+                if response.candle is not None:
+                    candle = response.candle
+
+                    yield local_api.Candle(
+                        instrument_uid=candle.instrument_uid,
+                        time=candle.time,
+                        open=quotation_to_float(candle.open),
+                        high=quotation_to_float(candle.high),
+                        low=quotation_to_float(candle.low),
+                        close=quotation_to_float(candle.close),
+                        volume=candle.volume
+                    )
+                elif response.orderbook is not None and response.orderbook.is_consistent:
+                    order_book = response.orderbook
+
+                    yield local_api.GetOrderBookResponse(
+                        depth=order_book.depth,
+                        bids=[TOrder(order) for order in order_book.bids],
+                        asks=[TOrder(order) for order in order_book.asks],
+                        instrument_uid=order_book.instrument_uid
+                    )
+
+        return events()
+
+    def order_state_events(
+            self,
+            account_id: str,
+            stop: Event
+    ) -> Iterator[Optional[local_api.OrderState]]:
+        responses = self.orders_stream.order_state_stream(accounts=[account_id])
+
+        def events():
+            for response in responses:
+                if stop.is_set():
+                    return
+
+                # a ping or the confirmation of the subscription
+                if response.order_state is None:
+                    yield None
+
+                    continue
+
+                order_state = response.order_state
+
+                yield local_api.OrderState(
+                    execution_report_status=order_state.execution_report_status,
+                    order_id=order_state.order_id,
+                    executed_order_price=quotation_to_decimal(order_state.executed_order_price)
+                    if order_state.executed_order_price is not None else None,
+                    total_order_amount=quotation_to_decimal(order_state.amount)
+                    if order_state.amount is not None else None,
+                    # the states of the stream have no commission, it comes with the requested state of the order
+                    executed_commission=None,
+                    lots_executed=order_state.lots_executed,
+                    direction=order_state.direction
+                )
+
+        return events()
+
 
 class TOrder(t_api.Order, local_api.Order):
     def __init__(self, order: t_api.Order):
@@ -1,10 +1,12 @@
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
-from api.tinvest.utils import infer_start_and_end_date
-from api.tinvest.constants import working_hours, break_in_working_hours, working_weekends, session_type
 from api.tinvest.datatypes import SessionAuction, InstrumentType
+from api.broker_list import t_invest
 from engine.schemas.enums import SessionPeriod
 from engine.schemas.datatypes import Period
+from engine.schemas.calendar import TradingCalendar
+
+trading_calendar = TradingCalendar.of(t_invest)
 
 
 @dataclass
@@ -27,36 +29,20 @@ class TPeriod(Period):
         self.update_market_schedule_info()
 
     def update_market_schedule_info(self):
-        if self.time_period.weekday() >= 5 and self.time_period.date() not in working_weekends:
-            self.instrument_session = {type_instrument: SessionPeriod.CLOSED for type_instrument in InstrumentType}
-            self.instrument_auction = {type_instrument: SessionAuction.CLOSED for type_instrument in InstrumentType}
-        else:
-            for type_instrument in InstrumentType:
-                self.exchange_closed, self.on_break = False, False
-
-                # checking whether the exchange is open
-                if not working_hours.is_datetime_in_relevant_interval(type_instrument, self.time_period):
-                    self.exchange_closed = True
-
-                # checking whether there is a break in trading the instrument
-                if break_in_working_hours.is_datetime_in_relevant_interval(type_instrument, self.time_period):
-                    self.on_break = True
-
-                if self.on_break or self.exchange_closed:
-                    self.instrument_session[type_instrument] = SessionPeriod.CLOSED
-                    self.instrument_auction[type_instrument] = SessionAuction.CLOSED
-                else:
-                    self.instrument_session[type_instrument], session_metainfo = (
-                        session_type.items_of_relevant_interval(type_instrument, self.time_period))
+        for type_instrument in InstrumentType:
+            schedule = trading_calendar.schedule_at(type_instrument, self.time_period)
 
-                    session_start_date, session_end_date = infer_start_and_end_date(self.time_period, session_metainfo)
+            self.exchange_closed, self.on_break = schedule.exchange_closed, schedule.on_break
+            self.instrument_session[type_instrument] = schedule.session
 
-                    if session_metainfo['opening'] and session_start_date == self.time_period:
-                        self.instrument_auction[type_instrument] = SessionAuction.OPENING
-                    elif session_metainfo['closing'] and session_end_date == self.time_period:
-                        self.instrument_auction[type_instrument] = SessionAuction.CLOSING
-                    else:
-                        self.instrument_auction[type_instrument] = SessionAuction.TWOSIDED
+            if schedule.session == SessionPeriod.CLOSED:
+                self.instrument_auction[type_instrument] = SessionAuction.CLOSED
+            elif schedule.opening and schedule.session_start == self.time_period:
+                self.instrument_auction[type_instrument] = SessionAuction.OPENING
+            elif schedule.closing and schedule.session_end == self.time_period:
+                self.instrument_auction[type_instrument] = SessionAuction.CLOSING
+            else:
+                self.instrument_auction[type_instrument] = SessionAuction.TWOSIDED
 
     def next_period(self, update_with_cur_time):
         if not update_with_cur_time:
@@ -65,3 +51,13 @@ class TPeriod(Period):
             self.time_period = datetime.now(tz=timezone.utc)
 
         self.update_market_schedule_info()
+
+    # jump to the next minute in which one of the types of instruments is in a session
+    def skip_closed_periods(self, types_instruments: list[InstrumentType]):
+        time_period = trading_calendar.next_session_minute(types_instruments, self.time_period)
+
+        if time_period is None:
+            raise StopIteration
+
+        self.time_period = time_period
+        self.update_market_schedule_info()
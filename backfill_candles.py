@@ -0,0 +1,27 @@
+from api.tinvest.set_token import set_token
+from api.tinvest.tclient import TClient
+from api.tinvest.tticker import TTicker
+from api.tinvest.utils import get_info_of_instruments
+from api.broker_list import t_invest
+from api.tinvest.datatypes import InstrumentType
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.candles.backfill import CandlesBackfill
+
+import sys
+
+LocalCandlesUploader.broker = t_invest
+
+# usage: python backfill_candles.py n_threads [tickers...], all the shares by default
+if __name__ == '__main__':
+    set_token()
+
+    n_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    tickers = sys.argv[2:] if len(sys.argv) > 2 \
+        else get_info_of_instruments(InstrumentType.STOCK, broker=t_invest)['ticker'].tolist()
+
+    report = CandlesBackfill(
+        client_factory=lambda: TClient(sandbox=False, trade=False),
+        n_threads=n_threads
+    ).run([TTicker(ticker) for ticker in tickers])
+
+    print(report.to_string(index=False))
@@ -2,7 +2,7 @@ from datetime import datetime, timezone
 
 from engine.models.hmm import HMMLearn
 from engine.transformers.returns import Returns
-from engine.models.target_processor import StandardScaler
+from engine.transformers.preprocessing import StandardScaler
 from engine.transformers.candles_processing import RemoveZeroActivityCandles
 from api.broker_list import t_invest
 from engine.candles.candles_uploader import LocalCandlesUploader
@@ -39,6 +39,7 @@ if __name__ == '__main__':
         'market_order_price': 'open',
         'buy_price_end_period': 'low',
         'sell_price_end_period': 'high',
+        'fast_forward': True,
     }
 
     strategies = [
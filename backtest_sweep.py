@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+
+from engine.models.hmm import HMMLearn
+from engine.transformers.returns import Returns
+from engine.transformers.preprocessing import StandardScaler
+from engine.transformers.candles_processing import RemoveZeroActivityCandles
+from engine.strategies.state_based import AvgState
+from engine.sweep import run_sweep
+
+import json
+import sys
+
+candle_to_price = 'two_way'
+
+
+def build_strategies(params: dict):
+    pipe = [
+        RemoveZeroActivityCandles(),
+        Returns(keep_overnight=False, day_number=False, candle_to_price=candle_to_price, keep_vol=False),
+        StandardScaler(with_mean=False),
+        HMMLearn(
+            n_components=params['n_components'],
+            covariance_type='full',
+        ),
+    ]
+
+    return [
+        AvgState(
+            pipeline=pipe,
+            cash_share=0.9,
+            num_of_averaging=params['num_of_averaging'],
+            t_threshold=params['t_threshold'],
+            return_threshold_up=params['return_threshold_up'],
+            return_threshold_down=params['return_threshold_down'],
+            model_metadata={'returns_type': candle_to_price},
+            states_from_train_data=False
+        )
+    ]
+
+
+# usage: python backtest_sweep.py [grid.json] [n_jobs]
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as grid_file:
+            grid = json.load(grid_file)
+    else:
+        grid = {
+            'n_components': [10],
+            'num_of_averaging': [1, 2],
+            't_threshold': [1, 1.1, 1.5],
+            'return_threshold_up': [10],
+            'return_threshold_down': [10],
+        }
+
+    n_jobs = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    mock_client_config = {
+        'period': datetime(year=2024, month=12, day=2, hour=6, minute=59).replace(tzinfo=timezone.utc),
+        'bid_orderbook_price': 'open',
+        'ask_orderbook_price': 'open',
+        'market_order_price': 'open',
+        'buy_price_end_period': 'low',
+        'sell_price_end_period': 'high',
+        'fast_forward': True,
+    }
+
+    results = run_sweep(
+        build_strategies=build_strategies,
+        grid=grid,
+        mock_client_config=mock_client_config,
+        tickers_collection=['SBER'],
+        n_jobs=n_jobs
+    )
+
+    print(results.sort_values('pnl', ascending=False).to_string(index=False))
@@ -0,0 +1,57 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from api.broker_list import t_invest
+from api.tinvest.datatypes import InstrumentType
+from engine.schemas.datatypes import Ticker
+from engine.schemas.calendar import TradingCalendar
+
+
+class StockTicker(Ticker):
+    type_instrument = InstrumentType.STOCK
+
+
+def make_ticker(n: int = 0) -> Ticker:
+    return StockTicker(uid=f'uid{n}', ticker_sign=f'TICK{n}', min_price_increment=0.01, lot=1)
+
+
+# raw 1-minute candles of a stock on the trading minutes of the days, a share of the minutes has trades
+def make_candles(days: list[date], share: float = 0.5, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+
+    minutes = pd.date_range(days[0], days[-1] + timedelta(days=1), freq='min', tz='UTC', inclusive='left')
+    minutes = minutes[TradingCalendar.of(t_invest).is_trading_minute(InstrumentType.STOCK, minutes)]
+    minutes = minutes[rng.random(len(minutes)) < share]
+
+    close = (100 + np.cumsum(rng.normal(scale=0.1, size=len(minutes)))).round(2)
+
+    return pd.DataFrame({
+        'open': (close + rng.normal(scale=0.05, size=len(minutes))).round(2),
+        'high': close + 0.2,
+        'low': close - 0.2,
+        'close': close,
+        'volume': rng.integers(1, 100, len(minutes)),
+        'time': minutes
+    })
+
+
+# consecutive chunks of a table: of one row each, or cut at random rows, empty chunks included
+def split(X: pd.DataFrame, n_cuts: int = None, seed: int = 0) -> list[pd.DataFrame]:
+    if n_cuts is None:
+        bounds = np.arange(len(X) + 1)
+    else:
+        cuts = np.sort(np.random.default_rng(seed).integers(0, len(X) + 1, n_cuts))
+        bounds = np.concatenate([[0], cuts, [len(X)]])
+
+    return [X.iloc[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+@pytest.fixture
+def ticker() -> Ticker:
+    return make_ticker()
+
+
+@pytest.fixture(scope='session')
+def candles() -> pd.DataFrame:
+    return make_candles([date(2024, 12, 2) + timedelta(days=i) for i in range(3)])
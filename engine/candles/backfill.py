@@ -0,0 +1,281 @@
+import pandas as pd
+from engine.schemas.datatypes import Ticker, Broker
+from engine.schemas.client import Client, Services, RateLimit
+from engine.schemas.constants import log_path
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Callable
+from time import monotonic, sleep
+import json
+import os
+
+
+# requests of all the threads take tokens from one bucket refilled at the rate of the limit, holding at most
+# a second of requests; a rate limit reported by the server sets the rate and empties the bucket until its reset
+class TokenBucket:
+    def __init__(
+            self,
+            requests_per_minute: float = 300,
+            clock: Callable[[], float] = monotonic,
+            sleep_for: Callable[[float], None] = sleep
+    ):
+        self._clock = clock
+        self._sleep = sleep_for
+        self._lock = Lock()
+        self.rate = requests_per_minute / 60
+        self.capacity = max(self.rate, 1.)
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+
+                self._tokens = min(self.capacity, self._tokens + max(now - self._updated, 0) * self.rate)
+                self._updated = max(now, self._updated)
+
+                if now >= self._updated and self._tokens >= 1:
+                    self._tokens -= 1
+
+                    return
+
+                wait_time = max(self._updated - now, (1 - self._tokens) / self.rate)
+
+            self._sleep(wait_time)
+
+    def limit(self, rate_limit: RateLimit):
+        with self._lock:
+            if rate_limit.limit is not None and rate_limit.limit > 0:
+                self.rate = rate_limit.limit / 60
+                self.capacity = max(self.rate, 1.)
+
+            # no tokens are added before the reset
+            self._tokens = 0
+            self._updated = max(self._updated, self._clock() + rate_limit.reset)
+
+
+@dataclass
+class TickerBackfill:
+    ticker: Ticker
+    windows: list[tuple[datetime, datetime]]
+    # the state of CandlesRefinerTransformer after the stored candles
+    state: dict = None
+    # candles of the requested windows not stored yet
+    candles: dict[int, pd.DataFrame] = field(default_factory=dict)
+    n_stored_windows: int = 0
+    n_stored_candles: int = 0
+
+
+# downloads the candles of many tickers from their last stored candle, or from their first candle, to the end date:
+# the period of every ticker is split into windows of one request, the windows of all the tickers are requested
+# in turn by a pool of threads sharing a token bucket, and the windows of a ticker are refined and stored in order,
+# flush_windows at a time; the checkpoint keeps the end of the stored windows and the last refined candle
+# of every ticker, so that an interrupted backfill resumes from them; client_factory makes the client to request,
+# which may be connected to a local fake server
+class CandlesBackfill:
+    def __init__(
+            self,
+            client_factory: Callable[[], Client],
+            n_threads: int = 8,
+            window: timedelta = timedelta(days=1),
+            flush_windows: int = 30,
+            requests_per_minute: float = 300,
+            retries: int = 3,
+            checkpoint_path: str = None,
+            bucket: TokenBucket = None,
+            sleep_for: Callable[[float], None] = sleep
+    ):
+        self.client_factory = client_factory
+        self.n_threads = n_threads
+        # the api returns the 1-minute candles of at most a day per request
+        self.window = window
+        self.flush_windows = flush_windows
+        self.retries = retries
+        self.checkpoint_path = checkpoint_path
+        self.sleep_for = sleep_for
+        self.bucket = TokenBucket(requests_per_minute, sleep_for=sleep_for) if bucket is None else bucket
+
+    def _checkpoint_file(self, broker: Broker) -> str:
+        if self.checkpoint_path is not None:
+            return self.checkpoint_path
+
+        return log_path + f'backfill_{broker.broker_name}.json'
+
+    def _read_checkpoint(self, broker: Broker) -> dict:
+        if not os.path.isfile(self._checkpoint_file(broker)):
+            return {}
+
+        with open(self._checkpoint_file(broker)) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    # written aside and renamed, an interruption leaves the previous checkpoint
+    def _write_checkpoint(self, broker: Broker, checkpoint: dict):
+        path = self._checkpoint_file(broker)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        with open(path + '.tmp', 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _state_to_json(state: dict, stored_until: datetime) -> dict:
+        candle = state['candle'].iloc[0]
+
+        return {
+            'stored_until': stored_until.isoformat(),
+            'candle': {column: (value.isoformat() if column == 'time' else float(value))
+                       for column, value in candle.items()},
+            'day_number': int(state['day_number'])
+        }
+
+    @staticmethod
+    def _state_from_json(checkpoint: dict) -> tuple[dict, datetime]:
+        candle = pd.DataFrame({column: [value] for column, value in checkpoint['candle'].items()})
+        candle['time'] = pd.to_datetime(candle['time'], utc=True)
+
+        return {'candle': candle, 'day_number': checkpoint['day_number']}, \
+            datetime.fromisoformat(checkpoint['stored_until'])
+
+    def _plan(self, ticker: Ticker, end_date: datetime, broker: Broker, checkpoint: dict) -> TickerBackfill:
+        state, start_date = None, None
+
+        if ticker.ticker_sign in checkpoint.keys():
+            state, start_date = self._state_from_json(checkpoint[ticker.ticker_sign])
+
+        # the stored candles are continued when they go past the checkpoint, e.g. a run was interrupted
+        # between storing candles and writing the checkpoint
+        if LocalCandlesUploader.storage.exists(broker.broker_name, ticker.ticker_sign):
+            last_candle = LocalCandlesUploader.storage.read_last(broker.broker_name, ticker.ticker_sign)
+
+            if state is None or last_candle.index[0] > state['candle']['time'].iloc[0]:
+                state = {
+                    'candle': last_candle.drop(columns='day_number').reset_index(),
+                    'day_number': last_candle['day_number'].iloc[0]
+                }
+                start_date = last_candle.index[0].to_pydatetime() + timedelta(minutes=1)
+
+        if state is None:
+            start_date = LocalCandlesUploader.get_new_candle_datetime(ticker)
+
+        windows = []
+
+        while start_date < end_date:
+            windows.append((start_date, min(start_date + self.window, end_date)))
+            start_date = windows[-1][1]
+
+        return TickerBackfill(ticker=ticker, windows=windows, state=state)
+
+    # rate-limit errors are waited out, other errors are retried with a backoff
+    def _request(self, services: Services, uid: str, from_: datetime, to: datetime) -> pd.DataFrame:
+        n_errors = 0
+
+        while True:
+            self.bucket.acquire()
+
+            try:
+                return services._candles_window(uid, from_, to)
+            except Exception as error:
+                rate_limit = services.rate_limit(error)
+
+                if rate_limit is not None:
+                    self.bucket.limit(rate_limit)
+                elif n_errors < self.retries:
+                    n_errors += 1
+                    self.sleep_for(2 ** n_errors)
+                else:
+                    raise
+
+    # the windows requested in a row after the stored ones are refined and appended to the storage
+    def _flush(self, job: TickerBackfill, broker: Broker, checkpoint: dict, force: bool = False):
+        n_ready = 0
+
+        while job.n_stored_windows + n_ready in job.candles.keys():
+            n_ready += 1
+
+        if n_ready == 0 or (n_ready < self.flush_windows and not force):
+            return
+
+        windows = range(job.n_stored_windows, job.n_stored_windows + n_ready)
+        stored_until = job.windows[windows[-1]][1]
+
+        candles = pd.concat([job.candles.pop(k) for k in windows])
+
+        if len(candles) > 0:
+            candles = candles[~candles['time'].duplicated()]
+
+        if job.state is not None and len(candles) > 0:
+            candles = candles[candles['time'] > job.state['candle']['time'].iloc[0]]
+
+        # the request date right after the last candle: minutes without trades are not filled past it,
+        # they are filled once the next candle arrives
+        if len(candles) > 0:
+            refiner = CandlesRefinerTransformer(broker=broker, ticker=job.ticker,
+                                                candles_request_date=candles['time'].iloc[-1] + timedelta(minutes=1))
+            refined, job.state = refiner.fit(candles).partial_transform(candles, job.state)
+
+            if len(refined) > 0:
+                LocalCandlesUploader.storage.append(refined, broker.broker_name, job.ticker.ticker_sign)
+                job.n_stored_candles += len(refined)
+
+        job.n_stored_windows += n_ready
+
+        if job.state is not None:
+            checkpoint[job.ticker.ticker_sign] = self._state_to_json(job.state, stored_until)
+            self._write_checkpoint(broker, checkpoint)
+
+    def run(self, tickers: list[Ticker], end_date: datetime = None) -> pd.DataFrame:
+        if end_date is None:
+            end_date = datetime.now(tz=timezone.utc).replace(second=0, microsecond=0)
+
+        with self.client_factory() as client, ThreadPoolExecutor(self.n_threads) as threads:
+            broker = client.broker
+            checkpoint = self._read_checkpoint(broker)
+            jobs = [self._plan(ticker, end_date, broker, checkpoint) for ticker in tickers]
+
+            # the k-th windows of all the tickers before the (k + 1)-th ones
+            queue = deque([
+                (job, k) for k in range(max([len(job.windows) for job in jobs], default=0))
+                for job in jobs if k < len(job.windows)
+            ])
+            running = {}
+
+            def submit():
+                while len(queue) > 0 and len(running) < 2 * self.n_threads:
+                    job, k = queue.popleft()
+                    running[threads.submit(self._request, client.services, job.ticker.uid, *job.windows[k])] = (job, k)
+
+            try:
+                submit()
+
+                while running:
+                    done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        job, k = running.pop(future)
+                        job.candles[k] = future.result()
+
+                        self._flush(job, broker, checkpoint)
+
+                    submit()
+
+                for job in jobs:
+                    self._flush(job, broker, checkpoint, force=True)
+            finally:
+                queue.clear()
+
+                for future in running.keys():
+                    future.cancel()
+
+        return pd.DataFrame([{
+            'ticker': job.ticker.ticker_sign,
+            'windows': len(job.windows),
+            'stored_windows': job.n_stored_windows,
+            'candles': job.n_stored_candles
+        } for job in jobs])
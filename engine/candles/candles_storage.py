@@ -0,0 +1,180 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from engine.schemas.constants import candle_path
+from engine.schemas.datatypes import to_epoch_minutes, from_epoch_minutes
+from abc import ABC, abstractmethod
+import os
+
+
+class CandlesStorage(ABC):
+    @abstractmethod
+    def exists(self, broker_name: str, ticker_sign: str) -> bool:
+        pass
+
+    @abstractmethod
+    def read(self, broker_name: str, ticker_sign: str) -> pd.DataFrame:
+        pass
+
+    @abstractmethod
+    def append(self, candles: pd.DataFrame, broker_name: str, ticker_sign: str):
+        pass
+
+    # the last stored candle
+    def read_last(self, broker_name: str, ticker_sign: str) -> pd.DataFrame:
+        return self.read(broker_name, ticker_sign).iloc[-1:]
+
+    @staticmethod
+    def ticker_path(broker_name: str, ticker_sign: str) -> str:
+        return candle_path + f'{broker_name}/{ticker_sign}/'
+
+
+class CSVCandlesStorage(CandlesStorage):
+    def _file_path(self, broker_name: str, ticker_sign: str) -> str:
+        return self.ticker_path(broker_name, ticker_sign) + f'{ticker_sign}.csv'
+
+    def exists(self, broker_name: str, ticker_sign: str) -> bool:
+        return os.path.isfile(self._file_path(broker_name, ticker_sign))
+
+    def read(self, broker_name: str, ticker_sign: str) -> pd.DataFrame:
+        candles_df = pd.read_csv(self._file_path(broker_name, ticker_sign))
+
+        candles_df['time'] = pd.to_datetime(candles_df['time'], format='%Y-%m-%d %H:%M:%S%z')
+
+        return candles_df.set_index('time')
+
+    def append(self, candles: pd.DataFrame, broker_name: str, ticker_sign: str):
+        if not os.path.isdir(self.ticker_path(broker_name, ticker_sign)):
+            os.makedirs(self.ticker_path(broker_name, ticker_sign))
+
+        candles.to_csv(
+            self._file_path(broker_name, ticker_sign),
+            mode='a',
+            header=not self.exists(broker_name, ticker_sign)
+        )
+
+
+# candles are partitioned by ticker and month: <ticker>/month=YYYY-MM/<first minute>-<last minute>.parquet,
+# where time is stored as int64 minutes since the epoch; every append writes new partition files,
+# so the history already on disk is never rewritten
+class ParquetCandlesStorage(CandlesStorage):
+    column_types = {
+        'open': np.float64,
+        'close': np.float64,
+        'high': np.float64,
+        'low': np.float64,
+        'volume': np.int64,
+        'day_number': np.int64
+    }
+
+    def __init__(self, compression: str = 'zstd'):
+        self.compression = compression
+
+    def _partitions(self, broker_name: str, ticker_sign: str) -> list[str]:
+        ticker_path = self.ticker_path(broker_name, ticker_sign)
+        partitions = []
+
+        if not os.path.isdir(ticker_path):
+            return partitions
+
+        for month_dir in sorted(os.listdir(ticker_path)):
+            if not month_dir.startswith('month='):
+                continue
+
+            for file_name in sorted(os.listdir(ticker_path + month_dir)):
+                if file_name.endswith('.parquet'):
+                    partitions.append(ticker_path + f'{month_dir}/{file_name}')
+
+        return partitions
+
+    def exists(self, broker_name: str, ticker_sign: str) -> bool:
+        return len(self._partitions(broker_name, ticker_sign)) > 0
+
+    def read(self, broker_name: str, ticker_sign: str) -> pd.DataFrame:
+        partitions = self._partitions(broker_name, ticker_sign)
+
+        if len(partitions) == 0:
+            raise FileNotFoundError(f'No candles of {ticker_sign} are stored for {broker_name}.')
+
+        return self._to_frame(pa.concat_tables([pq.read_table(partition) for partition in partitions]))
+
+    # the partitions are named and listed in the order of time, the last candle is in the last one
+    def read_last(self, broker_name: str, ticker_sign: str) -> pd.DataFrame:
+        partitions = self._partitions(broker_name, ticker_sign)
+
+        if len(partitions) == 0:
+            raise FileNotFoundError(f'No candles of {ticker_sign} are stored for {broker_name}.')
+
+        table = pq.read_table(partitions[-1])
+
+        return self._to_frame(table.slice(table.num_rows - 1))
+
+    @staticmethod
+    def _to_frame(table: pa.Table) -> pd.DataFrame:
+        candles_df = table.to_pandas()
+
+        candles_df['time'] = from_epoch_minutes(candles_df['time'].to_numpy())
+
+        return candles_df.set_index('time')
+
+    def append(self, candles: pd.DataFrame, broker_name: str, ticker_sign: str):
+        if len(candles) == 0:
+            return
+
+        ticker_path = self.ticker_path(broker_name, ticker_sign)
+
+        minutes = to_epoch_minutes(candles.index)
+        months = minutes.astype('datetime64[m]').astype('datetime64[M]')
+
+        # the partitions share one schema whatever the order of the columns of the candles
+        columns = [column for column in self.column_types.keys() if column in candles.columns]
+        columns += [column for column in candles.columns if column not in self.column_types.keys()]
+
+        candles = candles[columns].reset_index(drop=True).astype(
+            {column: dtype for column, dtype in self.column_types.items() if column in candles.columns}
+        )
+
+        table = pa.Table.from_pandas(candles, preserve_index=False)
+        table = table.add_column(0, 'time', pa.array(minutes, type=pa.int64()))
+
+        month_starts = np.flatnonzero(months[1:] != months[:-1]) + 1
+
+        for start, stop in zip([0, *month_starts], [*month_starts, len(minutes)]):
+            month_path = ticker_path + f'month={months[start]}/'
+
+            if not os.path.isdir(month_path):
+                os.makedirs(month_path)
+
+            pq.write_table(
+                table.slice(start, stop - start),
+                month_path + f'{minutes[start]:010d}-{minutes[stop - 1]:010d}.parquet',
+                compression=self.compression
+            )
+
+
+# one-shot conversion of the per-ticker csv files into another storage
+def migrate_candles(
+        broker_name: str,
+        target: CandlesStorage,
+        source: CandlesStorage = None,
+        tickers: list[str] = None
+) -> list[str]:
+    if source is None:
+        source = CSVCandlesStorage()
+
+    broker_path = candle_path + f'{broker_name}/'
+
+    if tickers is None:
+        tickers = sorted(os.listdir(broker_path)) if os.path.isdir(broker_path) else []
+
+    migrated_tickers = []
+
+    for ticker_sign in tickers:
+        if not source.exists(broker_name, ticker_sign) or target.exists(broker_name, ticker_sign):
+            continue
+
+        target.append(source.read(broker_name, ticker_sign), broker_name, ticker_sign)
+        migrated_tickers.append(ticker_sign)
+
+    return migrated_tickers
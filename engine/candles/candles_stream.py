@@ -0,0 +1,255 @@
+import pandas as pd
+from engine.schemas.datatypes import Ticker
+from engine.schemas.client import Services, Candle, GetOrderBookResponse, Order
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.metrics import Metrics
+from datetime import datetime, timedelta, timezone
+from threading import Thread, Event, Lock
+from typing import Callable, Iterator, Optional, Union
+
+# the columns of the raw candles, as requested by Services._candles_writer
+candle_columns = ['open', 'high', 'low', 'close', 'volume', 'time']
+
+
+# completed 1-minute candles and the top of book of the tickers from a single subscription to the market data stream:
+# a thread reads the stream and keeps the candles after the last saved ones, get_candles refines and saves them
+# as a request of the candles does; a broken stream is reopened after a doubling delay and the candles missed
+# while it was down are requested from the last received one to the current minute, a break is counted
+# in the metrics, kept as last_error and passed to on_error with the delay before reconnecting; source opens
+# the stream, backfill requests the candles of a period and clock gives the current time, by default those
+# of the services, a CandlesReplayer provides all three to run without the api
+class CandlesStream:
+    def __init__(
+            self,
+            services: Services,
+            tickers: list[Ticker],
+            source: Callable[[list[str], Event], Iterator[Union[Candle, GetOrderBookResponse]]] = None,
+            backfill: Callable[..., pd.DataFrame] = None,
+            clock: Callable[[], datetime] = None,
+            reconnect_delay: float = 1.,
+            max_reconnect_delay: float = 60.,
+            on_error: Callable[[Exception, float], None] = None
+    ):
+        self.services = services
+        self.tickers = {ticker.uid: ticker for ticker in tickers}
+        self.source = services.market_data_events if source is None else source
+        self.backfill = services._candles_writer if backfill is None else backfill
+        self.clock = (lambda: datetime.now(tz=timezone.utc)) if clock is None else clock
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.on_error = on_error
+
+        self.n_reconnects = 0
+        self.last_error: Exception = None
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Thread = None
+        # the time of the next candle expected and the received candles not saved yet of every instrument
+        self._next_candle_time: dict[str, datetime] = {}
+        self._candles: dict[str, list[tuple]] = {uid: [] for uid in self.tickers.keys()}
+        self._order_books: dict[str, GetOrderBookResponse] = {}
+
+    def start(self) -> 'CandlesStream':
+        for uid, ticker in self.tickers.items():
+            # the stream continues the stored candles of the ticker
+            if (ticker not in LocalCandlesUploader.candles_start_dates.keys()
+                    and LocalCandlesUploader.storage.exists(LocalCandlesUploader.broker.broker_name,
+                                                            ticker.ticker_sign)):
+                LocalCandlesUploader.upload_candles(ticker)
+
+            self._next_candle_time[uid] = LocalCandlesUploader.get_new_candle_datetime(ticker)
+
+        self._stop.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        self.services.candles_stream = self
+
+        return self
+
+    def stop(self, timeout: float = 5.):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        if self.services.candles_stream is self:
+            self.services.candles_stream = None
+
+    def _run(self):
+        uids = list(self.tickers.keys())
+        delay = self.reconnect_delay
+
+        while not self._stop.is_set():
+            try:
+                events = self.source(uids, self._stop)
+                self._backfill()
+
+                for event in events:
+                    self._receive(event)
+                    delay = self.reconnect_delay
+
+                if not self._stop.is_set():
+                    raise ConnectionError('The market data stream is closed.')
+            except Exception as error:
+                if self._stop.is_set():
+                    break
+
+                self.last_error = error
+                Metrics.count('market_data_stream_breaks')
+
+                if self.on_error is not None:
+                    self.on_error(error, delay)
+
+                # the top of book is requested while the stream is down
+                with self._lock:
+                    self._order_books.clear()
+
+                self.n_reconnects += 1
+                self._stop.wait(delay)
+                delay = min(2 * delay, self.max_reconnect_delay)
+
+    # candles from the last received ones to the current minute, the stream is already open
+    def _backfill(self):
+        to = self.clock().replace(second=0, microsecond=0)
+
+        for uid in self.tickers.keys():
+            with self._lock:
+                from_ = self._next_candle_time[uid]
+
+            if from_ >= to:
+                continue
+
+            candles = self.backfill(uid, from_=from_, to=to)
+
+            if len(candles) > 0:
+                candles = candles[candles['time'] < to]
+                self._push(uid, candles[candle_columns].itertuples(index=False, name=None))
+
+    # candles of the instrument in the order of time, the ones before the expected candle are received already
+    def _push(self, uid: str, candles):
+        with self._lock:
+            for candle in candles:
+                if candle[-1] >= self._next_candle_time[uid]:
+                    self._candles[uid].append(candle)
+                    self._next_candle_time[uid] = candle[-1] + timedelta(minutes=1)
+
+    def _receive(self, event: Union[Candle, GetOrderBookResponse]):
+        if event.instrument_uid not in self.tickers.keys():
+            return
+
+        if isinstance(event, Candle):
+            self._push(event.instrument_uid,
+                       [(event.open, event.high, event.low, event.close, event.volume, event.time)])
+        elif isinstance(event, GetOrderBookResponse):
+            with self._lock:
+                self._order_books[event.instrument_uid] = event
+
+    def get_candles(self, ticker: Ticker) -> bool:
+        with self._lock:
+            candles, self._candles[ticker.uid] = self._candles[ticker.uid], []
+
+        if len(candles) == 0:
+            return False
+
+        new_candles = pd.DataFrame(candles, columns=candle_columns)
+
+        # minutes without trades before the last candle are filled, the ones after it wait for the next candle
+        return self.services._save_candles(
+            ticker,
+            new_candles,
+            candles_request_date=new_candles['time'].iloc[-1] + timedelta(minutes=1)
+        )
+
+    # the last top of book received, None before the first one or while the stream is down
+    def order_book(self, uid: str) -> Optional[GetOrderBookResponse]:
+        with self._lock:
+            return self._order_books.get(uid)
+
+
+# a local market data stream replaying candles of the instruments in the order of time, every candle is followed
+# by the top of book of its low and high; the replay clock is at the end of the last candle replayed, speed replays
+# that many minutes per second; the stream breaks every disconnect_after candles and the candles of the next
+# gap_minutes minutes are lost, candles_writer requests the candles up to the replay clock
+class CandlesReplayer:
+    def __init__(
+            self,
+            candles: dict[str, pd.DataFrame],
+            speed: float = None,
+            disconnect_after: int = None,
+            gap_minutes: int = 0
+    ):
+        self.candles = {
+            uid: (frame if 'time' in frame.columns else frame.reset_index())[candle_columns].reset_index(drop=True)
+            for uid, frame in candles.items()
+        }
+        self.speed = speed
+        self.disconnect_after = disconnect_after
+        self.gap_minutes = gap_minutes
+
+        events = pd.concat([frame.assign(instrument_uid=uid) for uid, frame in self.candles.items()])
+        events = events.sort_values('time', kind='stable')
+
+        self._events = list(events.itertuples(index=False))
+        self._position = 0
+        self._n_connections = 0
+        self._now = events['time'].iloc[0].floor('min') if len(events) > 0 else None
+
+    def now(self) -> datetime:
+        return self._now
+
+    def __call__(self, uids: list[str], stop: Event) -> Iterator[Union[Candle, GetOrderBookResponse]]:
+        if self._n_connections > 0:
+            self._now += timedelta(minutes=self.gap_minutes)
+
+            while self._position < len(self._events) and self._events[self._position].time < self._now:
+                self._position += 1
+
+        self._n_connections += 1
+
+        return self._replay(set(uids), stop)
+
+    def _replay(self, uids: set[str], stop: Event) -> Iterator[Union[Candle, GetOrderBookResponse]]:
+        n_candles = 0
+
+        while self._position < len(self._events) and not stop.is_set():
+            if self.disconnect_after is not None and n_candles == self.disconnect_after:
+                raise ConnectionError('The replayed stream is broken.')
+
+            event = self._events[self._position]
+
+            if self.speed is not None and event.time >= self._now:
+                stop.wait(1 / self.speed)
+
+            self._position += 1
+            self._now = max(self._now, event.time + timedelta(minutes=1))
+
+            if event.instrument_uid not in uids:
+                continue
+
+            n_candles += 1
+
+            yield Candle(
+                instrument_uid=event.instrument_uid,
+                time=event.time,
+                open=event.open,
+                high=event.high,
+                low=event.low,
+                close=event.close,
+                volume=event.volume
+            )
+            yield GetOrderBookResponse(
+                depth=1,
+                bids=[Order(price=event.low, quantity=1)],
+                asks=[Order(price=event.high, quantity=1)],
+                instrument_uid=event.instrument_uid
+            )
+
+        # a live stream stays open after the last candle
+        stop.wait()
+
+    def candles_writer(self, uid: str, from_: datetime, to: datetime = None) -> pd.DataFrame:
+        candles = self.candles[uid]
+        to = self._now if to is None else min(to, self._now)
+
+        return candles[(candles['time'] >= from_) & (candles['time'] < to)].reset_index(drop=True)
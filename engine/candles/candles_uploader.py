@@ -1,7 +1,8 @@
 import pandas as pd
-from engine.schemas.constants import candle_path, instrument_path
+from engine.schemas.constants import instrument_path
 from engine.schemas.datatypes import Ticker, Broker
-import os
+from engine.candles.candles_storage import CandlesStorage, ParquetCandlesStorage
+from engine.schemas.frame_buffer import FrameBuffer
 import json
 from datetime import timedelta, datetime
 
@@ -10,8 +11,10 @@ class LocalCandlesUploader:
     candles_in_memory: dict[Ticker, pd.DataFrame] = {}
 
     broker: Broker
+    storage: CandlesStorage = ParquetCandlesStorage()
 
-    new_candles: dict[Ticker, list[pd.DataFrame]] = {}
+    # the candles in memory followed by the new candles, cache_new_candles compacts the new candles into the history
+    new_candles: dict[Ticker, FrameBuffer] = {}
     candles_start_dates: dict[Ticker, datetime] = {}
     last_candles: dict[Ticker, pd.DataFrame] = {}
 
@@ -20,13 +23,11 @@ class LocalCandlesUploader:
         if ticker in LocalCandlesUploader.candles_in_memory.keys():
             return LocalCandlesUploader.candles_in_memory[ticker]
         else:
-            candles_df = pd.read_csv(
-                candle_path + f'{LocalCandlesUploader.broker.broker_name}/{ticker.ticker_sign}/{ticker.ticker_sign}.csv'
+            candles_df = LocalCandlesUploader.storage.read(
+                LocalCandlesUploader.broker.broker_name,
+                ticker.ticker_sign
             )
 
-            candles_df['time'] = pd.to_datetime(candles_df['time'], format='%Y-%m-%d %H:%M:%S%z')
-            candles_df = candles_df.set_index('time')
-
             LocalCandlesUploader.candles_in_memory[ticker] = candles_df
 
             last_candle = candles_df.iloc[-1:].copy()
@@ -62,39 +63,37 @@ class LocalCandlesUploader:
 
     @staticmethod
     def save_new_candles(new_candles: pd.DataFrame, ticker: Ticker):
-        if ticker in LocalCandlesUploader.new_candles.keys():
-            LocalCandlesUploader.new_candles[ticker].append(new_candles)
-        else:
-            LocalCandlesUploader.new_candles[ticker] = [new_candles]
+        if ticker not in LocalCandlesUploader.new_candles.keys():
+            LocalCandlesUploader.new_candles[ticker] = FrameBuffer(
+                LocalCandlesUploader.candles_in_memory.get(ticker)
+            )
 
+        LocalCandlesUploader.new_candles[ticker].append(new_candles)
+
+        # the next candles are requested and refined after the saved ones
+        if len(new_candles) > 0:
+            LocalCandlesUploader.last_candles[ticker] = new_candles.iloc[-1:]
+            LocalCandlesUploader.candles_start_dates[ticker] = new_candles.index[-1] + timedelta(minutes=1)
+
+    # new candles of the ticker from the row start of its buffer on
     @staticmethod
-    def cache_new_candles():
-        for ticker in LocalCandlesUploader.new_candles.keys():
-            ticker_path = candle_path + f"{LocalCandlesUploader.broker.broker_name}/{ticker.ticker_sign}/"
+    def get_new_candles(ticker: Ticker, start: int) -> pd.DataFrame:
+        if ticker not in LocalCandlesUploader.new_candles.keys():
+            return pd.DataFrame([])
 
-            new_candles = LocalCandlesUploader.new_candles[ticker]
+        return LocalCandlesUploader.new_candles[ticker].frame(start)
 
-            if len(new_candles) > 0:
-                if not os.path.isdir(ticker_path):
-                    os.makedirs(ticker_path)
-
-                pd.concat(new_candles).to_csv(
-                    ticker_path + f'{ticker.ticker_sign}.csv',
-                    mode='a',
-                    header=not os.path.isfile(
-                        ticker_path + f'{ticker.ticker_sign}.csv'
-                    )
-                )
+    @staticmethod
+    def cache_new_candles():
+        for ticker, candles in LocalCandlesUploader.new_candles.items():
+            new_candles = candles.new_frame()
 
-            if ticker in LocalCandlesUploader.candles_in_memory.keys():
-                LocalCandlesUploader.candles_in_memory[ticker] = pd.concat(
-                    [LocalCandlesUploader.candles_in_memory[ticker]]
-                    + LocalCandlesUploader.new_candles[ticker]
-                )
-            else:
-                LocalCandlesUploader.candles_in_memory[ticker] = pd.concat(
-                    LocalCandlesUploader.new_candles[ticker]
+            if len(new_candles) > 0:
+                LocalCandlesUploader.storage.append(
+                    new_candles,
+                    LocalCandlesUploader.broker.broker_name,
+                    ticker.ticker_sign
                 )
 
-        LocalCandlesUploader.new_candles = {}
+            LocalCandlesUploader.candles_in_memory[ticker] = candles.compact()
 
@@ -0,0 +1,195 @@
+import pandas as pd
+from engine.schemas.constants import log_path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from contextlib import nullcontext
+from threading import Lock, Thread
+from bisect import bisect_left
+from time import perf_counter
+import os
+
+# upper bounds of the buckets of the histograms in seconds, growing by 2 ** (1 / 4) from a microsecond to ~5 hours
+BUCKET_BOUNDS = [1e-6 * 2 ** (k / 4) for k in range(4 * 34)]
+QUANTILES = (0.5, 0.99)
+
+
+# counts of the values in the buckets, a quantile is interpolated in its bucket, within ~10% of the value
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return float('nan')
+
+        rank = q * self.count
+        cumulative = 0
+
+        for k, count in enumerate(self.counts):
+            if cumulative + count >= rank and count > 0:
+                lower = BUCKET_BOUNDS[k - 1] if k > 0 else 0.
+                upper = BUCKET_BOUNDS[k] if k < len(BUCKET_BOUNDS) else self.max
+
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.max)
+
+            cumulative += count
+
+        return self.max
+
+
+class Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        Metrics.observe(self.name, perf_counter() - self.start)
+
+        return False
+
+
+# timings of the stages of the trading loop: span(name) times a block into the histogram of the name, observe
+# records a value in seconds and count adds to a counter; while disabled, span returns a shared empty context
+# and nothing is recorded; the metrics are exported as Prometheus text to a file or served over http
+class Metrics:
+    enabled: bool = False
+    # the file export() writes to
+    path: str = None
+
+    histograms: dict[str, Histogram] = {}
+    counters: dict[str, float] = {}
+
+    _lock = Lock()
+    _null_span = nullcontext()
+    _server: ThreadingHTTPServer = None
+
+    @staticmethod
+    def enable(path: str = None, port: int = None):
+        Metrics.enabled = True
+        Metrics.path = log_path + 'metrics.prom' if path is None else path
+
+        if port is not None and Metrics._server is None:
+            Metrics.serve(port)
+
+    @staticmethod
+    def disable():
+        Metrics.enabled = False
+
+        if Metrics._server is not None:
+            Metrics._server.shutdown()
+            Metrics._server = None
+
+    @staticmethod
+    def reset():
+        with Metrics._lock:
+            Metrics.histograms = {}
+            Metrics.counters = {}
+
+    @staticmethod
+    def span(name: str):
+        if not Metrics.enabled:
+            return Metrics._null_span
+
+        return Span(name)
+
+    @staticmethod
+    def observe(name: str, value: float):
+        if not Metrics.enabled:
+            return
+
+        with Metrics._lock:
+            if name not in Metrics.histograms.keys():
+                Metrics.histograms[name] = Histogram()
+
+            Metrics.histograms[name].observe(value)
+
+    @staticmethod
+    def count(name: str, value: float = 1):
+        if not Metrics.enabled:
+            return
+
+        with Metrics._lock:
+            Metrics.counters[name] = Metrics.counters.get(name, 0) + value
+
+    # a row per histogram with the times in milliseconds, and a row per counter with its value as the count
+    @staticmethod
+    def summary() -> pd.DataFrame:
+        with Metrics._lock:
+            rows = [{
+                'name': name,
+                'count': histogram.count,
+                'total_ms': 1e3 * histogram.sum,
+                'mean_ms': 1e3 * histogram.sum / histogram.count,
+                'p50_ms': 1e3 * histogram.quantile(0.5),
+                'p99_ms': 1e3 * histogram.quantile(0.99),
+                'max_ms': 1e3 * histogram.max
+            } for name, histogram in sorted(Metrics.histograms.items())]
+
+            rows += [{'name': name, 'count': value} for name, value in sorted(Metrics.counters.items())]
+
+        return pd.DataFrame(rows, columns=['name', 'count', 'total_ms', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms'])
+
+    # histograms as summaries of their quantiles in seconds, counters as totals
+    @staticmethod
+    def prometheus_text() -> str:
+        lines = []
+
+        with Metrics._lock:
+            for name, histogram in sorted(Metrics.histograms.items()):
+                metric = f'segr_{name}_seconds'
+
+                lines.append(f'# TYPE {metric} summary')
+                lines += [f'{metric}{{quantile="{q}"}} {histogram.quantile(q)}' for q in QUANTILES]
+                lines += [f'{metric}_sum {histogram.sum}', f'{metric}_count {histogram.count}']
+
+            for name, value in sorted(Metrics.counters.items()):
+                metric = f'segr_{name}_total'
+
+                lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+
+        return '\n'.join(lines) + '\n'
+
+    # written aside and renamed, a reader of the file never sees a part of it
+    @staticmethod
+    def export(path: str = None):
+        path = Metrics.path if path is None else path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        with open(path + '.tmp', 'w') as metrics_file:
+            metrics_file.write(Metrics.prometheus_text())
+
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def serve(port: int) -> ThreadingHTTPServer:
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = Metrics.prometheus_text().encode()
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        Metrics._server = ThreadingHTTPServer(('', port), MetricsHandler)
+        Thread(target=Metrics._server.serve_forever, daemon=True).start()
+
+        return Metrics._server
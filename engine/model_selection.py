@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+from engine.models.hmm import HMMLearn
+from engine.schemas.data_broker import Pipeline
+from engine.schemas.datatypes import Ticker
+from engine.schemas.constants import log_path, model_path
+from datetime import datetime, timezone
+from time import time
+import joblib
+import os
+
+
+def fit_timed(model: HMMLearn, X: np.ndarray, **kwargs) -> tuple[HMMLearn, float, float]:
+    start = time()
+    model.fit(X, **kwargs)
+
+    return model, model.score(X), time() - start
+
+
+# fits the last step of the pipeline, an HMMLearn model, for every number of states in n_components_range;
+# the features are computed once and shared by all the fits (joblib maps the array into the workers),
+# the restarts of a number of states run in one pool, one of them is warm-started from the best model
+# with one state less by splitting its state of the largest variance;
+# the best Pipeline of every number of states is saved to path/<ticker>/n_components=<K>/
+def select_n_components(
+        ticker: Ticker,
+        steps: list,
+        n_components_range: range,
+        end_date: datetime = datetime.now(tz=timezone.utc),
+        tries: int = 1,
+        n_jobs: int = -1,
+        seed=None,
+        path: str = None,
+        results_path: str = None
+) -> pd.DataFrame:
+    if not isinstance(steps[-1], HMMLearn):
+        raise ValueError('The last step of the pipeline has to be a HMMLearn model.')
+
+    if path is None:
+        path = model_path + f'{ticker.ticker_sign}/'
+
+    if results_path is None:
+        results_path = log_path + f'model_selection_{ticker.ticker_sign}.csv'
+
+    pipe = Pipeline(ticker).make_pipeline(steps, end_date=end_date)
+    base_model = pipe.model
+
+    data = pipe.compute()
+    pipe.fit_date = data.index[-1]
+    X = data.to_numpy()
+
+    seeds = np.random.SeedSequence(seed if seed is not None else base_model.random_state)
+    best_model = None
+    results = []
+
+    with joblib.Parallel(n_jobs=n_jobs) as parallel:
+        for n_components in sorted(n_components_range):
+            models, warm_start = [], []
+
+            if best_model is not None and best_model.n_components == n_components - 1:
+                models.append(best_model.split_state())
+                warm_start.append(True)
+
+            for model_seed in seeds.spawn(max(tries - len(models), 0)):
+                model = base_model.with_n_components(n_components)
+                model.random_state = int(model_seed.generate_state(1)[0])
+                models.append(model)
+                warm_start.append(False)
+
+            fitted = parallel(joblib.delayed(fit_timed)(model, X, resume=resume)
+                              for model, resume in zip(models, warm_start))
+
+            best = int(np.argmax([score for _, score, _ in fitted]))
+            best_model = fitted[best][0]
+            report = best_model.evaluate(X)
+
+            pipe.model = best_model
+            pipe.save_model(path + f'n_components={n_components}/')
+
+            results.append({
+                'n_components': n_components,
+                'score': report.score,
+                'aic': report.aic,
+                'bic': report.bic,
+                'fit_time': sum([runtime for _, _, runtime in fitted]),
+                'n_iter': len(best_model.fit_trace),
+                'warm_start': warm_start[best],
+            })
+
+    results = pd.DataFrame(results)
+
+    if not os.path.isdir(os.path.dirname(results_path)):
+        os.makedirs(os.path.dirname(results_path))
+
+    results.to_csv(results_path, index=False)
+
+    return results
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+# log-densities of Gaussian states with full covariances, evaluated through the Cholesky factors
+# of the precision matrices: z = prec_chol @ (x - mean) is standard normal for the state
+class GaussianEmissions:
+    # rows of observations evaluated at once, bounds the (rows, n_components * n_features) temporary
+    chunk_size = 1 << 16
+
+    def __init__(self, means: np.ndarray, covars: np.ndarray, min_covar: float = 1e-7):
+        n_components, n_features = means.shape
+
+        self.means = np.array(means, dtype=np.float64)
+        chol = np.empty((n_components, n_features, n_features))
+
+        for i, covar in enumerate(np.asarray(covars, dtype=np.float64)):
+            # a state stuck with too few observations is regularized as in hmmlearn
+            try:
+                chol[i] = np.linalg.cholesky(covar)
+            except np.linalg.LinAlgError:
+                try:
+                    chol[i] = np.linalg.cholesky(covar + min_covar * np.eye(n_features))
+                except np.linalg.LinAlgError:
+                    raise ValueError("'covars' must be symmetric, positive-definite")
+
+        self.prec_chol = np.linalg.inv(chol)
+        self.log_norm = (-0.5 * n_features * np.log(2 * np.pi)
+                         - np.log(np.diagonal(chol, axis1=1, axis2=2)).sum(axis=1))
+
+        # prec_chol @ mean, so that z = prec_chol @ x - shift
+        self.shift = np.matmul(self.prec_chol, self.means[:, :, None])[..., 0]
+
+        self._z = np.empty((n_components, n_features))
+        self._log_density = np.empty(n_components)
+
+    @property
+    def n_components(self):
+        return self.means.shape[0]
+
+    # (n_observations, n_components) array of log-densities
+    def log_likelihood(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        log_density = np.empty((X.shape[0], self.n_components))
+
+        # one product with the factors of all states stacked into a (n_features, n_components * n_features) matrix
+        stacked_prec_chol = self.prec_chol.transpose(2, 0, 1).reshape(X.shape[1], -1)
+        stacked_shift = self.shift.reshape(-1)
+
+        for start in range(0, X.shape[0], self.chunk_size):
+            z = X[start:start + self.chunk_size] @ stacked_prec_chol
+            z -= stacked_shift
+            np.square(z, out=z)
+
+            log_density[start:start + self.chunk_size] = self.log_norm - 0.5 * z.reshape(
+                z.shape[0], self.n_components, -1).sum(axis=2)
+
+        return log_density
+
+    # log-densities of a single observation, written into a buffer of the instance
+    def log_likelihood_one(self, x: np.ndarray) -> np.ndarray:
+        np.matmul(self.prec_chol, x, out=self._z)
+        np.subtract(self._z, self.shift, out=self._z)
+        np.square(self._z, out=self._z)
+        np.sum(self._z, axis=1, out=self._log_density)
+        np.multiply(self._log_density, -0.5, out=self._log_density)
+        np.add(self._log_density, self.log_norm, out=self._log_density)
+
+        return self._log_density
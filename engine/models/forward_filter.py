@@ -0,0 +1,80 @@
+import numpy as np
+from engine.models.emissions import GaussianEmissions
+
+
+# streaming forward filter of an HMM with full-covariance Gaussian emissions: holds the normalized
+# log-posterior of the last state and the log-likelihood of the observations seen so far,
+# a candle costs O(K^2 + K d^2) and is computed in preallocated buffers
+class ForwardFilter:
+    def __init__(
+            self,
+            transmat: np.ndarray,
+            emissions: GaussianEmissions,
+            log_posterior: np.ndarray = None,
+            log_likelihood: float = 0.
+    ):
+        n_components = emissions.n_components
+
+        self.transmat = np.array(transmat, dtype=np.float64)
+        self.emissions = emissions
+
+        if log_posterior is None:
+            log_posterior = np.full(n_components, -np.log(n_components))
+
+        self.log_posterior = np.array(log_posterior, dtype=np.float64)
+        self.log_likelihood = float(log_likelihood)
+
+        self._p = np.empty(n_components)
+        self._log_alpha = np.empty(n_components)
+
+    @property
+    def n_components(self):
+        return self.log_posterior.shape[0]
+
+    # log-densities of the states for a batch of observations, an (n, n_components) array
+    def log_emissions(self, X: np.ndarray) -> np.ndarray:
+        return self.emissions.log_likelihood(X)
+
+    # one step of the recursion from the normalized log-posterior, log_emission of the new observation;
+    # the transition is applied to posterior probabilities shifted by their maximum, so zero transitions stay exact
+    def step(self, log_emission: np.ndarray):
+        p_max = self.log_posterior.max()
+
+        np.subtract(self.log_posterior, p_max, out=self._p)
+        np.exp(self._p, out=self._p)
+        np.matmul(self._p, self.transmat, out=self._log_alpha)
+        np.log(self._log_alpha, out=self._log_alpha)
+        np.add(self._log_alpha, log_emission, out=self._log_alpha)
+        self._log_alpha += p_max
+
+        alpha_max = self._log_alpha.max()
+
+        np.subtract(self._log_alpha, alpha_max, out=self._p)
+        np.exp(self._p, out=self._p)
+        log_increment = alpha_max + np.log(self._p.sum())
+
+        np.subtract(self._log_alpha, log_increment, out=self.log_posterior)
+        self.log_likelihood += log_increment
+
+    def update(self, X: np.ndarray):
+        for x in X:
+            self.step(self.emissions.log_likelihood_one(x))
+
+        return self.log_posterior
+
+    # unnormalized log-probabilities of the last state and the observations
+    @property
+    def forward_prob(self) -> np.ndarray:
+        return self.log_posterior + self.log_likelihood
+
+    def forecast(self, h: int = 1) -> np.ndarray:
+        return np.log(np.exp(self.log_posterior) @ np.linalg.matrix_power(self.transmat, h))
+
+    def state(self) -> dict:
+        return {'log_posterior': self.log_posterior.copy(), 'log_likelihood': self.log_likelihood}
+
+    def restore(self, state: dict):
+        self.log_posterior[:] = state['log_posterior']
+        self.log_likelihood = float(state['log_likelihood'])
+
+        return self
@@ -2,10 +2,16 @@ from pomegranate.hmm import DenseHMM
 from pomegranate.gmm import GeneralMixtureModel
 from pomegranate.distributions import Normal, DiracDelta
 from hmmlearn.hmm import GaussianHMM
+from hmmlearn import _hmmc
+from engine.models.forward_filter import ForwardFilter
+from engine.models.emissions import GaussianEmissions
 import pandas as pd
 import numpy as np
 import scipy as sc
 import torch
+import hashlib
+import copy
+from dataclasses import dataclass
 
 
 class HMMReturnsMixin:
@@ -20,21 +26,12 @@ class HMMReturnsMixin:
             t_threshold=1
     ):
         if (X is not None) and (returns is not None):
-            states = self.decode(X)
-            n_states = len(np.unique(states))
-
-            moments = []
+            states = self.evaluate(X).states if hasattr(self, 'evaluate') else self.decode(X)
 
             if returns_type == 'two_way':
                 returns = np.sum(returns, axis=1)
 
-            for s in range(n_states):
-                state_returns = returns[states == s]
-
-                moments.append([state_returns.mean(), state_returns.std()])
-
-            moments = np.array(moments)
-            means, SEs = moments[:, 0], moments[:, 1]
+            means, SEs = self.state_moments(states, returns, n_states=self.n_components)
         else:
             if returns_type == 'two_way':
                 means = self.means_[:, 0] + self.means_[:, 1]
@@ -55,6 +52,17 @@ class HMMReturnsMixin:
             else:
                 self.states_map.append('indeterminate')
 
+    # mean and standard deviation of the returns in each state of the path, nan for states not in the path
+    @staticmethod
+    def state_moments(states: np.ndarray, returns: np.ndarray, n_states: int) -> tuple[np.ndarray, np.ndarray]:
+        counts = np.bincount(states, minlength=n_states)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.bincount(states, weights=returns, minlength=n_states) / counts
+            variances = np.bincount(states, weights=(returns - means[states]) ** 2, minlength=n_states) / counts
+
+        return means, np.sqrt(variances)
+
     def forecast_next_state(self, h=1):
         f = self.forecast(h)
         state = np.argmax(f)
@@ -80,6 +88,7 @@ class HMMPomegranate(DenseHMM):
         self._num_of_improvements = num_of_improvements
         self._abs_tol = abs_tol
         self.forward_prob: torch.Tensor = None
+        self.filter: ForwardFilter = None
 
         self.name += f'(normal_states={normal_states},zero_states={zero_states})'
 
@@ -99,6 +108,7 @@ class HMMPomegranate(DenseHMM):
         self.ends = data['ends']
         self.starts = data['starts']
         self.forward_prob = data['forward']
+        self.filter = None
         self.state_to_order: list = {}
 
         self.distributions = None
@@ -111,6 +121,7 @@ class HMMPomegranate(DenseHMM):
     def forward(self, X=None, emissions=None, priors=None):
         f = super().forward(X=X, emissions=emissions, priors=priors)
         self.forward_prob = f[0, -1, :]
+        self.filter = None
 
         return f
 
@@ -127,7 +138,24 @@ class HMMPomegranate(DenseHMM):
 
         return self
 
+    def forward_filter(self) -> ForwardFilter:
+        forward_prob = self.forward_prob.detach().numpy().astype(np.float64)
+        log_likelihood = sc.special.logsumexp(forward_prob)
+
+        return ForwardFilter(
+            transmat=torch.exp(self.edges).detach().numpy().astype(np.float64),
+            emissions=GaussianEmissions(
+                means=np.stack([dist.means.detach().numpy() for dist in self.distributions]),
+                covars=np.stack([dist.covs.detach().numpy() for dist in self.distributions])
+            ),
+            log_posterior=forward_prob - log_likelihood,
+            log_likelihood=log_likelihood
+        )
+
     def forecast(self, h: int = 1):
+        if self.filter is not None:
+            return torch.from_numpy(self.filter.forecast(h))
+
         f = torch.log(
             torch.exp(self.forward_prob - torch.logsumexp(self.forward_prob, dim=0))
             @ torch.linalg.matrix_power(torch.exp(self.edges), h)
@@ -136,15 +164,11 @@ class HMMPomegranate(DenseHMM):
         return f
 
     def update(self, X: pd.DataFrame):
-        X = X.to_numpy()
+        if self.filter is None:
+            self.filter = self.forward_filter()
 
-        for t in range(X.shape[0]):
-            p = torch.Tensor([d.log_probability(X[t, :].reshape(1, -1)) for d in self.distributions])
-            logp = torch.logsumexp(self.forward_prob, dim=0)
-            self.forward_prob = torch.log(
-                torch.exp(self.forward_prob - logp).reshape(1, -1) @ torch.exp(self.edges)
-            ) + logp + p
-            self.forward_prob = self.forward_prob.reshape(-1)
+        self.filter.update(X.to_numpy())
+        self.forward_prob = torch.from_numpy(self.filter.forward_prob)
 
         return self.forward_prob
 
@@ -159,8 +183,37 @@ class HMMLearn(GaussianHMM, HMMReturnsMixin):
         super().__init__(n_components=n_components, covariance_type=covariance_type, **kwargs)
 
         self.name = f'HMMLearn(n_components={n_components},covariance_type={covariance_type})'
-        self.forward_prob = None
-        self.posterior_prob = None
+        self.filter: ForwardFilter = None
+        self.fit_trace = []
+
+    # the last evaluation report holds the posteriors of its whole sequence and is not saved with the model
+    def __getstate__(self):
+        state = dict(super().__getstate__())
+        state.pop('_report', None)
+
+        return state
+
+    # models pickled before the forward filter kept forward_prob and posterior_prob as attributes
+    def __setstate__(self, state):
+        forward_prob, posterior_prob = state.pop('forward_prob', None), state.pop('posterior_prob', None)
+        super().__setstate__(state)
+
+        if 'filter' not in state.keys():
+            self.filter = None
+
+            if posterior_prob is not None:
+                self.filter = self.forward_filter().restore({
+                    'log_posterior': posterior_prob,
+                    'log_likelihood': sc.special.logsumexp(forward_prob)
+                })
+
+    @property
+    def posterior_prob(self):
+        return None if self.filter is None else self.filter.log_posterior
+
+    @property
+    def forward_prob(self):
+        return None if self.filter is None else self.filter.forward_prob
 
     def save_model(self):
         return self
@@ -168,37 +221,221 @@ class HMMLearn(GaussianHMM, HMMReturnsMixin):
     def decode(self, X, lengths=None, algorithm=None):
         return super().decode(X, lengths=lengths, algorithm=algorithm)[1]
 
-    def fit(self, X, lengths=None):
+    # score, information criteria, Viterbi path and posteriors of a single sequence from one evaluation
+    # of the emissions and one forward-backward pass, the last report is kept for the same data and parameters
+    def evaluate(self, X) -> 'HMMReport':
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        key = (hashlib.blake2b(X.tobytes(), digest_size=16).hexdigest(), X.shape,
+               hash((self.startprob_.tobytes(), self.transmat_.tobytes(), self.means_.tobytes(),
+                     self._covars_.tobytes())))
+
+        if getattr(self, '_report', None) is not None and self._report[0] == key:
+            return self._report[1]
+
+        log_frameprob = self._compute_log_likelihood(X)
+
+        log_prob, fwdlattice = _hmmc.forward_log(self.startprob_, self.transmat_, log_frameprob)
+        bwdlattice = _hmmc.backward_log(self.startprob_, self.transmat_, log_frameprob)
+        viterbi_log_prob, states = _hmmc.viterbi(self.startprob_, self.transmat_, log_frameprob)
+
+        log_gamma = fwdlattice + bwdlattice
+        log_gamma -= sc.special.logsumexp(log_gamma, axis=1, keepdims=True)
+
+        n_params = sum(self._get_n_fit_scalars_per_param().values())
+
+        report = HMMReport(
+            score=log_prob,
+            aic=-2 * log_prob + 2 * n_params,
+            bic=-2 * log_prob + n_params * np.log(X.shape[0]),
+            states=states,
+            viterbi_log_prob=viterbi_log_prob,
+            posteriors=np.exp(log_gamma)
+        )
+
+        self._report = (key, report)
+
+        return report
+
+    # n_iter limits the number of EM iterations of this call, resume continues from the current parameters
+    # instead of a new initialization, partial skips the filtering state when more iterations will follow
+    def fit(self, X, lengths=None, n_iter=None, resume=False, partial=False):
+        init_params, max_iter = self.init_params, self.n_iter
+
+        if n_iter is not None:
+            self.n_iter = self.monitor_.n_iter = n_iter
+
+        if resume:
+            self.init_params = ''
+        else:
+            self.fit_trace = []
+
         n_tries = 0
 
-        while n_tries < 10:
-            try:
-                super().fit(X, lengths=lengths)
-                n_tries = 3
-            except ValueError:
-                n_tries += 1
+        try:
+            while n_tries < 10:
+                try:
+                    super().fit(X, lengths=lengths)
+                    break
+                except ValueError:
+                    n_tries += 1
+        finally:
+            self.init_params = init_params
+            self.n_iter = self.monitor_.n_iter = max_iter
+
+        self.fit_trace += list(self.monitor_.history)
 
-        self.posterior_prob = self.predict_proba(X, lengths=lengths)[-1, :]
-        self.forward_prob = self.posterior_prob + self.score(X, lengths=lengths)
+        if not partial:
+            self.init_filter(X, lengths=lengths)
 
         return self
 
-    def update(self, X: pd.DataFrame):
-        X = X.to_numpy()
-        p = self._compute_log_likelihood(X)
+    # the emission factors are kept until the means or covariances change (a new EM iteration, refit or load)
+    def emissions(self) -> GaussianEmissions:
+        fingerprint = hash((self.means_.tobytes(), self._covars_.tobytes()))
+
+        if getattr(self, '_emissions_fingerprint', None) != fingerprint:
+            self._emissions = GaussianEmissions(self.means_, self._full_covars())
+            self._emissions_fingerprint = fingerprint
+
+        return self._emissions
+
+    # the covariances as hmmlearn evaluates them: spherical ones are initialized by feature and broadcast
+    # over the features
+    def _full_covars(self) -> np.ndarray:
+        if self.covariance_type != 'spherical':
+            return self.covars_
 
-        for t in range(X.shape[0]):
-            logp = sc.special.logsumexp(self.forward_prob, axis=0)
+        covars = np.broadcast_to(np.reshape(self._covars_, (self.n_components, -1)), self.means_.shape)
 
-            p_max = np.max(self.posterior_prob)
+        return np.array(list(map(np.diag, covars)))
 
-            self.forward_prob = np.log(
-                np.exp(self.posterior_prob - p_max).reshape(1, -1) @ self.transmat_
-            ) + logp + p[t, :] + p_max
-            self.forward_prob = self.forward_prob.reshape(-1)
-            self.posterior_prob = self.forward_prob - sc.special.logsumexp(self.forward_prob, axis=0)
+    def _compute_log_likelihood(self, X):
+        return self.emissions().log_likelihood(X)
+
+    def forward_filter(self) -> ForwardFilter:
+        return ForwardFilter(transmat=self.transmat_, emissions=self.emissions())
+
+    # the filter is started by one forward pass over the training data
+    def init_filter(self, X, lengths=None):
+        log_likelihood, last_fwdlattice = 0, None
+
+        for sub_X in ([X] if lengths is None else np.split(X, np.cumsum(lengths)[:-1])):
+            log_prob, fwdlattice = _hmmc.forward_log(self.startprob_, self.transmat_,
+                                                     self._compute_log_likelihood(sub_X))
+            log_likelihood += log_prob
+            last_fwdlattice = fwdlattice[-1]
+
+        self.filter = self.forward_filter().restore({
+            'log_posterior': last_fwdlattice - sc.special.logsumexp(last_fwdlattice),
+            'log_likelihood': log_likelihood
+        })
+
+    # unfitted copy of the model with another number of states
+    def with_n_components(self, n_components: int) -> 'HMMLearn':
+        model = copy.deepcopy(self)
+
+        for attribute in ['startprob_', 'transmat_', 'means_', '_covars_', 'n_features',
+                          '_emissions', '_emissions_fingerprint', '_report']:
+            model.__dict__.pop(attribute, None)
+
+        model.n_components = n_components
+        model.name = f'HMMLearn(n_components={n_components},covariance_type={model.covariance_type})'
+        model.filter = None
+        model.fit_trace = []
+
+        return model
+
+    # warm start for a model with one more state: the state with the largest variance is split in two along
+    # its principal axis, the halves share the transitions of the state and the probability of entering it
+    def split_state(self, scale: float = 0.5) -> 'HMMLearn':
+        model = self.with_n_components(self.n_components + 1)
+        covars = self._full_covars()
+
+        k = int(np.argmax(np.trace(covars, axis1=1, axis2=2)))
+        eigenvalues, eigenvectors = np.linalg.eigh(covars[k])
+        offset = scale * np.sqrt(eigenvalues[-1]) * eigenvectors[:, -1]
+
+        startprob = np.append(self.startprob_, self.startprob_[k] / 2)
+        startprob[k] /= 2
+
+        transmat = np.hstack([self.transmat_, self.transmat_[:, [k]] / 2])
+        transmat[:, k] /= 2
+        transmat = np.vstack([transmat, transmat[k]])
+
+        model.n_features = self.n_features
+        model.startprob_ = startprob
+        model.transmat_ = transmat
+        model.means_ = np.vstack([self.means_, self.means_[k] + offset])
+        model.means_[k] -= offset
+
+        # the covariances are kept in the shape of the covariance type, a tied one is shared by the new state
+        if self.covariance_type == 'tied':
+            model._covars_ = self._covars_.copy()
+        else:
+            model._covars_ = np.concatenate([self._covars_, self._covars_[[k]]])
+
+        return model
+
+    # whether EM stopped by the tolerance on the improvement of the log-likelihood
+    def converged(self):
+        return len(self.fit_trace) >= 2 and self.fit_trace[-1] - self.fit_trace[-2] < self.tol
+
+    def update(self, X: pd.DataFrame):
+        return self.filter.update(X.to_numpy())
 
     def forecast(self, h=1):
-        f = np.log(np.exp(self.posterior_prob) @ np.linalg.matrix_power(self.transmat_, h))
+        return self.filter.forecast(h)
+
+
+# advances the forward filters of several models by their own new observations at once:
+# filters of HMMLearn models with the same number of states are stacked into (n_models, n_states) arrays
+# and moved by one batched matmul per row of the longest window, other models are updated one by one
+def batch_update(models: list, observations: list[pd.DataFrame]):
+    groups = {}
+
+    for model, X in zip(models, observations):
+        if len(X) == 0:
+            continue
+
+        if isinstance(model, HMMLearn):
+            groups.setdefault(model.n_components, []).append((model, X.to_numpy()))
+        else:
+            model.update(X)
+
+    for n_components, group in groups.items():
+        n_rows = np.array([X.shape[0] for _, X in group])
+
+        log_emissions = np.zeros((len(group), n_rows.max(), n_components))
+
+        for i, (model, X) in enumerate(group):
+            log_emissions[i, :n_rows[i]] = model.filter.log_emissions(X)
+
+        transmat = np.stack([model.filter.transmat for model, _ in group])
+        log_posterior = np.stack([model.filter.log_posterior for model, _ in group])
+        log_likelihood = np.array([model.filter.log_likelihood for model, _ in group])
+
+        for t in range(n_rows.max()):
+            observed = t < n_rows
+
+            p_max = np.max(log_posterior, axis=1, keepdims=True)
+
+            log_alpha = np.log(
+                np.matmul(np.exp(log_posterior - p_max)[:, None, :], transmat)[:, 0, :]
+            ) + log_emissions[:, t] + p_max
+            log_increment = sc.special.logsumexp(log_alpha, axis=1)
+
+            log_posterior = np.where(observed[:, None], log_alpha - log_increment[:, None], log_posterior)
+            log_likelihood = np.where(observed, log_likelihood + log_increment, log_likelihood)
+
+        for i, (model, _) in enumerate(group):
+            model.filter.restore({'log_posterior': log_posterior[i], 'log_likelihood': log_likelihood[i]})
+
 
-        return f
\ No newline at end of file
+@dataclass
+class HMMReport:
+    score: float
+    aic: float
+    bic: float
+    states: np.ndarray
+    viterbi_log_prob: float
+    posteriors: np.ndarray
@@ -0,0 +1,160 @@
+import pandas as pd
+from engine.strategies.strategy import Strategy
+from engine.schemas.client import Client
+from engine.metrics import Metrics
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from time import sleep
+
+epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# a cycle of the scheduler: the boundary it was due at, how late it started after the planned start and how long
+# it ran, in seconds, the strategies executed, still running at the deadline, or not executed as they were still
+# running from a previous cycle or the deadline had passed, and the boundaries skipped before the cycle
+@dataclass
+class CycleRecord:
+    boundary: datetime
+    lateness: float
+    duration: float
+    n_executed: int
+    n_overran: int
+    n_deferred: int
+    n_missed: int
+
+
+# runs the strategies once a period at the boundaries of the periods, the minutes of the exchange by default:
+# a cycle starts offset after its boundary, so that the candle of the last minute is complete, executes
+# the strategies concurrently and waits for them until the deadline after the boundary; a strategy running
+# past the deadline is left to finish, and as the strategies read the period of the client, the period is moved
+# only once it has finished: the cycles it overlaps are deferred, and a cycle which cannot start before
+# its deadline is skipped; clock and sleep_for are injectable, e.g. to run on a simulated clock
+class MinuteScheduler:
+    def __init__(
+            self,
+            period: timedelta = timedelta(minutes=1),
+            offset: timedelta = timedelta(seconds=1),
+            deadline: timedelta = timedelta(seconds=50),
+            clock: Callable[[], datetime] = None,
+            sleep_for: Callable[[float], None] = sleep
+    ):
+        if not offset < deadline <= period:
+            raise ValueError('The offset must be before the deadline, and the deadline within the period.')
+
+        self.period = period
+        self.offset = offset
+        self.deadline = deadline
+        self.clock = (lambda: datetime.now(tz=timezone.utc)) if clock is None else clock
+        self.sleep_for = sleep_for
+        self.records: list[CycleRecord] = []
+
+    def _floor(self, time: datetime) -> datetime:
+        return time - (time - epoch) % self.period
+
+    # the first boundary from due on whose deadline is not passed, waited for, and the number of skipped ones
+    def _wait_for(self, due: datetime) -> tuple[datetime, int]:
+        now = self.clock()
+        n_missed = 0
+
+        if now >= due + self.deadline:
+            boundary = self._floor(now - self.deadline) + self.period
+            n_missed = (boundary - due) // self.period
+            due = boundary
+
+        if now < due + self.offset:
+            self.sleep_for((due + self.offset - now).total_seconds())
+
+        return due, n_missed
+
+    # the time the execution finished at
+    def _execute(self, strategy: Strategy, client: Client, account, tickers_collection: list) -> datetime:
+        with Metrics.span('strategy_execute'):
+            strategy.execute(client, account, tickers_collection)
+
+        return self.clock()
+
+    # the running strategies are waited for until the deadline of the boundary, in slices of the clock,
+    # which may be a simulated one; returns the times the strategies done finished at
+    def _wait_running(self, running: dict[int, Future], due: datetime) -> dict[int, datetime]:
+        while not all(future.done() for future in running.values()) and self.clock() < due + self.deadline:
+            wait(running.values(), timeout=min((due + self.deadline - self.clock()).total_seconds(), 0.1))
+
+        # an error of a strategy is raised once it is done
+        return {i: running.pop(i).result() for i in [i for i, future in running.items() if future.done()]}
+
+    def report(self) -> pd.DataFrame:
+        return pd.DataFrame([asdict(record) for record in self.records])
+
+    def run(
+            self,
+            strategies: list[Strategy],
+            client: Client,
+            account,
+            tickers_collection: list,
+            max_cycles: int = None
+    ):
+        running: dict[int, Future] = {}
+        due = self._floor(self.clock()) + self.period
+
+        with ThreadPoolExecutor(max(len(strategies), 1)) as threads:
+            while any(strategy.active for strategy in strategies) \
+                    and (max_cycles is None or len(self.records) < max_cycles):
+                due, n_missed = self._wait_for(due)
+                start = self.clock()
+
+                # the strategies still executing in the current period are waited for before it is moved
+                self._wait_running(running, due)
+
+                executed, finished, n_deferred = [], {}, 0
+
+                if len(running) > 0:
+                    n_deferred = len([strategy for strategy in strategies if strategy.active])
+                else:
+                    try:
+                        client.next_period()
+                    except StopIteration:
+                        for strategy in strategies:
+                            if strategy.active:
+                                strategy.terminate()
+
+                        break
+
+                    # nothing is started once the deadline has passed
+                    overdue = self.clock() >= due + self.deadline
+
+                    for i, strategy in enumerate(strategies):
+                        if not strategy.active:
+                            continue
+
+                        if overdue:
+                            n_deferred += 1
+                        else:
+                            running[i] = threads.submit(self._execute, strategy, client, account, tickers_collection)
+                            executed.append(i)
+
+                    finished = self._wait_running(running, due)
+
+                self.records.append(CycleRecord(
+                    boundary=due,
+                    lateness=(start - due - self.offset).total_seconds(),
+                    duration=(self.clock() - start).total_seconds(),
+                    n_executed=len(executed),
+                    n_overran=len([i for i in executed
+                                   if i in running.keys() or finished[i] > due + self.deadline]),
+                    n_deferred=n_deferred,
+                    n_missed=n_missed
+                ))
+
+                record = self.records[-1]
+                Metrics.observe('cycle', record.duration)
+                Metrics.observe('cycle_lateness', record.lateness)
+                Metrics.count('strategies_overran', record.n_overran)
+                Metrics.count('strategies_deferred', record.n_deferred)
+                Metrics.count('cycles_missed', record.n_missed)
+
+                due += self.period
+
+            for future in running.values():
+                future.result()
@@ -0,0 +1,341 @@
+import numpy as np
+import pandas as pd
+from engine.schemas.datatypes import Broker, to_epoch_minutes
+from engine.schemas.enums import SessionPeriod, InstrumentType
+from dataclasses import dataclass
+from typing import Optional
+from datetime import datetime, date, time, timedelta, timezone
+
+MINUTES_IN_DAY = 24 * 60
+EPOCH = datetime(year=1970, month=1, day=1, tzinfo=timezone.utc)
+
+SESSIONS = [SessionPeriod.PREMARKET, SessionPeriod.MAIN, SessionPeriod.AFTERHOURS]
+
+
+def minute_of_day(time_: time) -> int:
+    return time_.hour * 60 + time_.minute
+
+
+def to_epoch_day(date_: date) -> int:
+    return date_.toordinal() - EPOCH.date().toordinal()
+
+
+def duration_in_minutes(duration: timedelta) -> int:
+    return int(duration.total_seconds()) // 60
+
+
+# per-day arrays of the schedule of one type of instruments, day i is the epoch day first_day + i,
+# all times are minutes from the start of the day (intervals are open <= t < close)
+@dataclass
+class DaySchedule:
+    first_day: int
+    trading_day: np.ndarray
+    open: np.ndarray
+    close: np.ndarray
+    break_start: np.ndarray
+    break_end: np.ndarray
+    session_start: np.ndarray
+    session_end: np.ndarray
+    session_opening: np.ndarray
+    session_closing: np.ndarray
+
+
+@dataclass
+class MinuteSchedule:
+    exchange_closed: bool
+    on_break: bool
+    session: SessionPeriod
+    session_start: datetime = None
+    session_end: datetime = None
+    opening: bool = False
+    closing: bool = False
+
+
+# trading-minute calendar compiled once from the schedules of a broker
+class TradingCalendar:
+    calendars: dict[str, 'TradingCalendar'] = {}
+
+    def __init__(self, broker: Broker, end_date: date = None):
+        self._broker = broker
+        self._first_day = to_epoch_day(broker.start_date)
+        self._holidays = np.array([to_epoch_day(d) for d in broker.holidays], dtype=np.int64)
+        self._working_weekends = np.array([to_epoch_day(d) for d in broker.working_weekends], dtype=np.int64)
+        self._schedules: dict[InstrumentType, DaySchedule] = {}
+
+        if end_date is None:
+            end_date = max([datetime.now(tz=timezone.utc).date()] + broker.holidays + broker.working_weekends)
+
+        self._compile(to_epoch_day(end_date) + 366)
+
+    @staticmethod
+    def of(broker: Broker) -> 'TradingCalendar':
+        if broker.broker_name not in TradingCalendar.calendars.keys():
+            TradingCalendar.calendars[broker.broker_name] = TradingCalendar(broker)
+
+        return TradingCalendar.calendars[broker.broker_name]
+
+    def _compile(self, last_day: int):
+        days = np.arange(self._first_day, last_day, dtype=np.int64)
+        weekday = (days + 3) % 7  # 1970-01-01 is a Thursday
+
+        trading_day = (((weekday < 5) | np.isin(days, self._working_weekends))
+                       & ~np.isin(days, self._holidays))
+
+        self._last_day = last_day
+        self._schedules = {}
+
+        for type_instrument in self._broker.working_hours.time_info.keys():
+            day_open = np.zeros(days.shape, dtype=np.int64)
+            day_close = np.zeros(days.shape, dtype=np.int64)
+
+            for (start, end), day_schedule in self._broker.working_hours.fetch_items(type_instrument):
+                in_interval = (days >= to_epoch_day(start)) & (days < to_epoch_day(end))
+
+                day_open[in_interval] = minute_of_day(day_schedule['start'])
+                day_close[in_interval] = (minute_of_day(day_schedule['start'])
+                                          + duration_in_minutes(day_schedule['duration']))
+
+            break_items = (self._broker.break_in_working_hours.fetch_items(type_instrument)
+                           if type_instrument in self._broker.break_in_working_hours.time_info.keys() else [])
+            max_breaks = max([len(break_data) for _, break_data in break_items] + [1])
+
+            # unused slots are empty intervals
+            break_start = np.zeros((days.shape[0], max_breaks), dtype=np.int64)
+            break_end = np.zeros((days.shape[0], max_breaks), dtype=np.int64)
+
+            for (start, end), break_data in break_items:
+                in_interval = (days >= to_epoch_day(start)) & (days < to_epoch_day(end))
+
+                for i, break_interval in enumerate(break_data):
+                    break_start[in_interval, i] = minute_of_day(break_interval['start'])
+                    break_end[in_interval, i] = (minute_of_day(break_interval['start'])
+                                                 + duration_in_minutes(break_interval['duration']))
+
+            session_start = np.zeros((days.shape[0], len(SESSIONS)), dtype=np.int64)
+            session_end = np.zeros((days.shape[0], len(SESSIONS)), dtype=np.int64)
+            session_opening = np.zeros((days.shape[0], len(SESSIONS)), dtype=bool)
+            session_closing = np.zeros((days.shape[0], len(SESSIONS)), dtype=bool)
+
+            session_items = (self._broker.session_type.fetch_items(type_instrument)
+                             if type_instrument in self._broker.session_type.time_info.keys() else [])
+
+            for (start, end), sessions_info in session_items:
+                in_interval = (days >= to_epoch_day(start)) & (days < to_epoch_day(end))
+
+                if not isinstance(sessions_info, dict):
+                    continue
+
+                for i, session in enumerate(SESSIONS):
+                    if session not in sessions_info.keys() or 'start' not in sessions_info[session].keys():
+                        continue
+
+                    session_info = sessions_info[session]
+
+                    session_start[in_interval, i] = minute_of_day(session_info['start'])
+                    session_end[in_interval, i] = (minute_of_day(session_info['start'])
+                                                   + duration_in_minutes(session_info['duration']))
+                    session_opening[in_interval, i] = session_info['opening']
+                    session_closing[in_interval, i] = session_info['closing']
+
+            self._schedules[type_instrument] = DaySchedule(
+                first_day=self._first_day,
+                trading_day=trading_day,
+                open=day_open,
+                close=day_close,
+                break_start=break_start,
+                break_end=break_end,
+                session_start=session_start,
+                session_end=session_end,
+                session_opening=session_opening,
+                session_closing=session_closing
+            )
+
+    def schedule(self, type_instrument: InstrumentType) -> DaySchedule:
+        return self._schedules[type_instrument]
+
+    # positions of epoch days in the compiled arrays, -1 for days before the start of trading
+    def _positions(self, days: np.ndarray) -> np.ndarray:
+        if len(days) > 0 and days.max() >= self._last_day:
+            self._compile(int(days.max()) + 366)
+
+        return np.where(days >= self._first_day, days - self._first_day, -1)
+
+    # minute-of-day and day positions of epoch minutes, days before the start of trading are not known
+    def _locate(self, minutes: np.ndarray):
+        days = minutes // MINUTES_IN_DAY
+        time_of_day = minutes - days * MINUTES_IN_DAY
+        positions = self._positions(days)
+        known_day = positions >= 0
+
+        return time_of_day, np.where(known_day, positions, 0), known_day
+
+    def _masks(self, type_instrument: InstrumentType, minutes: np.ndarray):
+        time_of_day, positions, known_day = self._locate(minutes)
+        schedule = self._schedules[type_instrument]
+
+        in_working_hours = (known_day
+                            & (time_of_day >= schedule.open[positions])
+                            & (time_of_day < schedule.close[positions]))
+        on_break = (known_day
+                    & ((time_of_day[:, None] >= schedule.break_start[positions])
+                       & (time_of_day[:, None] < schedule.break_end[positions])).any(axis=1))
+        trading_day = known_day & schedule.trading_day[positions]
+
+        return trading_day, in_working_hours, on_break, time_of_day, positions
+
+    def is_trading_day(self, type_instrument: InstrumentType, days: np.ndarray) -> np.ndarray:
+        positions = self._positions(days)
+
+        return (positions >= 0) & self._schedules[type_instrument].trading_day[np.maximum(positions, 0)]
+
+    def is_trading_minute(self, type_instrument: InstrumentType, index: pd.DatetimeIndex) -> np.ndarray:
+        trading_day, in_working_hours, on_break, _, _ = self._masks(type_instrument, to_epoch_minutes(index))
+
+        return trading_day & in_working_hours & ~on_break
+
+    # codes of SessionPeriod (SessionPeriod.CLOSED outside trading minutes)
+    def session_of(self, type_instrument: InstrumentType, index: pd.DatetimeIndex) -> np.ndarray:
+        trading_day, in_working_hours, on_break, time_of_day, positions = self._masks(
+            type_instrument, to_epoch_minutes(index)
+        )
+        schedule = self._schedules[type_instrument]
+
+        in_session = ((time_of_day[:, None] >= schedule.session_start[positions])
+                      & (time_of_day[:, None] < schedule.session_end[positions]))
+
+        session_codes = np.array([session.value for session in SESSIONS], dtype=np.int8)
+
+        sessions = np.where(in_session.any(axis=1),
+                            session_codes[in_session.argmax(axis=1)],
+                            np.int8(SessionPeriod.CLOSED.value))
+
+        return np.where(trading_day & in_working_hours & ~on_break, sessions, np.int8(SessionPeriod.CLOSED.value))
+
+    # whether the time of day falls into one of the sessions scheduled for that day (trading or not)
+    def in_sessions(
+            self,
+            type_instrument: InstrumentType,
+            index: pd.DatetimeIndex,
+            sessions: list[SessionPeriod]
+    ) -> np.ndarray:
+        time_of_day, positions, known_day = self._locate(to_epoch_minutes(index))
+        schedule = self._schedules[type_instrument]
+
+        columns = [SESSIONS.index(session) for session in sessions]
+
+        if len(columns) == 0:
+            return np.zeros(time_of_day.shape, dtype=bool)
+
+        return known_day & ((time_of_day[:, None] >= schedule.session_start[positions][:, columns])
+                            & (time_of_day[:, None] < schedule.session_end[positions][:, columns])).any(axis=1)
+
+    # grid of epoch minutes of working hours without breaks of the given (sorted) epoch days,
+    # together with the position of the day of each minute in days
+    def day_grid(self, type_instrument: InstrumentType, days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        positions = self._positions(days)
+        known_day = positions >= 0
+        positions = np.where(known_day, positions, 0)
+        schedule = self._schedules[type_instrument]
+
+        day_length = np.where(known_day, schedule.close[positions] - schedule.open[positions], 0)
+        day_idx = np.repeat(np.arange(len(days)), day_length)
+
+        time_of_day = (np.arange(day_idx.shape[0])
+                       - np.repeat(np.cumsum(day_length) - day_length, day_length)
+                       + schedule.open[positions][day_idx])
+
+        on_break = ((time_of_day[:, None] >= schedule.break_start[positions][day_idx])
+                    & (time_of_day[:, None] < schedule.break_end[positions][day_idx])).any(axis=1)
+
+        grid = days[day_idx] * MINUTES_IN_DAY + time_of_day
+
+        return grid[~on_break], day_idx[~on_break]
+
+    # index in SESSIONS of the session at the minute of the day at the position (None outside sessions),
+    # together with the exchange_closed and on_break flags
+    @staticmethod
+    def _session_at(schedule: DaySchedule, position: int, time_of_day: int) -> tuple[bool, bool, int]:
+        if position < 0 or not schedule.trading_day.item(position):
+            return True, False, None
+
+        exchange_closed = not (schedule.open.item(position) <= time_of_day < schedule.close.item(position))
+        on_break = any(start <= time_of_day < end for start, end in zip(schedule.break_start[position].tolist(),
+                                                                        schedule.break_end[position].tolist()))
+
+        if exchange_closed or on_break:
+            return exchange_closed, on_break, None
+
+        for i in range(len(SESSIONS)):
+            if schedule.session_start.item(position, i) <= time_of_day < schedule.session_end.item(position, i):
+                return False, False, i
+
+        return False, False, None
+
+    def schedule_at(self, type_instrument: InstrumentType, date_query: datetime) -> MinuteSchedule:
+        day, time_of_day = divmod(int((date_query - EPOCH).total_seconds() // 60), MINUTES_IN_DAY)
+
+        if day >= self._last_day:
+            self._compile(day + 366)
+
+        schedule = self._schedules[type_instrument]
+        position = day - self._first_day
+
+        exchange_closed, on_break, i = self._session_at(schedule, position, time_of_day)
+
+        if i is None:
+            return MinuteSchedule(exchange_closed=exchange_closed, on_break=on_break, session=SessionPeriod.CLOSED)
+
+        day_start = EPOCH + timedelta(days=day)
+
+        return MinuteSchedule(
+            exchange_closed=False,
+            on_break=False,
+            session=SESSIONS[i],
+            session_start=day_start + timedelta(minutes=schedule.session_start.item(position, i)),
+            session_end=day_start + timedelta(minutes=schedule.session_end.item(position, i)),
+            opening=schedule.session_opening.item(position, i),
+            closing=schedule.session_closing.item(position, i)
+        )
+
+    # first minute after date_query in which one of the types of instruments is in a session,
+    # None if there is no such minute within max_days days
+    def next_session_minute(
+            self,
+            types_instruments: list[InstrumentType],
+            date_query: datetime,
+            max_days: int = 366
+    ) -> Optional[datetime]:
+        day, time_of_day = divmod(int((date_query - EPOCH).total_seconds() // 60) + 1, MINUTES_IN_DAY)
+
+        for day in range(day, day + max_days):
+            if day >= self._last_day:
+                self._compile(day + 366)
+
+            position = day - self._first_day
+            first_minute = None
+
+            for type_instrument in types_instruments:
+                schedule = self._schedules[type_instrument]
+
+                if position < 0 or not schedule.trading_day.item(position):
+                    continue
+
+                # a session interval can only start at one of these minutes
+                candidates = ([time_of_day, schedule.open.item(position)]
+                              + schedule.break_end[position].tolist()
+                              + schedule.session_start[position].tolist())
+
+                for candidate in sorted(set(candidates)):
+                    if candidate < time_of_day or (first_minute is not None and candidate >= first_minute):
+                        continue
+
+                    if self._session_at(schedule, position, candidate)[2] is not None:
+                        first_minute = candidate
+                        break
+
+            if first_minute is not None:
+                return EPOCH + timedelta(days=day, minutes=first_minute)
+
+            time_of_day = 0
+
+        return None
@@ -1,18 +1,24 @@
 from abc import ABC, abstractmethod
 from typing_extensions import Self
-from typing import Callable, Optional
+from typing import Callable, Optional, Iterator, Union
 from decimal import Decimal
 from engine.schemas.enums import OrderExecutionReportStatus, OrderDirection, OrderType
 from engine.schemas.datatypes import Period, Ticker, Broker
 from engine.transformers.candles_processing import CandlesRefinerTransformer
 from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.metrics import Metrics
 from dataclasses import dataclass
 from datetime import datetime
+from threading import Event, Lock
+from collections import defaultdict
 import pandas as pd
 
 
 class Client(ABC):
     broker: 'Broker'
+    # orders posted, cancelled or requested at once, and whether the states of the orders come from a stream
+    order_threads: int = 1
+    stream_order_states: bool = False
 
     def __init__(self, *args, **kwargs):
 
@@ -70,6 +76,11 @@ class Services(ABC):
 
     broker: 'Broker'
 
+    # the market data stream the candles and the top of book are taken from instead of requests
+    candles_stream: 'CandlesStream' = None
+    # strategies running concurrently take the candles of a ticker one at a time
+    _candles_locks = defaultdict(Lock)
+
     @abstractmethod
     def get_instruments(self):
         pass
@@ -83,23 +94,58 @@ class Services(ABC):
     ):
         pass
 
+    # candles of a single request, its errors are raised to the caller
+    @abstractmethod
+    def _candles_window(
+            self,
+            uid: str,
+            from_: datetime,
+            to: datetime
+    ) -> pd.DataFrame:
+        pass
+
+    # the rate limit reported with an error of a request, None if the error is not about the rate limit
+    @staticmethod
+    def rate_limit(error: Exception) -> Optional['RateLimit']:
+        return None
+
+    # completed 1-minute candles and the top of book of the instruments from a stream, until stop is set;
+    # the subscription is made by the call, so that the candles before it can be requested afterwards
+    @abstractmethod
+    def market_data_events(
+            self,
+            uids: list[str],
+            stop: Event
+    ) -> Iterator[Union['Candle', 'GetOrderBookResponse']]:
+        pass
+
+    # states of the orders of the account from a stream, until stop is set; None stands for a response
+    # without a state, the first response confirms the subscription; it is subscribed to if the client
+    # has stream_order_states
+    @abstractmethod
+    def order_state_events(
+            self,
+            account_id: str,
+            stop: Event
+    ) -> Iterator[Optional['OrderState']]:
+        pass
+
     def get_candles(
             self,
             ticker: 'Ticker',
             start_date: Optional[datetime] = None
     ) -> bool:
-        last_cached_candle = LocalCandlesUploader.get_last_candle(ticker)
-
-        if last_cached_candle is not None:
-            last_cached_candle = last_cached_candle.copy()
-
-            last_day_number = last_cached_candle.iloc[0]['day_number']
+        with Metrics.span('candles_fetch'), self._candles_locks[ticker.uid]:
+            if self.candles_stream is not None and ticker.uid in self.candles_stream.tickers.keys():
+                return self.candles_stream.get_candles(ticker)
 
-            del last_cached_candle['day_number']
-            last_cached_candle = last_cached_candle.reset_index()
-        else:
-            last_day_number = 0
+            return self._request_candles(ticker, start_date)
 
+    def _request_candles(
+            self,
+            ticker: 'Ticker',
+            start_date: Optional[datetime] = None
+    ) -> bool:
         if start_date is None:
             start_date = LocalCandlesUploader.get_new_candle_datetime(ticker)
 
@@ -114,24 +160,35 @@ class Services(ABC):
             from_=start_date
         )
 
+        return self._save_candles(ticker, new_candles, candles_request_date)
+
+    # raw candles after the last cached candle are refined from it on and kept in memory
+    def _save_candles(
+            self,
+            ticker: 'Ticker',
+            new_candles: pd.DataFrame,
+            candles_request_date: datetime
+    ) -> bool:
+        last_cached_candle = LocalCandlesUploader.get_last_candle(ticker)
+
+        # the refiner continues from the last cached candle
         if last_cached_candle is not None:
-            if len(new_candles) > 0:
-                new_candles = pd.concat([last_cached_candle, new_candles])
-            else:
-                new_candles = last_cached_candle
-        elif new_candles.shape[0] == 0:
+            state = {
+                'candle': last_cached_candle.drop(columns='day_number').reset_index(),
+                'day_number': last_cached_candle.iloc[0]['day_number']
+            }
+        else:
+            state = None
+
+        if state is None and new_candles.shape[0] == 0:
             # no data whatsoever on this ticker
             return False
 
-        new_candles = CandlesRefinerTransformer(
+        new_candles, _ = CandlesRefinerTransformer(
             broker=self.broker,
             ticker=ticker,
-            candles_request_date=candles_request_date,
-            last_day_number=last_day_number
-        ).fit_transform(new_candles)
-
-        if last_cached_candle is not None:
-            new_candles = new_candles.iloc[1:]
+            candles_request_date=candles_request_date
+        ).fit(new_candles).partial_transform(new_candles, state)
 
         if new_candles.shape[0] != 0:
             LocalCandlesUploader.save_new_candles(new_candles, ticker)
@@ -141,6 +198,13 @@ class Services(ABC):
             return False
 
 
+@dataclass
+class RateLimit:
+    # requests per minute, requests left in the current minute and seconds until the limit resets
+    limit: Optional[int]
+    remaining: Optional[int]
+    reset: float
+
 
 # instruments service
 
@@ -208,6 +272,17 @@ class MarketDataStreamService(ABC):
         pass
 
 
+@dataclass
+class Candle:
+    instrument_uid: str
+    time: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+
+
 # operations service
 
 
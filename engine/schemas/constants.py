@@ -4,3 +4,4 @@ candle_path = os.getcwd().replace("\\", "/")  + '/data/candles/'
 instrument_path = os.getcwd().replace("\\", "/")  + '/data/instruments/'
 log_path = os.getcwd().replace("\\", "/")  + '/data/logs/'
 model_path = os.getcwd().replace("\\", "/")  + '/data/models/'
+feature_path = os.getcwd().replace("\\", "/")  + '/data/features/'
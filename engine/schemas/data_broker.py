@@ -1,16 +1,24 @@
 from engine.schemas.datatypes import Ticker
 from engine.candles.candles_uploader import LocalCandlesUploader
 from engine.transformers.candles_processing import RemoveSession
+from engine.transformers.streaming import partial_transform
+from engine.schemas.feature_cache import FeatureCache
+from engine.schemas.frame_buffer import FrameBuffer
+from engine.schemas.constants import model_path
+from engine.metrics import Metrics
 import pandas as pd
+import numpy as np
 from datetime import datetime, timezone
+from threading import Lock
 import os
 import joblib
 import copy
 
 
 class Pipeline:
-    nodes: dict[Ticker, list['DataNode']] = {}
-    optimized: dict[str, bool] = {}
+    # nodes interned by (ticker, key of the parent node, repr of the transformer), roots by the session filter
+    # and the end date, so that pipelines built from the same steps share their nodes and the data computed by them
+    nodes: dict[tuple, 'DataNode'] = {}
 
     def __init__(self,
                  ticker: Ticker,
@@ -24,33 +32,23 @@ class Pipeline:
         self.fit_date: datetime = None
         self.next_cached_model_date: datetime = None
         self.remove_session = remove_session
-
-        if self.ticker not in self.nodes.keys():
-            self.nodes[self.ticker] = []
-
-        self.optimized[self.ticker] = False
+        self.fit_scores: list[float] = None
+        self.fit_traces: list[list[float]] = None
+        self.fit_abandoned: list[int] = None
 
     def make_pipeline(
             self,
             steps: list,
             end_date: datetime = datetime.now(tz=timezone.utc)
     ):
-        parent_node = DataNode(ticker=self.ticker, remove_session=self.remove_session)
-        self.nodes[self.ticker].append(parent_node)
         self.end_date = end_date.replace(tzinfo=timezone.utc)
+        parent_node = self.intern_node(self.ticker, remove_session=self.remove_session, end_date=self.end_date)
 
         for idx, step in enumerate(steps):
             if (idx == len(steps) - 1) and (not hasattr(step, 'transform')):
                 self.model = step
             else:
-                new_node = DataNode(
-                    ticker=self.ticker,
-                    transformer=step,
-                    parent=parent_node
-                )
-
-                parent_node.children.append(new_node)
-                parent_node = new_node
+                parent_node = self.intern_node(self.ticker, transformer=step, parent=parent_node)
 
                 if self.data_name == '':
                     self.data_name += repr(step)
@@ -59,16 +57,44 @@ class Pipeline:
 
         self.final_datanodes = [parent_node]
         parent_node.data_broker.append(self)
-        self.optimized[self.ticker] = False
 
         return self
 
+    @classmethod
+    def intern_node(
+            cls,
+            ticker: Ticker,
+            transformer=None,
+            parent: 'DataNode' = None,
+            remove_session: list[str] = None,
+            end_date: datetime = None
+    ) -> 'DataNode':
+        if parent is None:
+            key = (ticker, None, None if remove_session is None else tuple(remove_session), end_date)
+        else:
+            key = (ticker, parent.key, repr(transformer))
+
+        node = cls.nodes.get(key)
+
+        if node is None:
+            node = DataNode(ticker=ticker, transformer=transformer, parent=parent, remove_session=remove_session)
+            node.key = key
+            cls.nodes[key] = node
+
+            if parent is not None:
+                parent.children.append(node)
+
+        return node
+
+    # the nodes of the pipelines built so far are no longer shared with the pipelines built from now on
+    @classmethod
+    def clear(cls):
+        cls.nodes = {}
+
     def compute(self, fit_date: datetime = None, end_date: datetime = None):
         if end_date is None:
             end_date = self.end_date
 
-        self._optimize()
-
         new_data = []
 
         for final_datanode in self.final_datanodes:
@@ -91,33 +117,88 @@ class Pipeline:
 
         return
 
-    def fit(self, tries=1, show_score=False, **kwargs):
+    # restarts are fitted in a joblib pool with seeds drawn from seed (the random_state of the model by default),
+    # the data array is memory-mapped by joblib once for all workers; with abandon_after set, every restart
+    # first runs abandon_after EM iterations and only restarts within abandon_margin of the best score continue;
+    # verbose prints the score of every restart
+    def fit(
+            self,
+            tries=1,
+            verbose=False,
+            n_jobs=-1,
+            seed=None,
+            abandon_after: int = None,
+            abandon_margin: float = 0,
+            **kwargs
+    ):
         data = self.compute()
         self.fit_date = data.index[-1]
+        X = data.to_numpy()
+
+        if seed is None:
+            seed = getattr(self.model, 'random_state', None)
 
-        models = [self.model]
-        if tries > 1:
-            models += [copy.deepcopy(self.model) for _ in range(tries - 1)]
+        seeds = np.random.SeedSequence(seed).generate_state(tries).tolist()
+        models = [self.model] + [copy.deepcopy(self.model) for _ in range(tries - 1)]
 
-        scores = []
+        for model, model_seed in zip(models, seeds):
+            if hasattr(model, 'random_state') and (tries > 1 or model.random_state is None):
+                model.random_state = model_seed
 
-        for i, model in enumerate(models):
-            model.fit(data.to_numpy(), **kwargs)
-            score = model.score(data.to_numpy(), **kwargs)
+        scores = [None] * tries
+        # restarts fitted to the end (converged or out of iterations) and restarts given up on
+        complete, abandoned = [], []
+        active = list(range(tries))
 
-            if show_score:
-                print(f'[{i}] Score: {score}')
+        with joblib.Parallel(n_jobs=n_jobs if tries > 1 else 1) as parallel:
+            if abandon_after is not None:
+                fitted = parallel(joblib.delayed(fit_restart)(
+                    models[i], X, n_iter=abandon_after, partial=True, **kwargs
+                ) for i in active)
 
-            scores.append(score)
+                for i, (model, score) in zip(active, fitted):
+                    models[i], scores[i] = model, score
 
-        self.model = models[scores.index(max(scores))]
+                best_score = max(scores)
+                remaining_iter = self.model.n_iter - abandon_after
+
+                complete = [i for i in active if models[i].converged() or remaining_iter <= 0]
+                abandoned = [i for i in active if i not in complete and scores[i] < best_score - abandon_margin]
+                active = [i for i in active if i not in complete and i not in abandoned]
+
+                kwargs |= {'n_iter': remaining_iter, 'resume': True}
+
+            if len(active) > 0:
+                fitted = parallel(joblib.delayed(fit_restart)(models[i], X, **kwargs) for i in active)
+
+                for i, (model, score) in zip(active, fitted):
+                    models[i], scores[i] = model, score
+
+        complete += active
+
+        if verbose:
+            for i in range(tries):
+                print(f'[{i}] Score: {scores[i]}' + (' (abandoned)' if i in abandoned else ''))
+
+        best = max(complete, key=lambda i: scores[i])
+
+        self.model = models[best]
+        self.fit_scores = scores
+        self.fit_traces = [getattr(model, 'fit_trace', []) for model in models]
+        self.fit_abandoned = abandoned
+
+        if abandon_after is not None and best not in active:
+            self.model.init_filter(X)
 
         return self
 
-    def save_model(self, path):
+    def save_model(self, path=None):
         if self.model is None:
             raise ValueError('No model is specified.')
 
+        if path is None:
+            path = self.model_dir()
+
         if not os.path.isdir(path):
             os.makedirs(path)
 
@@ -131,10 +212,21 @@ class Pipeline:
 
         joblib.dump(data_list, path)
 
-    def load_model(self, path, load_data=False):
+    def model_dir(self) -> str:
+        return model_path + f'{self.ticker.ticker_sign}/'
+
+    def load_model(self, path=None, load_data=False):
+        return self.load_fitted(path).catch_up(load_data)
+
+    # the model and the transformers of the latest file fitted before the end date,
+    # the data is computed by catch_up, so that GraphExecutor can compute the data of several pipelines in between
+    def load_fitted(self, path=None):
+        if path is None:
+            path = self.model_dir()
+
         pickled_models = []
 
-        for model in os.listdir(path):
+        for model in sorted(os.listdir(path)):
             pickled_models.append(path + model)
 
         latest_model = None
@@ -162,9 +254,13 @@ class Pipeline:
         else:
             self.model.load_model(data_list['model'])
 
-        for i, final_datanode in self.final_datanodes:
+        for i, final_datanode in enumerate(self.final_datanodes):
             final_datanode.load_model(data_list[i])
 
+        return self
+
+    # the model is brought from the fit date to the end date
+    def catch_up(self, load_data=False):
         if load_data:
             data = self.compute(end_date=self.end_date)
 
@@ -187,59 +283,91 @@ class Pipeline:
         else:
             return False
 
-    def update(self, new_date: datetime):
+    # with update_model=False the new data is only returned, so that the models of several pipelines
+    # can be updated at once by batch_update
+    def update(self, new_date: datetime, update_model: bool = True):
         new_data = []
 
-        for final_datanode in self.final_datanodes:
-            new_data.append(final_datanode.update(new_date))
+        with Metrics.span('transform'):
+            for final_datanode in self.final_datanodes:
+                new_data.append(final_datanode.update(new_date))
 
-        new_data = pd.concat(new_data, axis=1)
+            new_data = pd.concat(new_data, axis=1)
 
-        if len(new_data) > 0:
-            self.model.update(new_data)
+        if update_model and len(new_data) > 0:
+            with Metrics.span('model_update'):
+                self.model.update(new_data)
 
         self.end_date = new_date
 
+        return new_data
+
     def cache_new_data(self):
         for final_datanode in self.final_datanodes:
             final_datanode.cache_new_data()
 
-    def _optimize(self):
-        if self.optimized[self.ticker]:
-            return
 
-        parent_nodes = Pipeline.nodes[self.ticker]
-        children_nodes = []
+def fit_restart(model, X, **kwargs):
+    model.fit(X, **kwargs)
+
+    return model, model.score(X)
+
+
+# output of a transformer over the data of the parent node, the transformer afterwards and the state of its
+# partial_transform, a module-level function so that GraphExecutor can run it in a process; with a feature cache,
+# a fitted transformer continues from the latest cached output and state by transforming only the rows the parent
+# got since then, as in DataNode.update, and a transformer still to be fitted reuses only an output computed
+# to the same end date; an output of other parent rows than the first ones of the parent data is computed again;
+# state continues the transformer from the end of the data it was fitted on
+def transform_node(
+        transformer,
+        parent_data: pd.DataFrame,
+        fitted: bool,
+        ticker: Ticker,
+        chain: str,
+        fit_date: datetime = None,
+        end_date: datetime = None,
+        feature_cache: FeatureCache = None,
+        state=None
+):
+    if len(parent_data) == 0:
+        return pd.DataFrame(), transformer, fitted, state
+
+    if feature_cache is None:
+        if not fitted:
+            transformer.fit(parent_data)
+
+        data, state = partial_transform(transformer, parent_data, state)
 
-        while parent_nodes:
-            for idx, node in enumerate(parent_nodes):
-                children_nodes.extend(node.children)
+        return data, transformer, True, state
 
-                for j, same_node in enumerate(parent_nodes[idx + 1:]):
-                    if same_node == node:
-                        if node.data is None and same_node.data is not None:
-                            node.data = same_node.data
+    key = feature_cache.key(chain, fit_date, transformer, state)
+    cached = feature_cache.read(ticker, key, end_date, exact=not fitted)
 
-                        for child in same_node.children:
-                            child.parent = node
-                            node.children.append(child)
+    if cached is not None and not feature_cache.continues(cached[3], parent_data):
+        cached = None
 
-                        for data_broker in same_node.data_broker:
-                            data_broker.final_datanodes = node
+    if cached is None:
+        if not fitted:
+            transformer.fit(parent_data)
 
-                        node.data_broker.extend(same_node.data_broker)
+        data, state = partial_transform(transformer, parent_data, state)
+    else:
+        data, transformer, state, entry = cached
 
-                        del parent_nodes[idx + 1 + j]
-                        idx -= 1
-                        j -= 1
+        if len(parent_data) > entry['n_parent_rows']:
+            new_data, state = partial_transform(transformer, parent_data.iloc[entry['n_parent_rows']:], state)
+            data = pd.concat([data, new_data])
 
-            parent_nodes = children_nodes
-            children_nodes = []
+    feature_cache.write(ticker, key, end_date, data, transformer, state, parent_data)
 
-        self.optimized[self.ticker] = True
+    return data, transformer, True, state
 
 
 class DataNode:
+    # outputs of the transformers are kept on disk between runs when a cache is set
+    feature_cache: FeatureCache = None
+
     def __init__(
             self,
             ticker: Ticker,
@@ -250,18 +378,27 @@ class DataNode:
         self.ticker = ticker
         self.transformer = transformer
         self.parent = parent
+        # the key of the node in Pipeline.nodes
+        self.key: tuple = None
         self.end_date = None
         self.children = []
         self.data = None
-        self.new_data = []
+        # the data followed by the new data of the updates, created by the first update
+        self.buffer: FrameBuffer = None
+        # rows of the candle buffer of the ticker taken by the root node
         self.n_of_new_data_processed = 0
         self.data_broker = []
         self.remove_session = remove_session
+        self.last_update: tuple[datetime, list] = None
+        # the state of partial_transform of the transformer after the last row of the data
+        self.state = None
+        # pipelines of strategies running concurrently may share the node
+        self._lock = Lock()
 
         self.fitted = False
 
         if self.transformer is not None:
-            self.name = self.transformer.name
+            self.name = getattr(self.transformer, 'name', type(self.transformer).__name__)
         else:
             self.name = 'Candles'
 
@@ -273,16 +410,16 @@ class DataNode:
             if self.parent.data is None:
                 self.parent.compute(fit_date=fit_date, end_date=end_date)
 
-            if len(self.parent.data) == 0:
-                self.data = pd.DataFrame()
-            elif (self.data is None) and (not self.fitted):
-                self.data = self.transformer.fit_transform(self.parent.data)
-                self.fitted = True
-            elif self.data is None:
-                self.data = self.transformer.transform(self.parent.data)
+            if self.data is None:
+                self.data, self.transformer, self.fitted, self.state = transform_node(
+                    self.transformer, self.parent.data, self.fitted, self.ticker, self.chain(),
+                    fit_date=fit_date, end_date=end_date, feature_cache=self.feature_cache,
+                    state=self.resume_state(fit_date)
+                )
         else:
             if self.data is None:
                 self.data = LocalCandlesUploader.upload_candles(self.ticker)
+                self.n_of_new_data_processed = len(self.data)
 
                 if fit_date is None:
                     self.data = self.data[self.data.index <= end_date]
@@ -296,38 +433,70 @@ class DataNode:
                         remove_session=self.remove_session
                     ).fit_transform(self.data)
 
+        return self.data
+
+    # the data after the fit date continues from the state saved with the model,
+    # the data from the start of the candles is transformed from scratch
+    def resume_state(self, fit_date: datetime = None):
+        return self.state if fit_date is not None else None
+
+    # reprs of the nodes from the candles to this node
+    def chain(self) -> str:
+        if self.parent is not None:
+            return self.parent.chain() + '__' + repr(self)
+        elif self.remove_session is not None:
+            return repr(self) + f'(remove_session={self.remove_session})'
+        else:
+            return repr(self)
+
+    # a node shared by several pipelines is advanced once per date, the other pipelines get the same new data
     def update(self, new_date: datetime):
-        self.end_date = new_date
+        with self._lock:
+            if self.last_update is not None and self.last_update[0] == new_date:
+                return self.last_update[1]
 
-        if self.parent is None:
-            num_of_new_candle_batches = len(LocalCandlesUploader.new_candles[self.ticker])\
-                                        - self.n_of_new_data_processed
+            self.end_date = new_date
 
-            self.n_of_new_data_processed += num_of_new_candle_batches
+            if self.parent is None:
+                new_data = LocalCandlesUploader.get_new_candles(self.ticker, self.n_of_new_data_processed)
+                self.n_of_new_data_processed += len(new_data)
 
-            if num_of_new_candle_batches > 0:
-                new_data = LocalCandlesUploader.new_candles[self.ticker][-num_of_new_candle_batches:]
+                if len(new_data) > 0 and self.remove_session is not None:
+                    new_data = RemoveSession(
+                        broker=LocalCandlesUploader.broker,
+                        ticker=self.ticker,
+                        remove_session=self.remove_session
+                    ).fit_transform(new_data)
             else:
-                new_data = []
-        else:
-            new_parent_data = self.parent.update(new_date)
+                new_parent_data = self.parent.update(new_date)
 
-            if len(new_parent_data) == 0:
-                return []
+                if len(new_parent_data) == 0:
+                    new_data = []
+                else:
+                    new_data, self.state = partial_transform(self.transformer, new_parent_data, self.state)
+
+            if len(new_data) > 0:
+                if self.buffer is None:
+                    self.buffer = FrameBuffer(self.data)
 
-            new_data = self.transformer.transform(new_parent_data)
-            self.new_data.append(new_data)
+                self.buffer.append(new_data)
 
-        return new_data
+            self.last_update = (new_date, new_data)
 
+            return new_data
+
+    # the new data of the node and its parents becomes a part of their data without copying it
     def cache_new_data(self):
-        self.data = pd.concat([self.data] + self.new_data)
-        self.n_of_new_data_processed = 0
-        self.new_data = []
+        if self.buffer is not None:
+            self.data = self.buffer.compact()
+
+        if self.parent is not None:
+            self.parent.cache_new_data()
 
+    # the state is the one after the data the model was fitted on, the pipelines are saved right after the fit
     def save_model(self, data_list):
         if self.parent is not None:
-            data_list.append({'transformer': self.transformer.save_model(), 'fitted': self.fitted})
+            data_list.append({'transformer': self.transformer.save_model(), 'fitted': self.fitted, 'state': self.state})
             self.parent.save_model(data_list)
 
     def load_model(self, data_list):
@@ -335,9 +504,11 @@ class DataNode:
             if isinstance(data_list[0], dict) and ('fitted' in data_list[0].keys()):
                 transformer = data_list[0]['transformer']
                 fitted = data_list[0]['fitted']
+                state = data_list[0].get('state')
             else:
                 transformer = data_list[0]
                 fitted = True
+                state = None
 
             if isinstance(transformer, type(self.transformer)):
                 self.transformer = transformer
@@ -346,14 +517,11 @@ class DataNode:
 
             self.fitted = fitted
 
-            self.parent.load_model(data_list[1:])
+            # a node shared with a pipeline that has already computed it keeps the state of its data
+            if self.data is None:
+                self.state = state
 
-    def __eq__(self, other: 'DataNode'):
-        return ((repr(self.transformer) == repr(other.transformer))
-                and (self.parent == other.parent)
-                and (self.ticker == other.ticker)
-                and (self.end_date == other.end_date)
-                )
+            self.parent.load_model(data_list[1:])
 
     def __repr__(self):
         if self.transformer is None:
@@ -2,6 +2,7 @@ from abc import ABC, abstractmethod
 from datetime import datetime, timedelta, timezone, date
 from dataclasses import dataclass
 import os
+import numpy as np
 import pandas as pd
 from engine.schemas.enums import InstrumentType
 from engine.schemas.constants import candle_path
@@ -47,6 +48,17 @@ class Ticker(ABC):
         return hash((self.uid, self.ticker_sign))
 
 
+# ----------------- conversions between timestamps and int64 minutes since the epoch
+
+def to_epoch_minutes(index) -> np.ndarray:
+    # tz-aware indices are stored in UTC, so .values is already in UTC
+    return pd.DatetimeIndex(index).values.astype('datetime64[m]').astype(np.int64)
+
+
+def from_epoch_minutes(minutes) -> pd.DatetimeIndex:
+    return pd.to_datetime(np.asarray(minutes, dtype=np.int64), unit='m', utc=True)
+
+
 # ----------------- data structures for schedules of exchanges-related information
 
 def infer_start_and_end_date(date_query, interval_info: dict):
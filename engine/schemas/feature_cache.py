@@ -0,0 +1,200 @@
+import numpy as np
+from typing import Union
+import pandas as pd
+from engine.schemas.constants import feature_path
+from engine.schemas.datatypes import Ticker
+from datetime import datetime
+import hashlib
+import tempfile
+import joblib
+import shutil
+import json
+import os
+
+
+# a frame is written as index.npy and one (columns, rows) .npy file per dtype, which pandas keeps as a block,
+# so that it is read back as views of memory-mapped files; the layout is kept in frame.json, a series is written
+# as a frame of one column
+def write_frame(df: Union[pd.DataFrame, pd.Series], path: str):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    layout = {'blocks': {}, 'index_name': df.index.name, 'tz': None, 'series': isinstance(df, pd.Series)}
+
+    if layout['series']:
+        layout['name'] = df.name
+        df = df.to_frame(name='values')
+
+    layout['columns'] = list(df.columns)
+
+    if isinstance(df.index, pd.DatetimeIndex):
+        layout['tz'] = str(df.index.tz) if df.index.tz is not None else None
+        np.save(path + 'index.npy', df.index.values)
+    else:
+        np.save(path + 'index.npy', np.asarray(df.index))
+
+    for dtype, block_columns in df.columns.groupby(df.dtypes).items():
+        layout['blocks'][str(dtype)] = list(block_columns)
+
+        np.save(path + f'{dtype}.npy', np.ascontiguousarray(df[list(block_columns)].to_numpy().T))
+
+    with open(path + 'frame.json', 'w') as layout_file:
+        json.dump(layout, layout_file)
+
+
+def read_frame(path: str, mmap_mode: str = 'r') -> pd.DataFrame:
+    with open(path + 'frame.json') as layout_file:
+        layout = json.load(layout_file)
+
+    index = np.load(path + 'index.npy', mmap_mode=mmap_mode)
+
+    if np.issubdtype(index.dtype, np.datetime64):
+        index = pd.DatetimeIndex(index)
+
+        if layout['tz'] is not None:
+            index = index.tz_localize('UTC').tz_convert(layout['tz'])
+    else:
+        index = pd.Index(index)
+
+    index.name = layout['index_name']
+
+    if len(layout['blocks']) == 0:
+        df = pd.DataFrame(index=index, columns=layout['columns'])
+    else:
+        df = pd.concat([
+            pd.DataFrame(np.load(path + f'{dtype}.npy', mmap_mode=mmap_mode).T,
+                         index=index, columns=block_columns, copy=False)
+            for dtype, block_columns in layout['blocks'].items()
+        ], axis=1)[layout['columns']]
+
+    if layout.get('series', False):
+        return df['values'].rename(layout['name'])
+
+    return df
+
+
+# outputs of DataNodes kept on disk between runs: <path>/<ticker>/<key>/<end minute>/ holds the frame,
+# the transformer and the state of its partial_transform pickled after the computation and the parent data
+# it was computed from, by its number of rows, first and last dates and a hash of the rows;
+# the key is made of the repr chain of the node, the start of the data and the transformer and its state before
+# the computation, so that an entry is reused only by the same computation, and continued only by rows appended
+# to the same parent data
+class FeatureCache:
+    def __init__(self, path: str = feature_path, keep_last: int = 2):
+        self.path = path
+        self.keep_last = keep_last
+
+    @staticmethod
+    def key(chain: str, fit_date: datetime, transformer, state=None) -> str:
+        return hashlib.blake2b(
+            f'{chain}|{fit_date}|{joblib.hash((transformer, state))}'.encode(),
+            digest_size=16
+        ).hexdigest()
+
+    @staticmethod
+    def parent_entry(parent_data: pd.DataFrame, n_rows: int = None) -> dict:
+        prefix = parent_data if n_rows is None else parent_data.iloc[:n_rows]
+
+        return {
+            'n_parent_rows': len(prefix),
+            'parent_first': str(prefix.index[0]) if len(prefix) > 0 else None,
+            'parent_last': str(prefix.index[-1]) if len(prefix) > 0 else None,
+            'parent_hash': hashlib.blake2b(
+                pd.util.hash_pandas_object(prefix).to_numpy().tobytes(),
+                digest_size=16
+            ).hexdigest()
+        }
+
+    # whether the parent data starts with the rows an entry was computed from, e.g. candles backfilled before
+    # the first ones or a refined day changed afterwards make the entry stale; the dates are compared before
+    # the rows are hashed
+    @staticmethod
+    def continues(entry: dict, parent_data: pd.DataFrame) -> bool:
+        n_rows = entry['n_parent_rows']
+
+        if 'parent_hash' not in entry.keys() or len(parent_data) < n_rows:
+            return False
+
+        if n_rows > 0 and (str(parent_data.index[0]) != entry['parent_first']
+                           or str(parent_data.index[n_rows - 1]) != entry['parent_last']):
+            return False
+
+        return FeatureCache.parent_entry(parent_data, n_rows) == entry
+
+    def _key_path(self, ticker: Ticker, key: str) -> str:
+        return self.path + f'{ticker.ticker_sign}/{key}/'
+
+    @staticmethod
+    def _end_minute(end_date: datetime) -> int:
+        return int(end_date.timestamp() // 60)
+
+    def _entries(self, key_path: str) -> list[int]:
+        if not os.path.isdir(key_path):
+            return []
+
+        return sorted([int(entry) for entry in os.listdir(key_path) if entry.isdigit()])
+
+    # the latest entry computed up to end_date, or exactly to end_date
+    def read(self, ticker: Ticker, key: str, end_date: datetime, exact: bool = False):
+        key_path = self._key_path(ticker, key)
+        end_minute = self._end_minute(end_date)
+
+        entries = [entry for entry in self._entries(key_path)
+                   if (entry == end_minute if exact else entry <= end_minute)]
+
+        if len(entries) == 0:
+            return None
+
+        entry_path = key_path + f'{entries[-1]}/'
+
+        # entries written before the states were kept cannot be continued
+        if not os.path.isfile(entry_path + 'state.pkl'):
+            return None
+
+        with open(entry_path + 'entry.json') as entry_file:
+            entry = json.load(entry_file)
+
+        return (read_frame(entry_path), joblib.load(entry_path + 'transformer.pkl'),
+                joblib.load(entry_path + 'state.pkl'), entry)
+
+    def write(
+            self,
+            ticker: Ticker,
+            key: str,
+            end_date: datetime,
+            data: pd.DataFrame,
+            transformer,
+            state,
+            parent_data: pd.DataFrame
+    ):
+        key_path = self._key_path(ticker, key)
+        entry_path = key_path + f'{self._end_minute(end_date)}/'
+
+        # only numeric frames can be memory-mapped
+        dtypes = [data.dtype] if isinstance(data, pd.Series) else data.dtypes
+
+        if os.path.isdir(entry_path) or not all([pd.api.types.is_numeric_dtype(dtype) for dtype in dtypes]):
+            return
+
+        os.makedirs(key_path, exist_ok=True)
+
+        # the entry is written aside and renamed, processes computing the same features do not see partial entries
+        temp_path = tempfile.mkdtemp(dir=key_path).replace("\\", "/") + '/'
+
+        try:
+            write_frame(data, temp_path)
+            joblib.dump(transformer, temp_path + 'transformer.pkl')
+            joblib.dump(state, temp_path + 'state.pkl')
+
+            with open(temp_path + 'entry.json', 'w') as entry_file:
+                json.dump(self.parent_entry(parent_data), entry_file)
+
+            try:
+                os.rename(temp_path, entry_path)
+            except OSError:
+                pass
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+        for entry in self._entries(key_path)[:-self.keep_last]:
+            shutil.rmtree(key_path + f'{entry}/', ignore_errors=True)
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from typing import Union
+
+
+# rows of a table appended in place: the index and the columns of every dtype are kept in preallocated
+# (rows, columns) arrays, which double when full, so that an append costs amortized O(rows appended)
+# and frame() returns views of the arrays instead of copies; the first n_compacted rows are the history
+# and the rows after them are new, compact() makes the new rows a part of the history without copying it;
+# a series is kept as a frame of one column
+class FrameBuffer:
+    def __init__(self, frame: Union[pd.DataFrame, pd.Series] = None, capacity: int = 1024):
+        self.n_rows = 0
+        self.n_compacted = 0
+
+        if frame is None:
+            frame = pd.DataFrame()
+
+        self._layout(frame, max(capacity, 2 * len(frame)))
+
+        if len(frame) > 0:
+            self.append(frame)
+            self.n_compacted = self.n_rows
+
+    def __len__(self):
+        return self.n_rows
+
+    def _layout(self, frame: Union[pd.DataFrame, pd.Series], capacity: int):
+        self.series = isinstance(frame, pd.Series)
+        self.name = frame.name if self.series else None
+
+        if self.series:
+            frame = frame.to_frame(name='values')
+
+        self.columns = frame.columns
+        self.index_name = frame.index.name
+        self.index_dtype = frame.index.dtype
+        self._index = np.empty(capacity, dtype=frame.index.values.dtype)
+
+        # the block and the position in it of every column, a dtype outside numpy is kept as objects
+        self._positions: dict = {}
+        block_sizes: dict[np.dtype, int] = {}
+
+        for column, dtype in frame.dtypes.items():
+            dtype = dtype if isinstance(dtype, np.dtype) else np.dtype(object)
+
+            self._positions[column] = (dtype, block_sizes.get(dtype, 0))
+            block_sizes[dtype] = block_sizes.get(dtype, 0) + 1
+
+        self._blocks: dict[np.dtype, np.ndarray] = {
+            dtype: np.empty((capacity, size), dtype=dtype) for dtype, size in block_sizes.items()
+        }
+
+    def _grow(self, n_rows: int):
+        capacity = len(self._index)
+
+        while capacity < n_rows:
+            capacity *= 2
+
+        if capacity == len(self._index):
+            return
+
+        # the views returned before keep the old arrays
+        index = np.empty(capacity, dtype=self._index.dtype)
+        index[:self.n_rows] = self._index[:self.n_rows]
+        self._index = index
+
+        for dtype, block in self._blocks.items():
+            grown = np.empty((capacity, block.shape[1]), dtype=dtype)
+            grown[:self.n_rows] = block[:self.n_rows]
+
+            self._blocks[dtype] = grown
+
+    def append(self, frame: Union[pd.DataFrame, pd.Series, list]):
+        if isinstance(frame, list):
+            for part in frame:
+                self.append(part)
+
+            return self
+
+        if len(frame) == 0:
+            return self
+
+        # a buffer made of an empty frame takes the columns of the first rows appended
+        if self.n_rows == 0 and (len(self.columns) == 0 or self.series != isinstance(frame, pd.Series)):
+            self._layout(frame, len(self._index))
+
+        if isinstance(frame, pd.Series):
+            frame = frame.to_frame(name='values')
+
+        start, stop = self.n_rows, self.n_rows + len(frame)
+        self._grow(stop)
+
+        self._index[start:stop] = frame.index.values
+
+        # columns one by one, selecting several columns of a frame of a few rows costs more
+        for column, (dtype, j) in self._positions.items():
+            self._blocks[dtype][start:stop, j] = frame[column].to_numpy()
+
+        self.n_rows = stop
+
+        return self
+
+    def _index_view(self, start: int, stop: int) -> pd.Index:
+        values = self._index[start:stop]
+
+        if isinstance(self.index_dtype, pd.DatetimeTZDtype):
+            return pd.DatetimeIndex(values.view(np.int64), dtype=self.index_dtype, copy=False, name=self.index_name)
+
+        return pd.Index(values, copy=False, name=self.index_name)
+
+    # rows from start to stop as views of the arrays, valid after later appends
+    def frame(self, start: int = 0, stop: int = None) -> Union[pd.DataFrame, pd.Series]:
+        stop = self.n_rows if stop is None else stop
+        index = self._index_view(start, stop)
+
+        frame = pd.DataFrame({
+            column: self._blocks[dtype][start:stop, j] for column, (dtype, j) in self._positions.items()
+        }, index=index, columns=self.columns, copy=False)
+
+        if self.series:
+            return frame['values'].rename(self.name)
+
+        return frame
+
+    def new_frame(self) -> Union[pd.DataFrame, pd.Series]:
+        return self.frame(self.n_compacted)
+
+    def compact(self) -> Union[pd.DataFrame, pd.Series]:
+        self.n_compacted = self.n_rows
+
+        return self.frame()
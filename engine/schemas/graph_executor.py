@@ -0,0 +1,98 @@
+import pandas as pd
+from engine.schemas.data_broker import Pipeline, DataNode, transform_node
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import get_context
+from datetime import datetime
+from time import time
+
+
+def timed(function, *args, **kwargs):
+    start = time()
+    result = function(*args, **kwargs)
+
+    return result, time() - start
+
+
+# computes the DataNodes of several pipelines as one graph: candles are uploaded in a pool of threads and
+# a transformer runs in the pool as soon as the data of its parent is ready, so that the nodes of different
+# tickers and independent branches run concurrently; with processes, the transformers run in a pool of spawned
+# processes instead, as forking the threads of a running strategy may deadlock; the pipelines are computed
+# afterwards from the data of their nodes, timings keeps the seconds spent on every node of the last computation
+class GraphExecutor:
+    def __init__(self, n_threads: int = None, n_processes: int = None, processes: bool = False):
+        self.n_threads = n_threads
+        self.n_processes = n_processes
+        self.processes = processes
+        self.timings: list[dict] = []
+
+    def compute(self, pipelines: list[Pipeline], fit_dates: list[datetime] = None) -> pd.DataFrame:
+        if fit_dates is None:
+            fit_dates = [None] * len(pipelines)
+
+        self.timings = []
+
+        # nodes without data with the dates of the computation of their pipeline
+        dates: dict[DataNode, tuple[datetime, datetime]] = {}
+
+        for pipe, fit_date in zip(pipelines, fit_dates):
+            for node in pipe.final_datanodes:
+                while node is not None and node.data is None and node not in dates:
+                    dates[node] = (fit_date, pipe.end_date)
+                    node = node.parent
+
+        with ThreadPoolExecutor(self.n_threads) as threads:
+            if self.processes:
+                processes = ProcessPoolExecutor(self.n_processes, mp_context=get_context('spawn'))
+            else:
+                processes = threads
+
+            running = {}
+
+            def submit(node: DataNode):
+                fit_date, end_date = dates[node]
+
+                if node.end_date is None:
+                    node.end_date = end_date
+
+                if node.parent is None:
+                    future = threads.submit(timed, node.compute, fit_date=fit_date, end_date=end_date)
+                else:
+                    future = processes.submit(
+                        timed, transform_node, node.transformer, node.parent.data, node.fitted, node.ticker,
+                        node.chain(), fit_date=fit_date, end_date=end_date, feature_cache=DataNode.feature_cache,
+                        state=node.resume_state(fit_date)
+                    )
+
+                running[future] = node
+
+            try:
+                for node in dates.keys():
+                    if node.parent is None or node.parent not in dates:
+                        submit(node)
+
+                while running:
+                    done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        node = running.pop(future)
+                        result, seconds = future.result()
+
+                        if node.parent is not None:
+                            node.data, node.transformer, node.fitted, node.state = result
+
+                        self.timings.append({
+                            'ticker': node.ticker.ticker_sign,
+                            'node': node.chain(),
+                            'pool': 'threads' if node.parent is None or not self.processes else 'processes',
+                            'rows': len(node.data),
+                            'seconds': seconds
+                        })
+
+                        for child in node.children:
+                            if child in dates:
+                                submit(child)
+            finally:
+                if self.processes:
+                    processes.shutdown(cancel_futures=True)
+
+        return pd.DataFrame(self.timings)
@@ -1,4 +1,7 @@
 from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.schemas.data_broker import DataNode
+from engine.schemas.feature_cache import FeatureCache
+from engine.metrics import Metrics
 from api.broker_list import t_invest
 from api.tinvest.mock_client import TMockClient
 from api.tinvest.tclient import TClient
@@ -10,7 +13,10 @@ def start_up(
         client_config=None,
         tickers_collection=None,
         mock_client_config=None,
-        set_up_instruments=False
+        set_up_instruments=False,
+        cache_features=None,
+        metrics=False,
+        metrics_port=None
 ):
     mock = (client_config is None) and (mock_client_config is not None)
 
@@ -20,6 +26,17 @@ def start_up(
 
     LocalCandlesUploader.broker = t_invest
 
+    # the features are cached for backtests, the candles of live runs are still refined and backfilled
+    if cache_features is None:
+        cache_features = mock
+
+    if cache_features and DataNode.feature_cache is None:
+        DataNode.feature_cache = FeatureCache()
+
+    # the stages of the trading loop are timed, exported to log_path and served on metrics_port if given
+    if metrics:
+        Metrics.enable(port=metrics_port)
+
     if set_up_instruments:
         with TClient(**client_config) as client:
             client.services.get_instruments()
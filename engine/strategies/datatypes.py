@@ -1,7 +1,11 @@
 from dataclasses import dataclass, field
 from engine.schemas.enums import OrderDirection, OrderType, OrderExecutionReportStatus
 from engine.schemas.datatypes import Ticker
-from engine.schemas.client import Client, Account
+from engine.schemas.client import Client, Account, OrderState
+from engine.strategies.order_stream import OrderStatesStream
+from engine.metrics import Metrics
+from concurrent.futures import ThreadPoolExecutor, wait
+from queue import Queue, Empty
 
 
 @dataclass
@@ -13,6 +17,40 @@ class OrderManager:
     relevant_orders: dict[str, 'LocalOrder'] = field(default_factory=dict)
     new_orders: list['LocalOrder'] = field(default_factory=list)
     transactions: dict[str, dict] = field(default_factory=dict)
+    # states of the orders put by the order state stream and taken by update_relevant_orders
+    order_states: Queue = field(default_factory=Queue)
+    order_states_stream: OrderStatesStream = None
+    # the connection of the stream the states were taken from last time
+    n_connections_seen: int = 0
+    executor: ThreadPoolExecutor = None
+
+    # requests of the orders are made by client.order_threads threads at once, the first error is raised
+    # after all the requests are done
+    def _map(self, request, orders: list) -> list:
+        if self.client.order_threads <= 1 or len(orders) <= 1:
+            return [request(order) for order in orders]
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.client.order_threads)
+
+        futures = [self.executor.submit(request, order) for order in orders]
+        wait(futures)
+
+        return [future.result() for future in futures]
+
+    def subscribe(self):
+        self.order_states_stream = OrderStatesStream(
+            self.client.services,
+            self.account.id,
+            self.order_states.put
+        ).start()
+
+    def close(self):
+        if self.order_states_stream is not None:
+            self.order_states_stream.stop()
+
+        if self.executor is not None:
+            self.executor.shutdown()
 
     def add_new_orders(
             self,
@@ -34,6 +72,35 @@ class OrderManager:
 
         return new_orders
 
+    def post_orders(self, orders: list['LocalOrder']):
+        def post(order: LocalOrder):
+            with Metrics.span('order_post'):
+                order_response = self.client.services.orders.post_order(
+                    instrument_id=order.instrument_uid,
+                    price=order.price,
+                    quantity=order.lots,
+                    direction=order.direction,
+                    account_id=order.account_id,
+                    order_type=order.order_type
+                )
+
+            order.status = order_response.execution_report_status
+            order.order_id = order_response.order_id
+            #order.commission = order_response.commission
+            order.price = float(order_response.initial_order_price)
+
+        self._map(post, orders)
+
+    def _cancel(self, order: 'LocalOrder'):
+        with Metrics.span('order_cancel'):
+            self.client.services.orders.cancel_order(
+                account_id=self.account.id,
+                order_id=order.order_id
+            )
+
+    def cancel_open_orders(self):
+        self._map(self._cancel, self.client.services.orders.get_orders(account_id=self.account.id).orders)
+
     def select_relevant_order_names(
             self,
             tickers: list[Ticker] = None,
@@ -68,15 +135,12 @@ class OrderManager:
     ):
         rel_order_names = self.select_relevant_order_names(tickers, subname)
 
-        for name in rel_order_names:
-            order = self.relevant_orders[name]
-
-            if order.status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW:
-                self.client.services.orders.cancel_order(
-                    account_id=self.account.id,
-                    order_id=order.order_id
-                )
+        self._map(self._cancel, [
+            self.relevant_orders[name] for name in rel_order_names
+            if self.relevant_orders[name].status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW
+        ])
 
+        for name in rel_order_names:
             del self.relevant_orders[name]
 
     def cancel_relevant_orders(
@@ -84,37 +148,68 @@ class OrderManager:
             tickers: list[Ticker] = None,
             subname: str = None,
     ):
-        rel_orders = self.select_relevant_orders(tickers, subname)
+        def cancel(order: LocalOrder):
+            self._cancel(order)
 
-        for order in rel_orders:
-            if order.status != OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW:
-                continue
+            order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED
 
-            self.client.services.orders.cancel_order(
-                account_id=self.account.id,
-                order_id=order.order_id
-            )
+        self._map(cancel, [
+            order for order in self.select_relevant_orders(tickers, subname)
+            if order.status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW
+        ])
 
-            order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED
+    # the last states of the orders by their ids: the streamed ones, and the requested ones without the stream
+    # or after it reconnected, as the states changed while the stream was down are not streamed
+    def _order_states(self, orders: list['LocalOrder']) -> dict[str, OrderState]:
+        order_states = {}
+
+        while True:
+            try:
+                order_state = self.order_states.get_nowait()
+            except Empty:
+                break
+
+            order_states[order_state.order_id] = order_state
+
+        stream = self.order_states_stream
+
+        if stream is None or not stream.connected.is_set() or stream.n_connections != self.n_connections_seen:
+            if stream is not None:
+                self.n_connections_seen = stream.n_connections
+
+            Metrics.count('order_states_requested', len(orders))
+
+            order_states |= {order.order_id: order_state for order, order_state in zip(orders, self._map(
+                lambda order: self.client.services.orders.get_order_state(
+                    account_id=self.account.id,
+                    order_id=order.order_id
+                ), orders))}
+
+        return order_states
 
     def update_relevant_orders(self) -> list['LocalOrder']:
         filled_orders = []
+        orders = [
+            order for order in self.select_relevant_orders()
+            if order.status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW
+        ]
+
+        with Metrics.span('order_states'):
+            order_states = self._order_states(orders)
 
-        for order in self.select_relevant_orders():
-            if order.status != OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW:
+        for order in orders:
+            if order.order_id not in order_states.keys():
                 continue
 
-            order_state = self.client.services.orders.get_order_state(
-                account_id=self.account.id,
-                order_id=order.order_id
-            )
-            order.status = order_state.execution_report_status
+            order.status = order_states[order.order_id].execution_report_status
 
             if (order.status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
                     or order.status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_PARTIALLYFILL):
                 self.record_transaction(order)
                 filled_orders.append(order)
 
+        Metrics.count('orders_filled', len(filled_orders))
+
         return filled_orders
 
     def profit_from_relevant_orders(
@@ -0,0 +1,81 @@
+from engine.schemas.client import Services, OrderState
+from engine.metrics import Metrics
+from threading import Thread, Event
+from typing import Callable
+
+
+# states of the orders of an account from the order state stream, a thread passes them to callback as they come;
+# a broken stream is reopened after a doubling delay, connected is set from the first response of the stream
+# until it breaks and n_connections counts the connections, so that the states changed while the stream
+# was down are requested; a break is counted in the metrics, kept as last_error and passed to on_error
+# with the delay before reconnecting
+class OrderStatesStream:
+    def __init__(
+            self,
+            services: Services,
+            account_id: str,
+            callback: Callable[[OrderState], None],
+            reconnect_delay: float = 1.,
+            max_reconnect_delay: float = 60.,
+            on_error: Callable[[Exception, float], None] = None
+    ):
+        self.services = services
+        self.account_id = account_id
+        self.callback = callback
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.on_error = on_error
+
+        self.connected = Event()
+        self.n_connections = 0
+        self.last_error: Exception = None
+        self._stop = Event()
+        self._thread: Thread = None
+
+    def start(self) -> 'OrderStatesStream':
+        self._stop.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self, timeout: float = 5.):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        delay = self.reconnect_delay
+
+        while not self._stop.is_set():
+            try:
+                # None is a response without a state, e.g. the confirmation of the subscription
+                for order_state in self.services.order_state_events(self.account_id, self._stop):
+                    if not self.connected.is_set():
+                        self.n_connections += 1
+                        self.connected.set()
+
+                    if order_state is not None:
+                        self.callback(order_state)
+
+                    delay = self.reconnect_delay
+
+                if not self._stop.is_set():
+                    raise ConnectionError('The order state stream is closed.')
+            except Exception as error:
+                self.connected.clear()
+
+                if self._stop.is_set():
+                    break
+
+                self.last_error = error
+                Metrics.count('order_state_stream_breaks')
+
+                if self.on_error is not None:
+                    self.on_error(error, delay)
+
+                self._stop.wait(delay)
+                delay = min(2 * delay, self.max_reconnect_delay)
+
+        self.connected.clear()
@@ -5,11 +5,15 @@ from engine.strategies.datatypes import LocalOrder
 from engine.schemas.enums import SessionPeriod, OrderType, OrderDirection, OrderExecutionReportStatus
 from engine.schemas.datatypes import Ticker
 from engine.schemas.data_broker import Pipeline
+from engine.schemas.graph_executor import GraphExecutor
 from engine.transformers.returns import Returns
+from engine.models.hmm import batch_update
+from engine.metrics import Metrics
 from pomegranate.distributions import Normal
 from pomegranate.gmm import GeneralMixtureModel
 from pomegranate.hmm import DenseHMM
 import numpy as np
+import copy
 
 
 class AvgState(Strategy):
@@ -27,6 +31,7 @@ class AvgState(Strategy):
             states_from_train_data=False,
             model_metadata=None,
             sessions=(SessionPeriod.MAIN,),
+            graph_executor: GraphExecutor = None,
             **additional_open_to_trading_parameters
     ):
         super().__init__(
@@ -46,6 +51,7 @@ class AvgState(Strategy):
         self._states_from_train_data = states_from_train_data
         self._model_metadata = model_metadata
         self._ticker_pipelines = None
+        self._graph_executor = graph_executor if graph_executor is not None else GraphExecutor()
 
         self._num_of_executed_averaging_orders = None
         self._lots_executed = None
@@ -199,17 +205,27 @@ class AvgState(Strategy):
         # -------- logic ---------------
 
         if not self._executed:
+            # every ticker gets its own copy of the steps, the graph of all the tickers is computed at once
             self._ticker_pipelines = {
                 ticker: Pipeline(
                     ticker=ticker
-                ).make_pipeline(self._pipeline, end_date=self._period.time_period).load_model(
-                    load_data=self._states_from_train_data)
+                ).make_pipeline(copy.deepcopy(self._pipeline), end_date=self._period.time_period).load_fitted()
                 for ticker in self.tickers_collection
             }
 
+            pipelines = list(self._ticker_pipelines.values())
+
+            self._graph_executor.compute(
+                pipelines,
+                fit_dates=None if self._states_from_train_data else [pipe.fit_date for pipe in pipelines]
+            )
+
+            for pipe in pipelines:
+                pipe.catch_up(load_data=self._states_from_train_data)
+
             for pipe in self._ticker_pipelines.values():
                 if self._states_from_train_data:
-                    X = pipe.final_datanodes.data
+                    X = pipe.compute()
                     returns = pipe.fetch_data('Returns').to_numpy()
 
                     pipe.model.determine_states(
@@ -239,12 +255,23 @@ class AvgState(Strategy):
 
         ## updating info on candles
 
+        updated_tickers, new_data = [], []
+
         for ticker in self._tickers_for_candle_fetching:
             new_candles_supplied = self._services.get_candles(ticker)
 
             if new_candles_supplied:
-                self._ticker_pipelines[ticker].update(new_date=self._period.time_period)
+                updated_tickers.append(ticker)
+                new_data.append(self._ticker_pipelines[ticker].update(
+                    new_date=self._period.time_period,
+                    update_model=False
+                ))
+
+        with Metrics.span('hmm_update'):
+            batch_update([self._ticker_pipelines[ticker].model for ticker in updated_tickers], new_data)
 
+        with Metrics.span('hmm_forecast'):
+            for ticker in updated_tickers:
                 forecast_next_state(ticker)
 
         ## selecting new tickers for new trade
@@ -6,6 +6,7 @@ from engine.strategies.datatypes import OrderManager
 from engine.schemas.client import Client, Services, Account, OrderState
 from engine.schemas.enums import SessionPeriod, OrderExecutionReportStatus, OrderDirection
 from engine.schemas.constants import log_path
+from engine.metrics import Metrics
 
 
 class Strategy(ABC):
@@ -42,12 +43,22 @@ class Strategy(ABC):
     def _get_new_prices(self, depth=1) -> dict[str, dict[str, np.array]]:
         prices = {}
 
-        for ticker in self.tickers_collection:
-            order_book = self._services.market_data.get_order_book(instrument_id=ticker.uid, depth=depth)
-            bid = [order_book.bids[i].price for i in range(depth)]
-            ask = [order_book.asks[i].price for i in range(depth)]
+        with Metrics.span('order_book_fetch'):
+            for ticker in self.tickers_collection:
+                order_book = None
 
-            prices[ticker] = {'to_buy': np.array(bid), 'to_sell': np.array(ask)}
+                # the top of book of the market data stream, requested if the stream has none
+                if self._services.candles_stream is not None and depth == 1:
+                    order_book = self._services.candles_stream.order_book(ticker.uid)
+
+                if order_book is None:
+                    order_book = self._services.market_data.get_order_book(instrument_id=ticker.uid, depth=depth)
+                    Metrics.count('order_books_requested')
+
+                bid = [order_book.bids[i].price for i in range(depth)]
+                ask = [order_book.asks[i].price for i in range(depth)]
+
+                prices[ticker] = {'to_buy': np.array(bid), 'to_sell': np.array(ask)}
 
         return prices
 
@@ -69,23 +80,10 @@ class Strategy(ABC):
     # orders is a list of tuples with a name of an order at index 0, and a metadata at index 1
 
     def _trade(self):
-        for order in self._order_manager.extract_new_orders():
-            if order.status != OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_UNSPECIFIED:
-                continue
-
-            order_response = self._services.orders.post_order(
-                instrument_id=order.instrument_uid,
-                price=order.price,
-                quantity=order.lots,
-                direction=order.direction,
-                account_id=order.account_id,
-                order_type=order.order_type
-            )
-
-            order.status = order_response.execution_report_status
-            order.order_id = order_response.order_id
-            #order.commission = order_response.commission
-            order.price = float(order_response.initial_order_price)
+        self._order_manager.post_orders([
+            order for order in self._order_manager.extract_new_orders()
+            if order.status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_UNSPECIFIED
+        ])
 
     def execute(self, client: Client, account, tickers: list[Ticker]):
         if not self._executed:
@@ -96,12 +94,19 @@ class Strategy(ABC):
             self.tickers_collection = tickers
             self._tickers_for_candle_fetching = tickers
             self.types_instruments = list(set([ticker.type_instrument for ticker in self.tickers_collection]))
+
+            if self._order_manager is not None:
+                self._order_manager.close()
+
             self._order_manager = OrderManager(
                 client=client,
                 account=self._account,
                 tickers_collection=self.tickers_collection
             )
 
+            if client.stream_order_states:
+                self._order_manager.subscribe()
+
         self._cash = client.get_available_balance(self._account) * self._cash_share
 
         self.ongoing_trading = client.ready_to_trade(self._sessions, self.types_instruments,
@@ -115,8 +120,8 @@ class Strategy(ABC):
         pass
 
     def terminate(self):
-        for order in self._services.orders.get_orders(account_id=self._account.id).orders:
-            self._services.orders.cancel_order(account_id=self._account.id, order_id=order.order_id)
+        self._order_manager.cancel_open_orders()
+        self._order_manager.close()
 
         if len(self._order_manager.transactions) > 0:
             pd.DataFrame(self._order_manager.transactions).T.to_csv(
@@ -0,0 +1,125 @@
+import pandas as pd
+from api.broker_list import t_invest
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.schemas.data_broker import Pipeline
+from engine.schemas.datatypes import Ticker
+from engine.schemas.feature_cache import write_frame, read_frame
+from engine.schemas.constants import log_path
+from engine.start_up import start_up
+from engine.trading_interface import TradingInterface
+from engine.strategies.strategy import Strategy
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+from typing import Callable
+import itertools
+import tempfile
+import shutil
+import os
+
+# candles of the sweep in the worker process, read-only views of the memory-mapped files
+shared_candles: dict[str, pd.DataFrame] = {}
+
+
+def parameter_grid(grid: dict[str, list]) -> list[dict]:
+    return [dict(zip(grid.keys(), values)) for values in itertools.product(*grid.values())]
+
+
+# candles of every ticker are written once as memory-mapped frames, so that every worker maps the same pages
+def share_candles(tickers_collection: list[str], path: str):
+    for ticker_sign in tickers_collection:
+        write_frame(LocalCandlesUploader.storage.read(t_invest.broker_name, ticker_sign), path + f'{ticker_sign}/')
+
+
+def load_shared_candles(path: str, tickers_collection: list[str]):
+    for ticker_sign in tickers_collection:
+        shared_candles[ticker_sign] = read_frame(path + f'{ticker_sign}/')
+
+
+# state shared between backtests through class attributes is reset before every run in a worker
+def reset_shared_state(tickers: list[Ticker]):
+    LocalCandlesUploader.candles_in_memory = {ticker: shared_candles[ticker.ticker_sign] for ticker in tickers}
+    LocalCandlesUploader.new_candles = {}
+    LocalCandlesUploader.last_candles = {}
+    LocalCandlesUploader.candles_start_dates = {}
+
+    Pipeline.clear()
+
+
+def run_backtest(
+        build_strategies: Callable[[dict], list[Strategy]],
+        params: dict,
+        mock_client_config: dict,
+        tickers_collection: list[str]
+) -> dict:
+    start = time()
+
+    client_constructor, tickers, client_config, account = start_up(
+        tickers_collection=tickers_collection,
+        mock_client_config=dict(mock_client_config)
+    )
+
+    reset_shared_state(tickers)
+
+    strategies = build_strategies(params)
+
+    TradingInterface(
+        strategies=strategies,
+        account=account
+    ).launch(
+        client_constructor=client_constructor,
+        client_config=client_config,
+        tickers_collection=tickers
+    )
+
+    return params | {
+        'pnl': sum([sum(strategy.profits) for strategy in strategies]),
+        'trades': sum([len(strategy._order_manager.transactions) for strategy in strategies
+                       if strategy._order_manager is not None]),
+        'runtime': time() - start
+    }
+
+
+# runs a backtest for every point of the grid in a pool of processes,
+# build_strategies has to be a module-level function so that it can be sent to the workers
+def run_sweep(
+        build_strategies: Callable[[dict], list[Strategy]],
+        grid: dict[str, list],
+        mock_client_config: dict,
+        tickers_collection: list[str],
+        n_jobs: int = None,
+        results_path: str = None
+) -> pd.DataFrame:
+    LocalCandlesUploader.broker = t_invest
+
+    if results_path is None:
+        results_path = log_path + 'sweep_results.csv'
+
+    configurations = parameter_grid(grid)
+    path = tempfile.mkdtemp().replace("\\", "/") + '/'
+
+    try:
+        share_candles(tickers_collection, path)
+
+        with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=load_shared_candles,
+                initargs=(path, tickers_collection)
+        ) as executor:
+            results = list(executor.map(
+                run_backtest,
+                itertools.repeat(build_strategies),
+                configurations,
+                itertools.repeat(mock_client_config),
+                itertools.repeat(tickers_collection)
+            ))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    results = pd.DataFrame(results)
+
+    if not os.path.isdir(os.path.dirname(results_path)):
+        os.makedirs(os.path.dirname(results_path))
+
+    results.to_csv(results_path, index=False)
+
+    return results
@@ -1,9 +1,11 @@
 from engine.schemas.datatypes import Period, Broker, Ticker
 from engine.strategies.strategy import Strategy
 from engine.schemas.client import Client
+from engine.candles.candles_stream import CandlesStream
+from engine.scheduler import MinuteScheduler
+from engine.metrics import Metrics
 from engine.schemas.enums import AccountType
 from datetime import date, timedelta
-from time import sleep, time
 from typing import Type
 
 
@@ -20,35 +22,57 @@ class TradingInterface:
             self,
             client_constructor: Type[Client],
             client_config: dict,
-            tickers_collection: list[Ticker]
+            tickers_collection: list[Ticker],
+            stream_market_data: bool = False,
+            scheduler: MinuteScheduler = None
     ):
         with client_constructor(**client_config) as client:
-            number_of_inactive_strategies = 0
-            starting_cash = client._cash
+            # the candles and the top of book of all the tickers come from one subscription instead of requests
+            if stream_market_data:
+                candles_stream = CandlesStream(client.services, tickers_collection).start()
 
-            while len(self._strategies) > number_of_inactive_strategies:
-                start = time()
+            # the stream is stopped also when a strategy or the client raises
+            try:
+                # a client of periods of real time is run at their boundaries, the mock client period after period
+                if scheduler is None and client.period_duration > 0:
+                    scheduler = MinuteScheduler(period=timedelta(seconds=client.period_duration))
 
-                for strategy in self._strategies:
-                    #if (client.period.time_period.hour == 0) and (client.period.time_period.minute == 0):
-                    if (client.period.time_period.minute == 0):
-                        print(round(100 * sum(strategy.profits) / (starting_cash * strategy._cash_share), 3))
+                if scheduler is not None:
+                    scheduler.run(self._strategies, client, self._account, tickers_collection)
+                else:
+                    self._run_periods(client, tickers_collection)
+            finally:
+                if stream_market_data:
+                    candles_stream.stop()
 
-                    if not strategy.active:
-                        continue
+        # the timings of the stages of the run, while the metrics are enabled
+        if Metrics.enabled:
+            print(Metrics.summary().to_string(index=False, na_rep='', float_format='{:.3f}'.format))
+            Metrics.export()
 
-                    strategy.execute(client, self._account, tickers_collection)
+    def _run_periods(self, client: Client, tickers_collection: list[Ticker]):
+        number_of_inactive_strategies = 0
+        starting_cash = client._cash
 
-                    if not strategy.active:
-                        number_of_inactive_strategies += 1
+        while len(self._strategies) > number_of_inactive_strategies:
+            for strategy in self._strategies:
+                #if (client.period.time_period.hour == 0) and (client.period.time_period.minute == 0):
+                if (client.period.time_period.minute == 0):
+                    print(round(100 * sum(strategy.profits) / (starting_cash * strategy._cash_share), 3))
+
+                if not strategy.active:
+                    continue
 
-                #sleep(max(client.period_duration - (time() - start), 0))
-                #sleep(0.05)
+                with Metrics.span('strategy_execute'):
+                    strategy.execute(client, self._account, tickers_collection)
+
+                if not strategy.active:
+                    number_of_inactive_strategies += 1
 
-                try:
-                    client.next_period()
-                except StopIteration:
-                    for strategy in self._strategies:
-                        if strategy.active:
-                            strategy.terminate()
-                            number_of_inactive_strategies += 1
+            try:
+                client.next_period()
+            except StopIteration:
+                for strategy in self._strategies:
+                    if strategy.active:
+                        strategy.terminate()
+                        number_of_inactive_strategies += 1
@@ -1,8 +1,9 @@
 import pandas as pd
 import sklearn.preprocessing as preprocess
+from engine.transformers.streaming import StreamingTransformerMixin
 
 
-class StandardScaler(preprocess.StandardScaler):
+class StandardScaler(StreamingTransformerMixin, preprocess.StandardScaler):
     def __init__(self, copy=True, with_mean=True, with_std=True):
         super().__init__(copy=True, with_mean=with_mean, with_std=with_std)
         self.set_output(transform='pandas')
@@ -1,20 +1,45 @@
 import pandas as pd
 import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
+from engine.transformers.streaming import StreamingTransformerMixin
 
 
-class RV(TransformerMixin, BaseEstimator):
+# realized variance and volume of a day, a day is output once a row of a later day arrives
+class RV(StreamingTransformerMixin, TransformerMixin, BaseEstimator):
     def fit(self, X, y=None):
         return self
 
     def transform(self, X: pd.DataFrame):
-        rv = X[['returns']]**2
-        rv['day_number'] = X['day_number']
-        rv['volume'] = X['volume']
+        if isinstance(X, list):
+            X = pd.concat(X)
 
-        rv = rv.groupby('day_number').sum()
-        rv.index = pd.to_datetime(np.unique(X.index.date), format="%Y-%m-%d")
-        rv.index.name = 'time'
-        rv.rename(columns={'returns': 'RV'}, inplace=True)
+        return self.partial_transform(X)[0]
 
-        return rv
+    # the state is the day number, the date and the sums of the day in progress
+    def partial_transform(self, X: pd.DataFrame, state: dict = None):
+        if len(X) == 0:
+            return pd.DataFrame({'RV': [], 'volume': []}, index=pd.DatetimeIndex([], name='time')), state
+
+        day_number = X['day_number'].to_numpy()
+        run_starts = np.concatenate([[0], np.flatnonzero(np.diff(day_number) != 0) + 1])
+
+        days = day_number[run_starts]
+        dates = X.index[run_starts]
+        dates = (dates.tz_localize(None) if dates.tz is not None else dates).normalize()
+        rv = np.add.reduceat(X['returns'].to_numpy() ** 2, run_starts)
+        volume = np.add.reduceat(X['volume'].to_numpy(), run_starts)
+
+        # a day continued from the state keeps the date of its first row
+        if state is not None and days[0] == state['day_number']:
+            dates = pd.DatetimeIndex([state['date']]).append(dates[1:])
+            rv[0] += state['RV']
+            volume[0] += state['volume']
+        elif state is not None:
+            days = np.concatenate([[state['day_number']], days])
+            dates = pd.DatetimeIndex([state['date']]).append(dates)
+            rv = np.concatenate([[state['RV']], rv])
+            volume = np.concatenate([[state['volume']], volume])
+
+        state = {'day_number': days[-1], 'date': dates[-1], 'RV': rv[-1], 'volume': volume[-1]}
+
+        return pd.DataFrame({'RV': rv[:-1], 'volume': volume[:-1]}, index=pd.DatetimeIndex(dates[:-1], name='time')), state
@@ -3,9 +3,10 @@ from typing import Callable
 import pandas as pd
 import numpy as np
 from datetime import timedelta
+from engine.transformers.streaming import StreamingTransformerMixin
 
 
-class Returns(TransformerMixin, BaseEstimator):
+class Returns(StreamingTransformerMixin, TransformerMixin, BaseEstimator):
     def __init__(
             self,
             candle_to_price: str = 'close',
@@ -18,68 +19,70 @@ class Returns(TransformerMixin, BaseEstimator):
         self.keep_overnight = keep_overnight
         self.day_number = day_number
         self.keep_vol = keep_vol
-        self.last_candle: pd.DataFrame = None
 
     def get_feature_names_out(self, input_features=None):
         return self.feature_names_out_
 
     def fit(self, X, y=None, **kwargs):
-        self.last_candle: pd.DataFrame = None
-
         return self
 
     def transform(self, X):
         if isinstance(X, list):
-            if isinstance(X[0], pd.DataFrame):
-                X = pd.concat(X)
-
-        if self.last_candle is not None:
-            X = pd.concat([self.last_candle, X])
+            X = pd.concat(X)
 
-        self.last_candle = X[-1:]
+        return self.partial_transform(X)[0]
 
+    # the state is the log-price and the day number of the last candle
+    def partial_transform(self, X: pd.DataFrame, state: dict = None):
         if self.candle_to_price == 'mean':
-            price = np.log(((X['high'] + X['low']) / 2).to_frame())
-            price['day_start'] = X['day_number']
-        elif self.candle_to_price in ['open', 'high', 'low', 'close']:
-            price = np.log(X[self.candle_to_price].to_frame())
-            price['day_start'] = X['day_number']
-
-        if self.candle_to_price != 'two_way':
-            returns = price.diff()
-            returns['day_number'] = X['day_number']
-            returns['volume'] = X['volume']
-            returns.rename(columns={self.candle_to_price: 'returns'}, inplace=True)
+            price = np.log((X['high'].to_numpy() + X['low'].to_numpy()) / 2)
+        elif self.candle_to_price == 'two_way':
+            price = np.log(X['close'].to_numpy())
+        else:
+            price = np.log(X[self.candle_to_price].to_numpy())
+
+        day_number = X['day_number'].to_numpy()
+
+        if state is None:
+            state = {'price': np.nan, 'day_number': np.nan}
+
+        prev_price = np.concatenate([[state['price']], price[:-1]])
+        day_start = day_number - np.concatenate([[state['day_number']], day_number[:-1]])
+
+        if self.candle_to_price == 'two_way':
+            returns = pd.DataFrame({
+                'high': np.log(X['high'].to_numpy()) - prev_price,
+                'low': np.log(X['low'].to_numpy()) - prev_price
+            }, index=X.index)
         else:
-            returns = np.log(X[['high', 'low']])
-            returns['day_start'] = X['day_number'].diff()
+            returns = pd.DataFrame({'returns': price - prev_price}, index=X.index)
+
+        if self.day_number:
             returns['day_number'] = X['day_number']
-            returns['high'] -= np.log(X['close'].shift(periods=1))
-            returns['low'] -= np.log(X['close'].shift(periods=1))
+
+        if self.keep_vol:
             returns['volume'] = X['volume']
 
+        if len(X) > 0:
+            state = {'price': price[-1], 'day_number': day_number[-1]}
+
+        # the first candle of the table has no return, overnight returns are dropped unless kept
         if not self.keep_overnight:
-            returns = returns[returns['day_start'] == 0]
+            returns = returns[day_start == 0]
         else:
-            returns = returns.iloc[1:]
-        del returns['day_start']
-
-        if not self.day_number:
-            del returns['day_number']
+            returns = returns[~np.isnan(day_start)]
 
-        if not self.keep_vol:
-            del returns['volume']
-
-        return returns
+        return returns, state
 
     def save_model(self):
         return self
 
     def load_model(self, data):
-        self.last_candle = data['last_candle']
+        pass
 
 
-class CandlesToDirection(TransformerMixin, BaseEstimator):
+# log-moves from the open of a window of periods candles to the high and to the low of its last candle
+class CandlesToDirection(StreamingTransformerMixin, TransformerMixin, BaseEstimator):
     def __init__(
             self,
             bull_threshold=8,
@@ -90,22 +93,30 @@ class CandlesToDirection(TransformerMixin, BaseEstimator):
         self.bear_threshold = bear_threshold
         self.periods = periods
 
-        self.last_candles = pd.DataFrame([])
-
     def fit(self, X, y=None):
-        self.last_candles = pd.DataFrame([])
-
         return self
 
     def transform(self, X):
         if isinstance(X, list):
-            if isinstance(X[0], pd.DataFrame):
-                X = pd.concat(X)
+            X = pd.concat(X)
+
+        return self.partial_transform(X)[0]
+
+    # the state is the log-opens of the last periods - 1 candles
+    def partial_transform(self, X: pd.DataFrame, state: np.ndarray = None):
+        if state is None:
+            state = np.empty(0)
+
+        log_open = np.concatenate([state, np.log(X['open'].to_numpy())])
 
-        if len(self.last_candles) > 0:
-            X = pd.concat([self.last_candles, X])
+        # rows of X whose window is complete and the position of the window open in log_open,
+        # no row is complete before periods opens are seen
+        first_row = max(self.periods - 1 - len(state), 0)
+        window_open = log_open[len(state) + first_row - (self.periods - 1):max(len(log_open) - (self.periods - 1), 0)]
 
-        t_index = X.index
+        directions = pd.DataFrame({
+            'bull': np.log(X['high'].to_numpy()[first_row:]) - window_open,
+            'bear': np.log(X['low'].to_numpy()[first_row:]) - window_open
+        }, index=X.index[first_row:])
 
-        directions_bull = np.log(X['high'].iloc[self.periods - 1:]) - np.log(X['open'].iloc[:X.shape[0] - self.periods + 1])
-        directions_bear = np.log(X['low'].iloc[self.periods - 1:]) - np.log(X['open'].iloc[:X.shape[0] - self.periods + 1])
\ No newline at end of file
+        return directions, log_open[max(len(log_open) - (self.periods - 1), 0):]
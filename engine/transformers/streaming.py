@@ -0,0 +1,21 @@
+import pandas as pd
+
+
+# transformers of a table growing by rows: partial_transform(X, state) returns the output for the new rows X
+# and the state to continue with, state=None starts from the first row of the table; the outputs of consecutive
+# chunks of a table add up to the output of the whole table, a call costs O(len(X)) and the state is small;
+# the default is a transformer of rows without state
+class StreamingTransformerMixin:
+    def partial_transform(self, X: pd.DataFrame, state=None):
+        return self.transform(X), state
+
+
+# partial_transform of transformers from other libraries, which transform rows independently
+def partial_transform(transformer, X: pd.DataFrame, state=None):
+    if isinstance(X, list):
+        X = pd.concat(X)
+
+    if hasattr(transformer, 'partial_transform'):
+        return transformer.partial_transform(X, state)
+
+    return transformer.transform(X), state
@@ -1,9 +1,61 @@
 from sklearn.base import TransformerMixin, BaseEstimator
-from statsmodels.tsa.api import SimpleExpSmoothing
+from scipy.signal import lfilter
+from scipy.optimize import minimize_scalar
+from engine.transformers.streaming import StreamingTransformerMixin
 import pandas as pd
+import numpy as np
 
 
-class RSI(TransformerMixin, BaseEstimator):
+# up to this many values are smoothed bar by bar, a call of the linear filter costs as much as ~16 steps
+STEP_MAX_BARS = 16
+
+
+# the level of exponential smoothing after the value x, the bar of a streaming update
+def smoothing_step(level, x, smoothing_level: float):
+    return smoothing_level * x + (1 - smoothing_level) * level
+
+
+# levels of exponential smoothing of x along the first axis from initial_level: the level before x[0]
+# and after every value of x; a series is smoothed by the linear filter y[n] = a * x[n] + (1 - a) * y[n - 1]
+def smoothed_levels(x: np.ndarray, initial_level, smoothing_level: float) -> np.ndarray:
+    levels = np.empty((len(x) + 1,) + np.shape(initial_level))
+    levels[0] = initial_level
+
+    if len(x) <= STEP_MAX_BARS:
+        for i in range(len(x)):
+            levels[i + 1] = smoothing_step(levels[i], x[i], smoothing_level)
+    else:
+        levels[1:], _ = lfilter(
+            [smoothing_level], [1, smoothing_level - 1], x, axis=0,
+            zi=np.expand_dims((1 - smoothing_level) * np.asarray(initial_level, dtype=np.float64), 0)
+        )
+
+    return levels
+
+
+# the smoothing level minimising the squared errors of the one-step forecasts of x by the levels
+def optimal_smoothing_level(x: np.ndarray, initial_level: float) -> float:
+    def sse(smoothing_level):
+        return np.square(x - smoothed_levels(x, initial_level, smoothing_level)[:-1]).sum()
+
+    return minimize_scalar(sse, bounds=(0, 1), method='bounded', options={'xatol': 1e-8}).x
+
+
+# the first periods values of a series give the initial level as their mean, state['n'] values of them
+# are already summed in state['sum']; returns the number of values of x taken by the warm-up
+def warm_up(x: np.ndarray, state: dict, periods: int) -> int:
+    n_warm = min(periods - state['n'], len(x)) if state['n'] < periods else 0
+
+    state['sum'] = state['sum'] + x[:n_warm].sum(axis=0)
+    state['n'] += n_warm
+
+    if n_warm > 0 and state['n'] == periods:
+        state['level'] = state['sum'] / periods
+
+    return n_warm
+
+
+class RSI(StreamingTransformerMixin, TransformerMixin, BaseEstimator):
     def __init__(
             self,
             periods=14,
@@ -11,93 +63,126 @@ class RSI(TransformerMixin, BaseEstimator):
     ):
         self.periods = periods
         self.ma = ma
-        self.initial_level: dict = {}
 
-    def fit(self, X):
-        if type(X) is list:
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        if isinstance(X, list):
             X = pd.concat(X)
 
-        price_diff = X['close'].diff().iloc[1:]
+        return self.partial_transform(X)[0]
 
-        U, D = price_diff * (price_diff > 0), -1 * price_diff * (price_diff < 0)
-        start_SMA_U, start_SMA_D = U.iloc[:self.periods].mean(), U.iloc[:self.periods].mean()
+    # the state is the last close and the smoothed upward and downward moves (U, D) as one level
+    def partial_transform(self, X: pd.DataFrame, state: dict = None):
+        close = X['close'].to_numpy()
 
-        self.initial_level['U'] = start_SMA_U
-        self.initial_level['D'] = start_SMA_D
+        if state is None:
+            state = {'close': np.nan, 'n': 0, 'sum': np.zeros(2), 'level': None}
+        else:
+            state = dict(state)
 
-        return self
+        price_diff = np.diff(np.concatenate([[state['close']], close]))
+        index = X.index
 
-    def transform(self, X):
-        if type(X) is list:
-            if type(X[0]) is pd.DataFrame:
-                X = pd.concat(X)
+        # the first close of the series has no move
+        if np.isnan(state['close']):
+            price_diff, index = price_diff[1:], index[1:]
+
+        if len(close) > 0:
+            state['close'] = close[-1]
+
+        moves = np.stack([price_diff * (price_diff > 0), -price_diff * (price_diff < 0)], axis=1)
 
-        price_diff = X['close'].diff().iloc[1:]
+        n_warmed = state['n']
+        n_warm = warm_up(moves, state, self.periods)
 
-        U, D = price_diff * (price_diff > 0), -1 * price_diff * (price_diff < 0)
+        if state['n'] < self.periods:
+            return pd.Series([], index=index[:0], name='RSI', dtype=np.float64), state
 
-        SEMA_U = SimpleExpSmoothing(U.iloc[self.periods:].to_numpy(), initialization_method='known',
-                                    initial_level=self.initial_level['U'])
-        SEMA_D = SimpleExpSmoothing(D.iloc[self.periods:].to_numpy(), initialization_method='known',
-                                    initial_level=self.initial_level['D'])
+        levels = np.stack([
+            smoothed_levels(moves[n_warm:, k], state['level'][k], 1 / self.periods) for k in range(2)
+        ], axis=1)
 
-        SEMA_U = SEMA_U.fit(smoothing_level=1 / self.periods, optimized=False).fittedfcast
-        SEMA_D = SEMA_D.fit(smoothing_level=1 / self.periods, optimized=False).fittedfcast
+        state['level'] = levels[-1]
 
-        RS = SEMA_U / SEMA_D
+        # the initial level is output at the last move of the warm-up
+        if n_warmed < self.periods:
+            index = index[n_warm - 1:]
+        else:
+            levels, index = levels[1:], index[n_warm:]
 
-        RSI = pd.Series(100 - 100 / (1 + RS), name='RSI')
-        RSI.index = price_diff.index[self.periods - 1:]
+        RS = levels[:, 0] / levels[:, 1]
 
-        self.initial_level['U'] = SEMA_U[-1]
-        self.initial_level['D'] = SEMA_D[-1]
+        return pd.Series(100 - 100 / (1 + RS), index=index, name='RSI'), state
+
+    def save_model(self):
+        return self
 
-        return RSI
+    def load_model(self, data):
+        pass
 
 
-class EMA(TransformerMixin, BaseEstimator):
+class EMA(StreamingTransformerMixin, TransformerMixin, BaseEstimator):
     def __init__(
             self,
             periods=14
     ):
         self.periods = periods
 
-    def fit(self, X):
+    # the smoothing level is estimated on the fitting data and kept, so that transforms of chunks agree
+    def fit(self, X, y=None):
+        price = X['close'].to_numpy()
+
+        self.smoothing_level_ = optimal_smoothing_level(price[self.periods:], price[:self.periods].mean())
+
         return self
 
+    def save_model(self):
+        return {'smoothing_level': self.smoothing_level_}
+
+    def load_model(self, data):
+        self.smoothing_level_ = data['smoothing_level']
+
     def transform(self, X):
-        price = X['close']
+        if isinstance(X, list):
+            X = pd.concat(X)
 
-        EMA = pd.Series(SimpleExpSmoothing(
-            price.iloc[self.periods:].to_numpy(),
-            initialization_method='known',
-            initial_level=price.iloc[:self.periods].mean()
-        ).fit().fittedfcast, name='EMA')
+        return self.partial_transform(X)[0]
 
-        EMA.index = price.index[self.periods - 1:]
+    # the state is the number and the sum of the prices of the warm-up and the level
+    def partial_transform(self, X: pd.DataFrame, state: dict = None):
+        price = X['close'].to_numpy()
+        state = {'n': 0, 'sum': 0., 'level': None} if state is None else dict(state)
 
-        return EMA
+        n_warmed = state['n']
+        n_warm = warm_up(price, state, self.periods)
 
+        if state['n'] < self.periods:
+            return pd.Series([], index=X.index[:0], name='EMA', dtype=np.float64), state
 
-class EMATrendIdentifier(TransformerMixin, BaseEstimator):
-    def __init__(
-            self,
-            periods=14
-    ):
-        self.periods = periods
+        levels = smoothed_levels(price[n_warm:], state['level'], self.smoothing_level_)
+        state['level'] = levels[-1]
 
-    def fit(self, X):
-        return self
+        # the initial level is output at the last price of the warm-up
+        if n_warmed < self.periods:
+            return pd.Series(levels, index=X.index[n_warm - 1:], name='EMA'), state
 
-    def transform(self, X):
-        price = X['close']
+        return pd.Series(levels[1:], index=X.index[n_warm:], name='EMA'), state
+
+
+# whether the price is above the EMA of the previous prices
+class EMATrendIdentifier(EMA):
+    def partial_transform(self, X: pd.DataFrame, state: dict = None):
+        price = X['close'].to_numpy()
+        state = {'n': 0, 'sum': 0., 'level': None} if state is None else dict(state)
+
+        n_warm = warm_up(price, state, self.periods)
 
-        EMA = pd.Series(SimpleExpSmoothing(
-            price.iloc[self.periods:].to_numpy(),
-            initialization_method='known',
-            initial_level=price.iloc[:self.periods].mean()
-        ).fit().fittedvalues, name='EMA')
+        if state['n'] < self.periods:
+            return pd.Series([], index=X.index[:0], dtype=bool), state
 
-        EMA.index = price.index[self.periods:]
+        levels = smoothed_levels(price[n_warm:], state['level'], self.smoothing_level_)
+        state['level'] = levels[-1]
 
-        return (price.iloc[self.periods:] - EMA) > 0
+        return pd.Series(price[n_warm:] > levels[:-1], index=X.index[n_warm:]), state
@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+
+from engine.models.hmm import HMMLearn
+from engine.transformers.returns import Returns
+from engine.transformers.preprocessing import StandardScaler
+from engine.transformers.candles_processing import RemoveZeroActivityCandles
+from engine.model_selection import select_n_components
+from api.tinvest.tticker import TTicker
+from api.broker_list import t_invest
+from engine.candles.candles_uploader import LocalCandlesUploader
+
+import sys
+
+LocalCandlesUploader.broker = t_invest
+
+from sklearn import set_config
+set_config(transform_output="pandas")
+
+# usage: python hmm_select.py n_fits min_components max_components [ticker]
+if __name__ == '__main__':
+    n_fits = int(sys.argv[1])
+    n_components_range = range(int(sys.argv[2]), int(sys.argv[3]) + 1)
+    tick = TTicker(sys.argv[4] if len(sys.argv) > 4 else 'SBER')
+
+    # start of the validation set
+    t = datetime(year=2024, month=12, day=1).replace(tzinfo=timezone.utc)
+
+    results = select_n_components(
+        ticker=tick,
+        steps=[
+            RemoveZeroActivityCandles(),
+            Returns(keep_overnight=False, day_number=False, candle_to_price='two_way', keep_vol=False),
+            StandardScaler(with_mean=False),
+            HMMLearn(
+                covariance_type='full',
+                verbose=False,
+                tol=500,
+                n_iter=1000,
+            ),
+        ],
+        n_components_range=n_components_range,
+        end_date=t,
+        tries=n_fits
+    )
+
+    print(results.to_string(index=False))
@@ -56,15 +56,14 @@ pipe = Pipeline(tick).make_pipeline(
     end_date=t
 )
 
-pipe.fit(tries=n_fits, show_score=True)
+pipe.fit(tries=n_fits, verbose=True)
 
-X = pipe.final_datanodes.data.to_numpy()
+X = pipe.compute().to_numpy()
+# one pass over the emissions for the criteria, the score and the states, determine_states reuses the report
+report = pipe.model.evaluate(X)
 pipe.model.determine_states(X, pipe.fetch_data('Returns').sum(axis=1).to_numpy())
 
-bic = pipe.model.bic(X)
-aic = pipe.model.aic(X)
-score = pipe.model.score(X)
-ans = f'Number of states={n_components}\nAIC: {aic}\nBIC: {bic}\nScore: {score}'
+ans = f'Number of states={n_components}\nAIC: {report.aic}\nBIC: {report.bic}\nScore: {report.score}'
 
 print(ans)
 
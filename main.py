@@ -8,13 +8,18 @@ def main(
         client_config: dict = None,
         set_up_instruments: bool = False,
         mock_client_config: dict = None,
-        tickers_collection: list[str] = None
+        tickers_collection: list[str] = None,
+        stream_market_data: bool = False,
+        metrics: bool = False,
+        metrics_port: int = None
 ):
     client, tickers_collection, client_config, account = start_up(
         client_config=client_config,
         tickers_collection=tickers_collection,
         mock_client_config=mock_client_config,
-        set_up_instruments=set_up_instruments
+        set_up_instruments=set_up_instruments,
+        metrics=metrics,
+        metrics_port=metrics_port
     )
 
     if strategies is not None:
@@ -24,5 +29,6 @@ def main(
         ).launch(
             client_constructor=client,
             client_config=client_config,
-            tickers_collection=tickers_collection
+            tickers_collection=tickers_collection,
+            stream_market_data=stream_market_data
         )
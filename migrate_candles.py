@@ -0,0 +1,15 @@
+from api.broker_list import t_invest
+from engine.candles.candles_storage import ParquetCandlesStorage, migrate_candles
+
+import sys
+
+if __name__ == '__main__':
+    tickers = sys.argv[1:] if len(sys.argv) > 1 else None
+
+    migrated_tickers = migrate_candles(
+        broker_name=t_invest.broker_name,
+        target=ParquetCandlesStorage(),
+        tickers=tickers
+    )
+
+    print(f'Migrated candles of {len(migrated_tickers)} tickers: {", ".join(migrated_tickers)}')
@@ -0,0 +1,193 @@
+from datetime import datetime, timezone, timedelta
+import numpy as np
+import pandas as pd
+from engine.transformers.candles_processing import CandlesRefinerTransformer, combine_time_timedelta
+
+
+# the refiner with the loop filling the breaks before it was vectorized, kept verbatim as the reference
+# of fill_breaks_in_candle_data
+class BaselineRefiner(CandlesRefinerTransformer):
+    # this function returns filled data time series,
+    # indices of the start of trading days (minus the obvious first day index),
+    # ASSUMPTION: there is at least one candle between each trading break during each day
+    # ASSUMPTION: candle data is: open, low, high, close, volume; with datetime.datetime as index
+    def fill_breaks_in_candle_data(
+            self,
+            data: pd.DataFrame,
+    ) -> pd.DataFrame:
+        times = data.index.to_series().reset_index(drop=True)
+        data = data.to_dict(orient='list')
+
+        timediff = times.diff()
+        breaks_duration = timediff.dt.seconds / 60
+
+        # controlling for clearing breaks
+        break_in_trade = np.zeros(shape=times.shape)
+
+        for effective_date_interval, break_data in self._broker.break_in_working_hours.fetch_items(
+                self._ticker.type_instrument
+        ):
+            for break_interval in break_data:
+                break_interval['end'] = combine_time_timedelta(break_interval['start'], break_interval['duration'])
+
+                clearing_break = ((times.dt.date >= effective_date_interval[0])
+                                  & (times.dt.date < effective_date_interval[1])
+                                  & (times.dt.time >= break_interval['start']))
+
+                clearing_break = clearing_break.diff() * clearing_break
+
+                breaks_duration = clearing_break * (breaks_duration - break_interval['duration'].seconds / 60) + (
+                        1 - clearing_break) * breaks_duration
+
+                break_in_trade += clearing_break
+
+        break_in_trade[0] = False
+        break_in_trade = break_in_trade.iloc[1:].reset_index(drop=True)
+        break_in_trade[break_in_trade.shape] = False
+
+        times_shift_back1 = times.iloc[:-1]
+        times_shift_back1.index += 1
+        times_shift_back1[0] = times_shift_back1.iloc[0]
+
+        # controlling for the start of the trading day
+        prev_day_schedule = None
+        for effective_date_interval, day_schedule in self._broker.working_hours.fetch_items(
+                self._ticker.type_instrument
+        ):
+            trading_day_start = ((times.dt.date >= effective_date_interval[0])
+                                 & (times.dt.date < effective_date_interval[1])
+                                 & (times.dt.date.diff().dt.days > 0))
+
+            leftmost_trading_day_start = trading_day_start ^ ((times.dt.date > effective_date_interval[0])
+                                                              & (times.dt.date < effective_date_interval[1])
+                                                              & (times.dt.date.diff().dt.days > 0))
+
+            day_schedule['end'] = combine_time_timedelta(day_schedule['start'], day_schedule['duration'])
+
+            day_schedule_end_hour = (day_schedule['end'].hour * (day_schedule['end'].hour > 0)
+                                     + 24 * (day_schedule['end'].hour == 0))
+
+            trading_day_start_durations = ((times.dt.hour - day_schedule['start'].hour) * 60
+                                           + times.dt.minute - day_schedule['start'].minute
+                                           + (day_schedule_end_hour - times_shift_back1.dt.hour) * 60
+                                           + day_schedule['end'].minute - times_shift_back1.dt.minute)
+
+            if prev_day_schedule is not None:
+                prev_day_schedule_end_hour = (prev_day_schedule['end'].hour * (prev_day_schedule['end'].hour > 0)
+                                              + 24 * (prev_day_schedule['end'].hour == 0))
+
+                trading_day_start_durations = (((prev_day_schedule_end_hour - day_schedule_end_hour) * 60
+                                                + prev_day_schedule['end'].minute - day_schedule[
+                                                    'end'].minute) * leftmost_trading_day_start
+                                               + trading_day_start_durations)
+
+            breaks_duration = (trading_day_start * trading_day_start_durations
+                               + (1 - trading_day_start) * breaks_duration)
+
+            prev_day_schedule = day_schedule
+
+        breaks_duration = breaks_duration.iloc[1:].reset_index(drop=True)
+        breaks_duration[breaks_duration.shape] = (
+                (day_schedule_end_hour - times.iloc[-1].hour) * 60
+                + day_schedule['end'].minute - times.iloc[-1].minute)
+
+        trading_day_end = (times.dt.date.diff().dt.days > 0).iloc[1:].reset_index(drop=True)
+        trading_day_end[trading_day_end.shape] = True
+        breaks_duration.iloc[-1] = 1
+
+        filled_data = {key: [] for key in self.feature_names_out_}
+        filled_dates = []
+
+        times_shift_1 = times.iloc[1:].reset_index(drop=True)
+        times_shift_1[times_shift_1.shape] = times_shift_1.iloc[0]
+
+        # filling up new vector of data, and vector of indices of trading day ends
+        cur_idx_data, clearing_break_number = 0, 0
+        day_number = self._last_day_number + 1
+        times_iter, times_shift_iter, trading_day_end_iter, break_in_trade_iter = \
+            times.items(), times_shift_1.items(), trading_day_end.items(), break_in_trade.items()
+        for idx, duration in breaks_duration.items():
+            if idx % 10000 == 0:
+                print(idx, '/', len(breaks_duration))
+            end_of_day, trading_break = next(trading_day_end_iter)[1], next(break_in_trade_iter)[1]
+            t, t_next = next(times_iter)[1], next(times_shift_iter)[1]
+            prev_day_j, break_j = 0, 0
+            fake_break = False
+            break_dur = 0
+
+            # we need to differentiate here between the previous day
+            # and the next day
+            if end_of_day:
+                next_day_schedule = self._broker.working_hours.fetch_info(self._ticker.type_instrument, t_next.date())
+                next_day_open = datetime.combine(t_next.date(), next_day_schedule['start'], tzinfo=timezone.utc)
+
+                prev_day_schedule = self._broker.working_hours.fetch_info(self._ticker.type_instrument, t.date())
+                prev_day_close = datetime.combine(t.date(), prev_day_schedule['start'],
+                                                  tzinfo=timezone.utc) + prev_day_schedule['duration']
+
+            # we also need to establish the duration and date of the next break
+            if trading_break:
+                break_data = self._broker.break_in_working_hours.fetch_info(self._ticker.type_instrument, t.date())
+
+            for j in range(cur_idx_data, cur_idx_data + int(duration)):
+                # skipping inserts if end_of_day covers trading breaks too
+                # which is captured by nonzero clearing_break_number
+                if clearing_break_number < len(break_data) and end_of_day:
+                    prev_day_incr = t + timedelta(minutes=j - cur_idx_data)
+                    #print(t, prev_day_incr)
+
+                    if (prev_day_incr < prev_day_close
+                            and self._broker.break_in_working_hours.is_datetime_in_relevant_interval(
+                            self._ticker.type_instrument, prev_day_incr)):
+                        fake_break = True
+                        continue
+                    elif fake_break:
+                        clearing_break_number += 1
+                        fake_break = False
+
+                # inserting data into the timeseries
+                if j == cur_idx_data:
+                    for key in ['open', 'high', 'low', 'close', 'volume']:
+                        filled_data[key].append(data[key][idx])
+                # inserting missing data into the timeseries
+                else:
+                    for key in ['open', 'high', 'low', 'close']:
+                        filled_data[key].append(data['close'][idx])
+                    filled_data['volume'].append(0)
+
+                filled_data['day_number'].append(day_number)
+
+                # inserting missing datetime into the timeseries
+                if end_of_day:
+                    prev_day_incr = t + timedelta(minutes=j - cur_idx_data)
+
+                    if prev_day_incr < prev_day_close:
+                        filled_dates.append(prev_day_incr)
+                        prev_day_j += 1
+
+                        if prev_day_incr + timedelta(minutes=1) >= prev_day_close:
+                            day_number += 1
+                            clearing_break_number = 0
+                    else:
+                        filled_dates.append(
+                            next_day_open + timedelta(minutes=j - cur_idx_data - prev_day_j)
+                        )
+                elif trading_break:
+                    break_incr = t + timedelta(minutes=j - cur_idx_data + break_dur)
+
+                    if clearing_break_number < len(break_data):
+                        break_time = break_data[clearing_break_number]['start']
+                        break_date = datetime.combine(t.date(), break_time, tzinfo=timezone.utc)
+
+                        if break_incr == break_date - timedelta(minutes=1):
+                            break_dur += break_data[clearing_break_number]['duration'].seconds // 60
+                            clearing_break_number += 1
+
+                    filled_dates.append(break_incr)
+                else:
+                    filled_dates.append(t + timedelta(minutes=j - cur_idx_data))
+
+            cur_idx_data = cur_idx_data + int(duration)
+
+        filled_data['time'] = filled_dates
+        return pd.DataFrame(filled_data).set_index('time')
@@ -0,0 +1,148 @@
+import pandas as pd
+from engine.schemas.client import Services, RateLimit
+from engine.candles.candles_stream import CandlesReplayer
+from api.broker_list import t_invest
+from datetime import datetime
+from threading import Event, Lock
+from typing import Callable
+
+
+# the clock of a test, sleeping moves it forward instead of waiting
+class FakeClock:
+    def __init__(self, start: float = 0.):
+        self.time = start
+        self._lock = Lock()
+
+    def __call__(self) -> float:
+        with self._lock:
+            return self.time
+
+    def sleep(self, seconds: float):
+        with self._lock:
+            self.time += max(seconds, 0)
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, limit: int, remaining: int, reset: float):
+        super().__init__(f'{limit} requests a minute are exceeded, reset in {reset}s.')
+        self.limit, self.remaining, self.reset = limit, remaining, reset
+
+
+# the candle endpoint of the api on a local clock: the 1-minute candles of an instrument in a window, at most limit
+# requests a minute of the clock, a request over the limit fails with the limit and the seconds to the next minute,
+# as the api reports them; every failure_every-th request fails with a transient error
+class FakeCandlesServer:
+    def __init__(
+            self,
+            candles: dict[str, pd.DataFrame],
+            limit: int = None,
+            clock: Callable[[], float] = None,
+            failure_every: int = None
+    ):
+        self.candles = candles
+        self.limit = limit
+        self.clock = FakeClock() if clock is None else clock
+        self.failure_every = failure_every
+
+        self.requests: list[tuple[str, datetime, datetime]] = []
+        self.n_rejected = 0
+        self.n_failed = 0
+        self._minute, self._n_in_minute = None, 0
+        self._lock = Lock()
+
+    def get_candles(self, uid: str, from_: datetime, to: datetime) -> pd.DataFrame:
+        with self._lock:
+            now = self.clock()
+
+            if self._minute != now // 60:
+                self._minute, self._n_in_minute = now // 60, 0
+
+            if self.limit is not None and self._n_in_minute >= self.limit:
+                self.n_rejected += 1
+
+                raise RateLimitExceeded(self.limit, 0, 60 - now % 60)
+
+            self._n_in_minute += 1
+            self.requests.append((uid, from_, to))
+
+            if self.failure_every is not None and len(self.requests) % self.failure_every == 0:
+                self.n_failed += 1
+
+                raise ConnectionError('The connection is reset.')
+
+        candles = self.candles[uid]
+
+        return candles[(candles['time'] >= from_) & (candles['time'] < to)].reset_index(drop=True)
+
+
+def silent_stream(stop: Event):
+    stop.wait()
+
+    yield from ()
+
+
+# services requesting the candles from a FakeCandlesServer
+class FakeServices(Services):
+    def __init__(self, server: FakeCandlesServer):
+        self.server = server
+        self.broker = t_invest
+
+    def get_instruments(self):
+        pass
+
+    def _candles_writer(self, uid: str, from_: datetime, to: datetime = None):
+        return self.server.get_candles(uid, from_, to)
+
+    def _candles_window(self, uid: str, from_: datetime, to: datetime) -> pd.DataFrame:
+        return self.server.get_candles(uid, from_, to)
+
+    @staticmethod
+    def rate_limit(error: Exception):
+        if not isinstance(error, RateLimitExceeded):
+            return None
+
+        return RateLimit(limit=error.limit, remaining=error.remaining, reset=error.reset)
+
+    # the server has no streams, their subscriptions stay open without events
+    def market_data_events(self, uids: list[str], stop: Event):
+        return silent_stream(stop)
+
+    def order_state_events(self, account_id: str, stop: Event):
+        return silent_stream(stop)
+
+
+# services streaming and requesting the candles of a CandlesReplayer
+class ReplayServices(Services):
+    def __init__(self, replayer: CandlesReplayer):
+        self.replayer = replayer
+        self.broker = t_invest
+
+    def get_instruments(self):
+        pass
+
+    def _candles_writer(self, uid: str, from_: datetime, to: datetime = None):
+        return self.replayer.candles_writer(uid, from_, to)
+
+    def _candles_window(self, uid: str, from_: datetime, to: datetime) -> pd.DataFrame:
+        return self.replayer.candles_writer(uid, from_, to)
+
+    def market_data_events(self, uids: list[str], stop: Event):
+        return self.replayer(uids, stop)
+
+    def order_state_events(self, account_id: str, stop: Event):
+        return silent_stream(stop)
+
+
+class FakeClient:
+    order_threads = 1
+    stream_order_states = False
+
+    def __init__(self, server: FakeCandlesServer):
+        self.broker = t_invest
+        self.services = FakeServices(server)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
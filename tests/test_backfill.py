@@ -0,0 +1,171 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timedelta, timezone
+from conftest import make_ticker, make_candles
+from fake_candles_server import FakeCandlesServer, FakeClient
+import engine.candles.candles_storage as candles_storage
+from engine.candles.candles_storage import ParquetCandlesStorage
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.candles.backfill import CandlesBackfill, TokenBucket
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+from api.broker_list import t_invest
+
+START = datetime(2024, 12, 2, tzinfo=timezone.utc)
+END = datetime(2024, 12, 14, tzinfo=timezone.utc)
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def tickers(tmp_path, monkeypatch):
+    monkeypatch.setattr(candles_storage, 'candle_path', str(tmp_path) + '/')
+    monkeypatch.setattr(LocalCandlesUploader, 'storage', ParquetCandlesStorage())
+    monkeypatch.setattr(LocalCandlesUploader, 'broker', t_invest, raising=False)
+
+    tickers = [make_ticker(n) for n in range(3)]
+
+    for ticker in tickers:
+        monkeypatch.setitem(LocalCandlesUploader.candles_start_dates, ticker, START)
+
+    return tickers
+
+
+@pytest.fixture
+def candles(tickers) -> dict[str, pd.DataFrame]:
+    days = [date(2024, 12, 2) + timedelta(days=i) for i in range(12)]
+
+    return {ticker.uid: make_candles(days, share=0.6, seed=n) for n, ticker in enumerate(tickers)}
+
+
+def backfill(server: FakeCandlesServer, tmp_path, **kwargs) -> CandlesBackfill:
+    clock = server.clock
+
+    return CandlesBackfill(
+        client_factory=lambda: FakeClient(server),
+        flush_windows=kwargs.pop('flush_windows', 3),
+        checkpoint_path=str(tmp_path) + '/backfill.json',
+        bucket=TokenBucket(6000, clock=clock, sleep_for=clock.sleep),
+        sleep_for=clock.sleep,
+        **kwargs
+    )
+
+
+# the stored candles of every ticker are its candles refined at once
+def assert_stored(tickers, candles):
+    for ticker in tickers:
+        stored = LocalCandlesUploader.storage.read(t_invest.broker_name, ticker.ticker_sign)
+        raw = candles[ticker.uid]
+        refined = CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(raw)
+
+        assert not stored.index.duplicated().any()
+        assert stored.index.equals(refined.index)
+        assert np.allclose(stored[refined.columns].to_numpy(np.float64), refined.to_numpy(np.float64))
+
+
+@pytest.mark.parametrize('n_threads', [1, 4])
+def test_backfill(tickers, candles, tmp_path, n_threads):
+    server = FakeCandlesServer(candles)
+    report = backfill(server, tmp_path, n_threads=n_threads).run(tickers, END)
+
+    assert (report['windows'] == 12).all() and (report['stored_windows'] == 12).all()
+    assert len(server.requests) == 36 and len(set(server.requests)) == 36
+    assert_stored(tickers, candles)
+
+
+# the bucket takes the limit reported by the server, the requests are spread over the minutes of the limit
+def test_rate_limit(tickers, candles, tmp_path):
+    server = FakeCandlesServer(candles, limit=10)
+    bucket_backfill = backfill(server, tmp_path, n_threads=4)
+    bucket_backfill.run(tickers, END)
+
+    assert server.n_rejected > 0
+    assert bucket_backfill.bucket.rate == pytest.approx(10 / 60)
+    assert server.clock() >= 60 * (36 // 10)
+    assert_stored(tickers, candles)
+
+
+# transient errors are retried after a backoff on the clock of the backfill
+def test_retries(tickers, candles, tmp_path):
+    server = FakeCandlesServer(candles, failure_every=5)
+    backfill(server, tmp_path, n_threads=2).run(tickers, END)
+
+    assert server.n_failed > 0 and server.clock() >= 2 * server.n_failed
+    assert_stored(tickers, candles)
+
+
+def test_retries_exhausted(tickers, candles, tmp_path):
+    server = FakeCandlesServer(candles, failure_every=1)
+
+    with pytest.raises(ConnectionError):
+        backfill(server, tmp_path, n_threads=1, retries=2).run(tickers, END)
+
+    assert server.clock() >= 2 + 4
+
+
+def test_resume(tickers, candles, tmp_path, monkeypatch):
+    server = FakeCandlesServer(candles)
+    interrupted_backfill = backfill(server, tmp_path, n_threads=2)
+    n_requests = 0
+
+    def interrupting_request(*args):
+        nonlocal n_requests
+        n_requests += 1
+
+        if n_requests > 20:
+            raise Interrupted()
+
+        return CandlesBackfill._request(interrupted_backfill, *args)
+
+    monkeypatch.setattr(interrupted_backfill, '_request', interrupting_request)
+
+    with pytest.raises(Interrupted):
+        interrupted_backfill.run(tickers, END)
+
+    n_first = len(server.requests)
+    report = backfill(server, tmp_path, n_threads=2).run(tickers, END)
+
+    # only the windows after the checkpoint are requested again
+    assert report['stored_windows'].sum() < 36
+    assert len(server.requests) - n_first == report['windows'].sum()
+    assert_stored(tickers, candles)
+
+    # nothing is left to request
+    report = backfill(server, tmp_path).run(tickers, END)
+
+    assert (report['windows'] == 0).all()
+    assert_stored(tickers, candles)
+
+
+# candles stored without their checkpoint are continued from the storage instead of being stored twice,
+# also when the windows are flushed in other groups than before
+def test_interrupted_between_storage_and_checkpoint(tickers, candles, tmp_path, monkeypatch):
+    server = FakeCandlesServer(candles)
+    interrupted_backfill = backfill(server, tmp_path, n_threads=1)
+    n_checkpoints = 0
+
+    def interrupting_write(broker, checkpoint):
+        nonlocal n_checkpoints
+        n_checkpoints += 1
+
+        if n_checkpoints == 5:
+            raise Interrupted()
+
+        CandlesBackfill._write_checkpoint(interrupted_backfill, broker, checkpoint)
+
+    monkeypatch.setattr(interrupted_backfill, '_write_checkpoint', interrupting_write)
+
+    with pytest.raises(Interrupted):
+        interrupted_backfill.run(tickers, END)
+
+    last_stored = {ticker.uid: LocalCandlesUploader.storage.read_last(t_invest.broker_name, ticker.ticker_sign).index[0]
+                   for ticker in tickers}
+    n_first = len(server.requests)
+
+    backfill(server, tmp_path, n_threads=1, flush_windows=4).run(tickers, END)
+
+    # no window of the stored candles is requested again
+    assert all(from_ > last_stored[uid] for uid, from_, _ in server.requests[n_first:])
+    assert_stored(tickers, candles)
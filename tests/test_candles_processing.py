@@ -0,0 +1,155 @@
+import pytest
+import numpy as np
+import pandas as pd
+import contextlib
+import copy
+import io
+from datetime import date, datetime, time, timedelta, timezone
+from conftest import make_ticker
+from baseline_candles_processing import BaselineRefiner
+from api.broker_list import t_invest
+from engine.transformers.candles_processing import CandlesRefinerTransformer, RemoveSession, combine_time_timedelta
+
+# the start of the broker and the first schedules, the schedule switches of 2020, 2022 and 2024,
+# the working weekends of 2024 and the new year holidays
+PERIODS = [
+    (date(2018, 3, 7), date(2018, 3, 16)),
+    (date(2018, 6, 6), date(2018, 6, 11)),
+    (date(2020, 6, 19), date(2020, 6, 24)),
+    (date(2021, 12, 3), date(2021, 12, 8)),
+    (date(2022, 2, 23), date(2022, 4, 2)),
+    (date(2024, 4, 26), date(2024, 4, 30)),
+    (date(2024, 8, 12), date(2024, 8, 16)),
+    (date(2024, 12, 27), date(2025, 1, 10))
+]
+
+SESSIONS = [['premarket'], ['main'], ['afterhours'], ['premarket', 'afterhours']]
+
+
+# a random share of all the minutes of the periods, in the trading hours or not
+@pytest.fixture(scope='module')
+def minutes() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    index = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(start, end, freq='min', tz='UTC', inclusive='left') for start, end in PERIODS
+    ]), name='time')
+    index = index[rng.random(len(index)) < 0.2]
+    close = 100 + rng.normal(size=len(index)).cumsum()
+
+    return pd.DataFrame({'open': close, 'close': close, 'high': close, 'low': close, 'volume': 1}, index=index)
+
+
+@pytest.fixture(scope='module')
+def trading_minutes(minutes) -> pd.DataFrame:
+    return CandlesRefinerTransformer(broker=t_invest, ticker=make_ticker()).clear_redundant_candles(minutes)
+
+
+def test_clear_redundant_candles(minutes, trading_minutes):
+    legacy = CandlesRefinerTransformer(broker=t_invest, ticker=make_ticker(), vectorized=False)
+
+    assert trading_minutes.index.equals(legacy.clear_redundant_candles(minutes).index)
+    # holidays, weekends and breaks are cleared, the working weekends are not
+    assert not (trading_minutes.index.date == date(2025, 1, 2)).any()
+    assert not (trading_minutes.index.date == date(2024, 12, 29)).any()
+    assert (trading_minutes.index.date == date(2024, 12, 28)).any()
+    assert not ((trading_minutes.index.date == date(2024, 8, 13)) & (trading_minutes.index.hour == 15)
+                & (trading_minutes.index.minute >= 40)).any()
+
+
+# the candles in a removed session of the schedule of their day, by the schedule of sessions
+def in_removed_session(X: pd.DataFrame, remove_session: list[str]) -> np.ndarray:
+    sessions = RemoveSession(broker=t_invest, ticker=make_ticker(), remove_session=remove_session).remove_session
+    removed = []
+
+    for candle_date in X.index:
+        schedule = t_invest.session_type.fetch_info(make_ticker().type_instrument, candle_date.date())
+        starts = {
+            session: datetime.combine(candle_date.date(), schedule[session]['start'], tzinfo=timezone.utc)
+            for session in sessions if session in schedule.keys()
+        }
+
+        removed.append(any(
+            start <= candle_date < start + schedule[session]['duration'] for session, start in starts.items()
+        ))
+
+    return np.array(removed)
+
+
+@pytest.mark.parametrize('remove_session', SESSIONS)
+def test_remove_session(trading_minutes, remove_session):
+    transformer = RemoveSession(broker=t_invest, ticker=make_ticker(), remove_session=remove_session)
+    legacy = RemoveSession(broker=t_invest, ticker=make_ticker(), remove_session=remove_session, vectorized=False)
+
+    retained = transformer.transform(trading_minutes)
+    retained_legacy = legacy.transform(trading_minutes)
+
+    assert retained.index.equals(trading_minutes.index[~in_removed_session(trading_minutes, remove_session)])
+
+    # the periods of the schedule without a removed session are the same; as the legacy code joins the conditions
+    # around a session by &, it keeps no candles of the periods having one, but the ones before the sessions
+    # ending at midnight
+    for (start_period, end_period), schedule in t_invest.session_type.fetch_items(make_ticker().type_instrument):
+        in_period = (start_period <= trading_minutes.index.date) & (trading_minutes.index.date < end_period)
+        expected = trading_minutes[in_period]
+        removed = [schedule[session] for session in transformer.remove_session if session in schedule.keys()]
+
+        if len(removed) == 0:
+            expected = retained[(start_period <= retained.index.date) & (retained.index.date < end_period)]
+        elif all(combine_time_timedelta(session['start'], session['duration']) == time(0) for session in removed):
+            expected = expected[expected.index.time < min(session['start'] for session in removed)]
+        else:
+            expected = expected.iloc[:0]
+
+        in_period_legacy = (start_period <= retained_legacy.index.date) & (retained_legacy.index.date < end_period)
+
+        assert retained_legacy.index[in_period_legacy].equals(expected.index)
+
+
+# candles on a share of the trading minutes of the days, every segment of trading minutes ends with a candle
+def candles_with_gaps(start: date, end: date, share: float = 0.5, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, end, freq='min', tz='UTC', inclusive='left', name='time')
+    X = CandlesRefinerTransformer(broker=t_invest, ticker=make_ticker()).clear_redundant_candles(
+        pd.DataFrame(index=index)
+    )
+    segment_end = ~(X.index + timedelta(minutes=1)).isin(X.index)
+    X = X[(rng.random(len(X)) < share) | segment_end]
+    close = 100 + rng.normal(size=len(X)).cumsum()
+
+    return X.assign(open=close + rng.normal(size=len(X)), close=close, high=close + 1, low=close - 1,
+                    volume=rng.integers(1, 100, len(X)))
+
+
+def fill_breaks(X: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    refiner = CandlesRefinerTransformer(broker=t_invest, ticker=make_ticker())
+    baseline = BaselineRefiner(broker=copy.deepcopy(t_invest), ticker=make_ticker())
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return refiner.fill_breaks_in_candle_data(X), baseline.fill_breaks_in_candle_data(X)
+
+
+# the schedule without breaks of 2022 over a weekend, and the schedule with a break before the close of 2019
+@pytest.mark.parametrize('start, end', [(date(2022, 3, 24), date(2022, 3, 31)), (date(2019, 3, 4), date(2019, 3, 9))])
+def test_fill_breaks_same_as_baseline(start, end):
+    filled, expected = fill_breaks(candles_with_gaps(start, end))
+
+    assert filled.index.equals(expected.index)
+    assert list(filled.columns) == list(expected.columns) and (filled.dtypes == expected.dtypes).all()
+    assert np.array_equal(filled.to_numpy(), expected.to_numpy())
+
+
+# a day whose last candle is before the break of 2019: the baseline loop shifts the first minutes of the next
+# morning by the duration of the break, repeating them, the grid does not
+def test_fill_breaks_last_candle_before_break():
+    X = candles_with_gaps(date(2019, 3, 4), date(2019, 3, 9))
+    X = X[~((X.index.date == date(2019, 3, 5)) & (X.index.time > time(15)))]
+
+    filled, expected = fill_breaks(X)
+    shifted = filled.index != expected.index
+    next_morning = np.flatnonzero(filled.index.date == date(2019, 3, 6))
+
+    assert np.array_equal(filled.to_numpy(), expected.to_numpy())
+    assert not filled.index.has_duplicates and expected.index.has_duplicates
+    assert filled.index[next_morning[0]] == datetime(2019, 3, 6, 6, 59, tzinfo=timezone.utc)
+    assert shifted[next_morning[0]] and np.array_equal(np.flatnonzero(shifted), next_morning[:shifted.sum()])
+    assert (expected.index[shifted] - filled.index[shifted] == timedelta(minutes=5)).all()
@@ -0,0 +1,112 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timedelta, timezone
+from time import monotonic, sleep
+from conftest import make_ticker, make_candles
+from fake_candles_server import ReplayServices
+import engine.candles.candles_storage as candles_storage
+from engine.candles.candles_storage import ParquetCandlesStorage
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.candles.candles_stream import CandlesStream, CandlesReplayer
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+from api.broker_list import t_invest
+
+# the stream continues the candles stored before it
+CUT = datetime(2024, 12, 3, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def tickers(tmp_path, monkeypatch):
+    monkeypatch.setattr(candles_storage, 'candle_path', str(tmp_path) + '/')
+    monkeypatch.setattr(LocalCandlesUploader, 'storage', ParquetCandlesStorage())
+    monkeypatch.setattr(LocalCandlesUploader, 'broker', t_invest, raising=False)
+
+    for cache in ['candles_in_memory', 'new_candles', 'candles_start_dates', 'last_candles']:
+        monkeypatch.setattr(LocalCandlesUploader, cache, {})
+
+    return [make_ticker(n) for n in range(3)]
+
+
+@pytest.fixture
+def candles(tickers) -> dict[str, pd.DataFrame]:
+    days = [date(2024, 12, 2) + timedelta(days=i) for i in range(4)]
+    candles = {}
+
+    for n, ticker in enumerate(tickers):
+        candles[ticker.uid] = make_candles(days, share=0.3 + 0.3 * n, seed=n)
+
+        stored = candles[ticker.uid][candles[ticker.uid]['time'] < CUT]
+        LocalCandlesUploader.storage.append(
+            CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(stored),
+            t_invest.broker_name,
+            ticker.ticker_sign
+        )
+
+    return candles
+
+
+# the candles are taken from the stream while it is replayed, until the last candle of every ticker is received
+def stream_candles(tickers, candles, replayer: CandlesReplayer, **kwargs) -> CandlesStream:
+    services = ReplayServices(replayer)
+    stream = CandlesStream(services, tickers, clock=replayer.now, reconnect_delay=0., max_reconnect_delay=0.,
+                           **kwargs)
+    deadline = monotonic() + 60
+
+    stream.start()
+
+    try:
+        while True:
+            received = all(stream._next_candle_time[ticker.uid] > candles[ticker.uid]['time'].iloc[-1]
+                           for ticker in tickers)
+
+            for ticker in tickers:
+                services.get_candles(ticker)
+
+            if received:
+                break
+
+            assert monotonic() < deadline
+            sleep(0.001)
+    finally:
+        stream.stop()
+
+    return stream
+
+
+# the candles lost in the gaps of a broken stream are requested, the saved candles are the candles refined at once;
+# the breaks are passed to on_error, nothing is printed from the thread
+@pytest.mark.parametrize('disconnect_after, gap_minutes', [(None, 0), (50, 0), (40, 7), (3, 90)])
+def test_stream(tickers, candles, disconnect_after, gap_minutes, capsys):
+    replayer = CandlesReplayer(
+        {uid: frame[frame['time'] >= CUT] for uid, frame in candles.items()},
+        disconnect_after=disconnect_after,
+        gap_minutes=gap_minutes
+    )
+    errors = []
+    stream = stream_candles(tickers, candles, replayer, on_error=lambda error, delay: errors.append(error))
+
+    if disconnect_after is not None:
+        assert stream.n_reconnects > 0
+
+    assert len(errors) == stream.n_reconnects and (len(errors) == 0 or stream.last_error is errors[-1])
+    assert capsys.readouterr().out == ''
+
+    for ticker in tickers:
+        saved = LocalCandlesUploader.new_candles[ticker].frame()
+        refined = CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(candles[ticker.uid])
+
+        assert saved.index.equals(refined.index)
+        assert np.allclose(saved[refined.columns].to_numpy(np.float64), refined.to_numpy(np.float64))
+
+
+# the last top of book of the stream, none after it is stopped
+def test_order_book(tickers, candles):
+    replayer = CandlesReplayer({uid: frame[frame['time'] >= CUT] for uid, frame in candles.items()})
+    stream = stream_candles(tickers, candles, replayer)
+    last = candles[tickers[1].uid].iloc[-1]
+
+    order_book = stream.order_book(tickers[1].uid)
+
+    assert order_book.bids[0].price == last['low'] and order_book.asks[0].price == last['high']
+    assert stream.services.candles_stream is None
@@ -0,0 +1,102 @@
+import pytest
+import numpy as np
+import pandas as pd
+import copy
+import engine.schemas.data_broker as data_broker
+from engine.schemas.data_broker import transform_node
+from engine.schemas.feature_cache import FeatureCache
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+from engine.transformers.tech_indicators import EMA
+from engine.transformers.streaming import partial_transform
+from api.broker_list import t_invest
+
+CHAIN = 'Candle__EMA()'
+
+
+@pytest.fixture
+def refined(ticker, candles) -> pd.DataFrame:
+    return CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(candles)
+
+
+@pytest.fixture
+def n_transformed(monkeypatch) -> list[int]:
+    n_transformed = []
+
+    def counting_partial_transform(transformer, X, state=None):
+        n_transformed.append(len(X))
+
+        return partial_transform(transformer, X, state)
+
+    monkeypatch.setattr(data_broker, 'partial_transform', counting_partial_transform)
+
+    return n_transformed
+
+
+def compute(ticker, transformer, parent_data, fitted, cache=None):
+    data, _, _, state = transform_node(
+        copy.deepcopy(transformer), parent_data, fitted, ticker, CHAIN,
+        end_date=parent_data.index[-1], feature_cache=cache
+    )
+
+    return data, state
+
+
+def assert_same(data, expected):
+    assert data.index.equals(expected.index)
+    assert np.allclose(data.to_numpy(np.float64), expected.to_numpy(np.float64), equal_nan=True)
+
+
+# a transformer still to be fitted reuses the output computed from the same data to the same end date
+def test_hit(ticker, refined, tmp_path, n_transformed):
+    cache = FeatureCache(path=str(tmp_path) + '/')
+    computed, _ = compute(ticker, EMA(), refined, False, cache)
+    cached, _ = compute(ticker, EMA(), refined, False, cache)
+
+    assert n_transformed == [len(refined)]
+    assert_same(cached, computed)
+
+
+# a fitted transformer continues the cached output with the rows appended to the parent data since then
+def test_continuation(ticker, refined, tmp_path, n_transformed):
+    cache = FeatureCache(path=str(tmp_path) + '/')
+    transformer = EMA().fit(refined.iloc[:500])
+
+    compute(ticker, transformer, refined.iloc[:500], True, cache)
+    continued, state = compute(ticker, transformer, refined, True, cache)
+    expected, expected_state = compute(ticker, transformer, refined, True)
+
+    assert n_transformed[:2] == [500, len(refined) - 500]
+    assert_same(continued, expected)
+    assert np.allclose(state['level'], expected_state['level'])
+
+
+# the parent data starting with other rows than the cached output was computed from is transformed again:
+# candles backfilled before the first ones, or a refined candle changed afterwards
+@pytest.mark.parametrize('change', ['backfilled', 'changed'])
+def test_invalidation(ticker, refined, tmp_path, n_transformed, change):
+    cache = FeatureCache(path=str(tmp_path) + '/')
+    transformer = EMA().fit(refined.iloc[:500])
+
+    if change == 'backfilled':
+        compute(ticker, transformer, refined.iloc[100:500], True, cache)
+        parent_data = refined
+    else:
+        compute(ticker, transformer, refined.iloc[:500], True, cache)
+        parent_data = refined.copy()
+        parent_data.iloc[200, parent_data.columns.get_loc('close')] += 1
+
+    data, _ = compute(ticker, transformer, parent_data, True, cache)
+    expected, _ = compute(ticker, transformer, parent_data, True)
+
+    assert n_transformed[1] == len(parent_data)
+    assert_same(data, expected)
+
+
+def test_parent_entry(refined):
+    entry = FeatureCache.parent_entry(refined.iloc[:500])
+
+    assert FeatureCache.continues(entry, refined)
+    assert not FeatureCache.continues(entry, refined.iloc[:499])
+    assert not FeatureCache.continues(entry, refined.iloc[1:])
+    # entries written before the parent data was kept are not continued
+    assert not FeatureCache.continues({'n_parent_rows': 500}, refined)
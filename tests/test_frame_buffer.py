@@ -0,0 +1,113 @@
+import pytest
+import numpy as np
+import pandas as pd
+from api.broker_list import t_invest
+import engine.candles.candles_storage as candles_storage
+from engine.candles.candles_storage import ParquetCandlesStorage
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.schemas.frame_buffer import FrameBuffer
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+
+
+@pytest.fixture
+def refined(ticker, candles) -> pd.DataFrame:
+    refined = CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(candles)
+    refined['traded'] = refined['volume'] > 0
+
+    return refined
+
+
+def chunks(frame: pd.DataFrame, sizes: list[int]) -> list[pd.DataFrame]:
+    ends = np.cumsum(sizes)
+
+    return [frame.iloc[end - size:end] for size, end in zip(sizes, ends)]
+
+
+# rows appended one by one, by chunks and by lists grow the arrays and give the concatenated frame,
+# with the columns, dtypes and index of the appended frames
+def test_append(refined):
+    buffer = FrameBuffer(refined.iloc[:3], capacity=4)
+
+    buffer.append(refined.iloc[3:4])
+    buffer.append(refined.iloc[4:4])
+    buffer.append(chunks(refined.iloc[4:], [1, 30, 500]))
+    buffer.append(refined.iloc[535:])
+
+    pd.testing.assert_frame_equal(buffer.frame(), refined)
+    assert len(buffer) == len(refined)
+
+
+# a buffer made of nothing takes the layout of the first rows, a series stays a series
+def test_append_to_empty(refined):
+    pd.testing.assert_frame_equal(FrameBuffer().append(refined.iloc[:10]).append(refined.iloc[10:]).frame(), refined)
+
+    series = refined['close'].rename('price')
+    buffer = FrameBuffer(series.iloc[:0]).append(series.iloc[:10]).append(series.iloc[10:])
+
+    pd.testing.assert_series_equal(buffer.frame(), series)
+
+
+# the rows from a position are views of the arrays, the ones returned before an append that grows the arrays
+# keep their rows
+def test_slice_from_position(refined):
+    buffer = FrameBuffer(refined.iloc[:100], capacity=128)
+    before = buffer.frame(90)
+
+    buffer.append(refined.iloc[100:])
+
+    pd.testing.assert_frame_equal(before, refined.iloc[90:100])
+    pd.testing.assert_frame_equal(buffer.frame(90), refined.iloc[90:])
+    pd.testing.assert_frame_equal(buffer.frame(90, 150), refined.iloc[90:150])
+    pd.testing.assert_frame_equal(buffer.frame(len(refined)), refined.iloc[:0])
+    assert np.shares_memory(buffer.frame(200)['close'].to_numpy(), buffer.frame()['close'].to_numpy())
+
+
+# the rows after the compaction are new until the next compaction, which keeps the rows at their positions
+def test_compaction(refined):
+    buffer = FrameBuffer(refined.iloc[:100])
+
+    assert len(buffer.new_frame()) == 0
+
+    buffer.append(refined.iloc[100:250])
+    pd.testing.assert_frame_equal(buffer.new_frame(), refined.iloc[100:250])
+    pd.testing.assert_frame_equal(buffer.compact(), refined.iloc[:250])
+
+    assert len(buffer.new_frame()) == 0
+
+    buffer.append(refined.iloc[250:])
+    pd.testing.assert_frame_equal(buffer.new_frame(), refined.iloc[250:])
+    pd.testing.assert_frame_equal(buffer.frame(100), refined.iloc[100:])
+
+
+# the new candles follow the candles in memory in the buffer of the ticker and are read from a position of it,
+# caching them stores the new candles only and keeps the positions
+def test_get_new_candles(ticker, refined, tmp_path, monkeypatch):
+    refined = refined.drop(columns='traded')
+    monkeypatch.setattr(candles_storage, 'candle_path', str(tmp_path) + '/')
+    monkeypatch.setattr(LocalCandlesUploader, 'storage', ParquetCandlesStorage())
+    monkeypatch.setattr(LocalCandlesUploader, 'broker', t_invest, raising=False)
+
+    for attribute in ['new_candles', 'last_candles', 'candles_start_dates']:
+        monkeypatch.setattr(LocalCandlesUploader, attribute, {})
+
+    monkeypatch.setattr(LocalCandlesUploader, 'candles_in_memory', {ticker: refined.iloc[:1000]})
+
+    assert len(LocalCandlesUploader.get_new_candles(ticker, 1000)) == 0
+
+    for chunk in chunks(refined.iloc[1000:2000], [1, 0, 99, 900]):
+        LocalCandlesUploader.save_new_candles(chunk, ticker)
+
+    pd.testing.assert_frame_equal(LocalCandlesUploader.get_new_candles(ticker, 1000), refined.iloc[1000:2000])
+    pd.testing.assert_frame_equal(LocalCandlesUploader.get_new_candles(ticker, 1500), refined.iloc[1500:2000])
+    pd.testing.assert_frame_equal(LocalCandlesUploader.get_last_candle(ticker), refined.iloc[1999:2000])
+    assert LocalCandlesUploader.get_new_candle_datetime(ticker) == refined.index[1999] + pd.Timedelta(minutes=1)
+
+    LocalCandlesUploader.cache_new_candles()
+    LocalCandlesUploader.save_new_candles(refined.iloc[2000:], ticker)
+
+    pd.testing.assert_frame_equal(LocalCandlesUploader.candles_in_memory[ticker], refined.iloc[:2000])
+    pd.testing.assert_frame_equal(LocalCandlesUploader.get_new_candles(ticker, 1500), refined.iloc[1500:])
+    pd.testing.assert_frame_equal(
+        LocalCandlesUploader.storage.read(t_invest.broker_name, ticker.ticker_sign), refined.iloc[1000:2000],
+        check_freq=False
+    )
@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+from conftest import make_ticker
+from api.broker_list import t_invest
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.schemas.data_broker import Pipeline
+from engine.schemas.graph_executor import GraphExecutor
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+from engine.transformers.returns import Returns
+from engine.transformers.tech_indicators import RSI, EMA
+
+TICKERS = [make_ticker(0), make_ticker(1)]
+
+
+# the refined candles of the tickers in memory, and no node interned by other tests
+@pytest.fixture
+def uploaded(candles, monkeypatch):
+    monkeypatch.setattr(Pipeline, 'nodes', {})
+
+    for ticker in TICKERS:
+        refined = CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(candles)
+        monkeypatch.setitem(LocalCandlesUploader.candles_in_memory, ticker, refined)
+
+
+# pipelines of three branches sharing the candles, for every ticker
+def pipelines(end_date) -> list[Pipeline]:
+    return [
+        Pipeline(ticker).make_pipeline(steps, end_date=end_date)
+        for ticker in TICKERS
+        for steps in [[Returns()], [EMA()], [RSI()]]
+    ]
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_same_as_sequential(uploaded, candles, monkeypatch, processes):
+    end_date = candles['time'].iloc[-1]
+
+    sequential = [pipe.compute() for pipe in pipelines(end_date)]
+
+    monkeypatch.setattr(Pipeline, 'nodes', {})
+    pipes = pipelines(end_date)
+    timings = GraphExecutor(n_processes=2, processes=processes).compute(pipes)
+
+    # the candles of every ticker and the transformer of every pipeline
+    assert len(timings) == len(TICKERS) + len(pipes)
+
+    for pipe, expected in zip(pipes, sequential):
+        data = pipe.compute()
+
+        assert data.index.equals(expected.index) and list(data.columns) == list(expected.columns)
+        assert np.allclose(data.to_numpy(np.float64), expected.to_numpy(np.float64), equal_nan=True)
+
+
+def test_timings_of_last_computation(uploaded, candles):
+    executor = GraphExecutor()
+
+    executor.compute(pipelines(candles['time'].iloc[-1]))
+    timings = executor.compute(pipelines(candles['time'].iloc[-100]))
+
+    assert len(timings) == len(executor.timings) == 4 * len(TICKERS)
+    assert (timings['rows'] < len(LocalCandlesUploader.candles_in_memory[TICKERS[0]])).all()
@@ -0,0 +1,219 @@
+import pytest
+import numpy as np
+import pandas as pd
+import copy
+import pickle
+
+pytest.importorskip('pomegranate')
+pytest.importorskip('torch')
+
+from hmmlearn.hmm import GaussianHMM
+
+from engine.models.hmm import HMMLearn, batch_update
+
+
+# observations of 2 features switching between 3 regimes of different means and volatilities
+def regimes(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    states = np.cumsum(rng.random(n) < 0.02) % 3
+    means = np.array([[0., 0.], [1., -1.], [-1., 2.]])
+    scales = np.array([0.5, 1., 2.])
+
+    return means[states] + scales[states, None] * rng.normal(size=(n, 2))
+
+
+def fitted(n_components: int, covariance_type: str = 'full', seed: int = 0) -> HMMLearn:
+    return HMMLearn(n_components=n_components, covariance_type=covariance_type, n_iter=20,
+                    random_state=seed).fit(regimes(2000, seed))
+
+
+# hmmlearn's own model with the parameters of the model
+def reference(model: HMMLearn) -> GaussianHMM:
+    hmm = GaussianHMM(n_components=model.n_components, covariance_type=model.covariance_type)
+    hmm.n_features = model.n_features
+    hmm.startprob_, hmm.transmat_, hmm.means_ = model.startprob_, model.transmat_, model.means_
+    hmm._covars_ = model._covars_
+
+    return hmm
+
+
+# the filters of models with different numbers of states, updated at once by windows of different lengths,
+# are the filters updated model by model
+def test_batch_update():
+    models = [fitted(2, seed=0), fitted(3, seed=1), fitted(2, 'diag', seed=2), fitted(4, seed=3), fitted(3, seed=4)]
+    windows = [pd.DataFrame(regimes(n, seed=10 + n)) for n in [50, 7, 0, 120, 1]]
+    expected = copy.deepcopy(models)
+
+    for model, X in zip(expected, windows):
+        model.update(X)
+
+    batch_update(models, windows)
+
+    for model, expected_model in zip(models, expected):
+        assert np.allclose(model.filter.log_posterior, expected_model.filter.log_posterior, atol=1e-10)
+        assert model.filter.log_likelihood == pytest.approx(expected_model.filter.log_likelihood, rel=1e-12)
+
+
+# the filter after the fit and after the updates holds the last posterior and the score of hmmlearn
+# over all the observations seen
+@pytest.mark.parametrize('covariance_type', ['full', 'diag', 'spherical'])
+def test_filter_same_as_hmmlearn(covariance_type):
+    model = fitted(3, covariance_type)
+    hmm = reference(model)
+    X = regimes(2000, 0)
+
+    for n in [0, 1, 30, 200]:
+        Y = regimes(n, seed=20 + n)
+        model.update(pd.DataFrame(Y))
+        X = np.vstack([X, Y])
+
+        assert np.allclose(np.exp(model.filter.log_posterior), hmm.predict_proba(X)[-1], atol=1e-8)
+        assert model.filter.log_likelihood == pytest.approx(hmm.score(X), rel=1e-10)
+
+
+# the filter started on several sequences continues the last one and sums the scores of all
+def test_filter_lengths():
+    X = regimes(600, 5)
+    model = HMMLearn(n_components=2, n_iter=10, random_state=0).fit(X, lengths=[200, 250, 150])
+    hmm = reference(model)
+
+    assert np.allclose(np.exp(model.filter.log_posterior), hmm.predict_proba(X[-150:])[-1], atol=1e-8)
+    assert model.filter.log_likelihood == pytest.approx(hmm.score(X, lengths=[200, 250, 150]), rel=1e-10)
+
+
+# a model pickled before the forward filter, with forward_prob and posterior_prob as attributes,
+# is loaded with the filter of these probabilities and updated as the model it was pickled from
+def test_load_old_pickle():
+    model = fitted(3)
+    model.update(pd.DataFrame(regimes(40, 1)))
+
+    old = HMMLearn.__new__(HMMLearn)
+    old.__dict__.update({
+        key: value for key, value in copy.deepcopy(model.__dict__).items()
+        if key not in ['filter', '_emissions', '_emissions_fingerprint', '_report']
+    })
+    old.__dict__['forward_prob'] = model.filter.forward_prob
+    old.__dict__['posterior_prob'] = model.filter.log_posterior.copy()
+
+    loaded = pickle.loads(pickle.dumps(old))
+
+    assert 'forward_prob' not in loaded.__dict__ and 'posterior_prob' not in loaded.__dict__
+    assert np.allclose(loaded.posterior_prob, model.posterior_prob)
+    assert loaded.filter.log_likelihood == pytest.approx(model.filter.log_likelihood, rel=1e-12)
+
+    Y = pd.DataFrame(regimes(25, 2))
+    loaded.update(Y)
+    model.update(Y)
+
+    assert np.allclose(loaded.filter.log_posterior, model.filter.log_posterior, atol=1e-10)
+    assert loaded.filter.log_likelihood == pytest.approx(model.filter.log_likelihood, rel=1e-12)
+
+
+# a model pickled with the filter keeps it, without the last evaluation report
+def test_pickle():
+    model = fitted(2)
+    model.evaluate(regimes(100, 3))
+
+    loaded = pickle.loads(pickle.dumps(model))
+
+    assert '_report' not in loaded.__dict__
+    assert np.allclose(loaded.filter.log_posterior, model.filter.log_posterior)
+    assert loaded.filter.log_likelihood == model.filter.log_likelihood
+
+
+# the emissions give the log-likelihoods of hmmlearn, also for the spherical covariances by feature
+# of the initialization
+@pytest.mark.parametrize('covariance_type', ['full', 'diag', 'spherical', 'tied'])
+def test_log_likelihood_same_as_hmmlearn(covariance_type):
+    model = fitted(3, covariance_type)
+    X = regimes(500, 7)
+
+    assert np.allclose(model._compute_log_likelihood(X), reference(model)._compute_log_likelihood(X),
+                       rtol=1e-10, atol=1e-8)
+
+    model._init(X)
+
+    assert np.allclose(model._compute_log_likelihood(X), reference(model)._compute_log_likelihood(X),
+                       rtol=1e-10, atol=1e-8)
+
+
+# the emissions are kept while the means and covariances stay, and rebuilt after a refit or a change in place
+def test_emissions_invalidated():
+    model = fitted(3)
+    X = regimes(300, 8)
+    emissions = model.emissions()
+
+    assert model.emissions() is emissions
+
+    model.fit(regimes(1000, 9))
+
+    assert model.emissions() is not emissions
+    assert np.allclose(model._compute_log_likelihood(X), reference(model)._compute_log_likelihood(X))
+
+    emissions = model.emissions()
+    model.means_ += 1.
+
+    assert model.emissions() is not emissions
+    assert np.allclose(model._compute_log_likelihood(X), reference(model)._compute_log_likelihood(X))
+
+
+# the report gives the score, criteria, Viterbi path and posteriors of hmmlearn
+def test_evaluate_same_as_hmmlearn():
+    model = fitted(3, 'diag')
+    hmm = reference(model)
+    X = regimes(800, 11)
+
+    report = model.evaluate(X)
+    viterbi_log_prob, states = hmm.decode(X, algorithm='viterbi')
+
+    assert report.score == pytest.approx(hmm.score(X), rel=1e-10)
+    assert report.aic == pytest.approx(hmm.aic(X), rel=1e-10)
+    assert report.bic == pytest.approx(hmm.bic(X), rel=1e-10)
+    assert report.viterbi_log_prob == pytest.approx(viterbi_log_prob, rel=1e-10)
+    assert np.array_equal(report.states, states)
+    assert np.allclose(report.posteriors, hmm.predict_proba(X), atol=1e-8)
+
+
+# the report is kept for the same data and parameters, and computed again for other data or when the
+# parameters change in place
+def test_evaluate_memoized():
+    model = fitted(3)
+    X = regimes(500, 12)
+    report = model.evaluate(X)
+
+    assert model.evaluate(X.copy()) is report
+    assert model.evaluate(X[:-1]) is not report
+
+    report = model.evaluate(X)
+
+    for parameter in ['startprob_', 'transmat_', 'means_', '_covars_']:
+        values = getattr(model, parameter)
+
+        if parameter in ['startprob_', 'transmat_']:
+            values[:] = 0.9 * values + 0.1 / model.n_components
+        else:
+            values *= 1.1
+
+        assert model.evaluate(X) is not report
+        assert model.evaluate(X).score == pytest.approx(reference(model).score(X), rel=1e-10)
+
+        report = model.evaluate(X)
+
+
+# the split model has the covariances of the model and a copy of the split state in the shape of its covariance
+# type, and is fitted from them
+@pytest.mark.parametrize('covariance_type', ['full', 'diag', 'spherical', 'tied'])
+def test_split_state(covariance_type):
+    model = fitted(2, covariance_type)
+    split = model.split_state()
+    k = int(np.argmax(np.trace(model._full_covars(), axis1=1, axis2=2)))
+
+    assert split.n_components == 3 and split._covars_.shape[1:] == model._covars_.shape[1:]
+    assert np.allclose(split._full_covars(), model._full_covars()[[0, 1, k]])
+    assert np.allclose((split.means_[k] + split.means_[2]) / 2, model.means_[k])
+    assert np.allclose(split.means_[1 - k], model.means_[1 - k])
+    assert np.allclose(split.transmat_.sum(axis=1), 1) and split.startprob_.sum() == pytest.approx(1)
+
+    split.fit(regimes(2000, 0), n_iter=5, resume=True)
+
+    assert split.fit_trace[0] > model.fit_trace[0]
@@ -0,0 +1,115 @@
+import pytest
+import numpy as np
+import os
+from time import sleep
+from urllib.request import urlopen
+from engine.metrics import Metrics, Histogram, BUCKET_BOUNDS
+
+
+# metrics enabled and exported under tmp_path, without the records of other tests
+@pytest.fixture
+def metrics(tmp_path, monkeypatch):
+    for attribute, value in [('histograms', {}), ('counters', {}), ('enabled', False), ('path', None)]:
+        monkeypatch.setattr(Metrics, attribute, value)
+
+    Metrics.enable(path=str(tmp_path / 'logs' / 'metrics.prom'))
+
+    yield Metrics
+
+    Metrics.disable()
+
+
+# the quantiles of log-normal timings are within the ~10% of the width of the buckets, never above the maximum
+@pytest.mark.parametrize('q', [0.01, 0.1, 0.5, 0.9, 0.99, 1.])
+def test_histogram_quantiles(q):
+    values = np.random.default_rng(0).lognormal(np.log(1e-3), 1.5, size=20000)
+    histogram = Histogram()
+
+    for value in values:
+        histogram.observe(value)
+
+    assert histogram.count == len(values) and histogram.sum == pytest.approx(values.sum())
+    assert histogram.quantile(q) == pytest.approx(np.quantile(values, q), rel=0.1)
+    assert histogram.quantile(q) <= histogram.max == values.max()
+
+
+def test_histogram_edges():
+    histogram = Histogram()
+
+    assert np.isnan(histogram.quantile(0.5))
+
+    histogram.observe(2e-3)
+
+    assert histogram.quantile(1.) == 2e-3 and 0.8 * 2e-3 < histogram.quantile(0.5) <= 2e-3
+
+    # values above the last bucket are interpolated up to the maximum
+    histogram = Histogram()
+
+    for value in [2 * BUCKET_BOUNDS[-1], 4 * BUCKET_BOUNDS[-1]]:
+        histogram.observe(value)
+
+    assert histogram.counts[-1] == 2
+    assert histogram.quantile(0.5) == pytest.approx(BUCKET_BOUNDS[-1] + 0.5 * (4 - 1) * BUCKET_BOUNDS[-1])
+    assert histogram.quantile(1.) == 4 * BUCKET_BOUNDS[-1]
+
+
+# the histograms are summaries of their quantiles, sums and counts in seconds, the counters totals,
+# written to the file and served over http
+def test_prometheus_text(metrics):
+    for value in [1e-3, 2e-3, 4e-3]:
+        metrics.observe('transform', value)
+
+    metrics.count('orders_posted')
+    metrics.count('orders_posted', 2)
+
+    transform = metrics.histograms['transform']
+
+    assert metrics.prometheus_text() == '\n'.join([
+        '# TYPE segr_transform_seconds summary',
+        f'segr_transform_seconds{{quantile="0.5"}} {transform.quantile(0.5)}',
+        f'segr_transform_seconds{{quantile="0.99"}} {transform.quantile(0.99)}',
+        f'segr_transform_seconds_sum {1e-3 + 2e-3 + 4e-3}',
+        'segr_transform_seconds_count 3',
+        '# TYPE segr_orders_posted_total counter',
+        'segr_orders_posted_total 3',
+    ]) + '\n'
+
+    metrics.export()
+
+    with open(metrics.path) as metrics_file:
+        assert metrics_file.read() == metrics.prometheus_text()
+
+    assert os.listdir(os.path.dirname(metrics.path)) == ['metrics.prom']
+
+    server = metrics.serve(0)
+
+    with urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as response:
+        assert response.read().decode() == metrics.prometheus_text()
+
+
+# a nested span is timed within the span around it, spans of the same name add to one histogram
+def test_span_nesting(metrics):
+    with metrics.span('update'):
+        sleep(0.01)
+
+        with metrics.span('transform'):
+            sleep(0.02)
+
+        with metrics.span('transform'):
+            sleep(0.02)
+
+    update, transform = metrics.histograms['update'], metrics.histograms['transform']
+
+    assert update.count == 1 and transform.count == 2
+    assert transform.sum >= 0.04 and update.sum >= transform.sum + 0.01
+
+
+# while disabled, spans are the same empty context and nothing is recorded
+def test_disabled(metrics):
+    metrics.disable()
+
+    with metrics.span('update') as span:
+        metrics.count('orders_posted')
+
+    assert span is None and metrics.span('update') is metrics.span('transform')
+    assert metrics.histograms == {} and metrics.counters == {}
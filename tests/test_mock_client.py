@@ -0,0 +1,194 @@
+import pytest
+import numpy as np
+from decimal import Decimal
+from types import SimpleNamespace
+from datetime import date, timedelta
+from conftest import make_ticker, make_candles
+from api.broker_list import t_invest
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.schemas.enums import OrderDirection, OrderType, OrderExecutionReportStatus, SessionPeriod
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+
+pytest.importorskip('tinkoff')
+
+import api.tinvest.mock_client as mock_client
+import baseline_mock_client
+
+TICKERS = [make_ticker(n) for n in range(3)]
+FILL = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
+
+
+# the refined candles of the tickers over the days, read by the mock clients instead of the storage
+def store_candles(monkeypatch, days: list[date]) -> dict:
+    candles = {
+        ticker: CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(
+            make_candles(days, seed=n)
+        ).round(2)
+        for n, ticker in enumerate(TICKERS)
+    }
+
+    for attribute in ['candles_in_memory', 'last_candles', 'candles_start_dates']:
+        monkeypatch.setattr(LocalCandlesUploader, attribute, {})
+
+    monkeypatch.setattr(LocalCandlesUploader, 'upload_candles', staticmethod(lambda ticker: candles[ticker]))
+
+    return candles
+
+
+# a backtest posting random orders around the top of the book, at its prices or a few increments away,
+# and cancelling random ones, also while the exchange is closed unless closed is False; runs for the number
+# of periods or to the end of the candles, returns the client and the instruments of the orders
+def backtest(module, candles: dict, n_periods: int = None, seed: int = 0, closed: bool = True, **kwargs) -> tuple:
+    rng = np.random.default_rng(seed)
+    client = module.TMockClient(period=candles[TICKERS[0]].index[0], tickers=TICKERS, **kwargs).__enter__()
+    orders = client.services.orders
+    instrument_ids = []
+    n = 0
+
+    while n_periods is None or n < n_periods:
+        for ticker in TICKERS:
+            if not closed and client.period.instrument_session[ticker.type_instrument] == SessionPeriod.CLOSED:
+                continue
+
+            book = client.services.market_data.get_order_book(instrument_id=ticker.uid, depth=1)
+            direction = [OrderDirection.ORDER_DIRECTION_BUY, OrderDirection.ORDER_DIRECTION_SELL][rng.integers(2)]
+            price = book.bids[0].price if direction == OrderDirection.ORDER_DIRECTION_BUY else book.asks[0].price
+
+            if rng.random() < 0.3:
+                orders.post_order(
+                    quantity=int(rng.integers(1, 5)),
+                    price=Decimal(str(round(price, 2))) + Decimal('0.01') * int(rng.integers(-3, 4)),
+                    direction=direction,
+                    order_type=OrderType.ORDER_TYPE_LIMIT if rng.random() < 0.8 else OrderType.ORDER_TYPE_MARKET,
+                    instrument_id=ticker.uid
+                )
+                instrument_ids.append(ticker.uid)
+
+            if rng.random() < 0.1 and orders.id > 0:
+                orders.cancel_order(order_id=str(rng.integers(orders.id)))
+
+        try:
+            client.next_period()
+        except StopIteration:
+            break
+
+        n += 1
+
+    return client, instrument_ids
+
+
+def states(client) -> list[tuple]:
+    orders = client.services.orders
+
+    return [
+        (state.execution_report_status, state.executed_order_price, state.lots_executed, state.total_order_amount)
+        for state in [orders.get_order_state(order_id=str(order_id)) for order_id in range(orders.id)]
+    ]
+
+
+# lots bought less lots sold by ticker
+def positions(client, instrument_ids: list[str]) -> dict[str, int]:
+    lots = {ticker.uid: 0 for ticker in TICKERS}
+
+    for order_id, instrument_id in enumerate(instrument_ids):
+        state = client.services.orders.get_order_state(order_id=str(order_id))
+
+        if state.execution_report_status == FILL:
+            lots[instrument_id] += state.lots_executed * (
+                1 if state.direction == OrderDirection.ORDER_DIRECTION_BUY else -1
+            )
+
+    return lots
+
+
+# the mock client gives the fills, cash and positions of the baseline one over a backtest with the sessions,
+# breaks and closed nights of a week
+def test_same_as_baseline(monkeypatch):
+    candles = store_candles(monkeypatch, [date(2024, 12, 2) + timedelta(days=i) for i in range(7)])
+    client, instrument_ids = backtest(mock_client, candles, 3000)
+    baseline, _ = backtest(baseline_mock_client, candles, 3000)
+
+    assert client.period.time_period == baseline.period.time_period
+    assert client.last_candles_idx == baseline.last_candles_idx
+    assert states(client) == states(baseline)
+    assert len([state for state in states(client) if state[0] == FILL]) > 100
+    assert client.get_available_balance(None) == pytest.approx(baseline.get_available_balance(None), abs=1e-6)
+    assert positions(client, instrument_ids) == positions(baseline, instrument_ids)
+
+
+# a backtest skipping the minutes without sessions trades as the one going through them, over a working
+# saturday, a sunday and a holiday
+def test_fast_forward(monkeypatch):
+    candles = store_candles(monkeypatch, [date(2024, 11, 1) + timedelta(days=i) for i in range(5)])
+    client, instrument_ids = backtest(mock_client, candles, closed=False, fast_forward=True)
+    expected, expected_instrument_ids = backtest(mock_client, candles, closed=False)
+
+    assert instrument_ids == expected_instrument_ids
+    assert client.period.time_period == expected.period.time_period
+    assert client.period.time_period.date() == date(2024, 11, 5)
+    assert client.last_candles_idx == expected.last_candles_idx
+    assert states(client) == states(expected)
+    assert len([state for state in states(client) if state[0] == FILL]) > 100
+    assert client.get_available_balance(None) == expected.get_available_balance(None)
+    assert positions(client, instrument_ids) == positions(expected, expected_instrument_ids)
+
+
+# the services of a mock client of the tickers, as read by the orders
+class BookServices:
+    def __init__(self):
+        self.client = SimpleNamespace(uid_to_tickers={ticker.uid: ticker for ticker in TICKERS})
+
+
+@pytest.fixture
+def orders():
+    return mock_client.MockOrders(BookServices())
+
+
+def post(orders, price: str, direction=OrderDirection.ORDER_DIRECTION_BUY, order_type=OrderType.ORDER_TYPE_LIMIT,
+         instrument_id: str = 'uid0') -> int:
+    return int(orders.post_order(quantity=1, price=Decimal(price), direction=direction, order_type=order_type,
+                                 instrument_id=instrument_id).order_id)
+
+
+# buy orders at or above the buy price and sell orders at or below the sell price are crossed, with the prices
+# compared on the grid of the increments, whatever the floating point error of the prices of the candles
+def test_book_crossing(orders):
+    buy = [post(orders, price) for price in ['100.10', '100.09', '100.11']]
+    sell = [post(orders, price, OrderDirection.ORDER_DIRECTION_SELL) for price in ['100.30', '100.31', '100.29']]
+    market = post(orders, '0', order_type=OrderType.ORDER_TYPE_MARKET)
+    other = post(orders, '100.10', instrument_id='uid1')
+
+    crossed = orders.pop_crossed_orders('uid0', 100.1 + 1e-12, 100.3 - 1e-12)
+
+    assert sorted(crossed) == sorted([buy[0], buy[2], sell[0], sell[2], market])
+    assert sorted(orders.open_orders.keys()) == [buy[1], sell[1], other]
+
+
+# only the crossed part of the book is taken, the orders of a price in the order of their posting,
+# the rest stays open and is crossed later
+def test_book_partial(orders):
+    ids = [post(orders, price) for price in ['100.00', '100.05', '100.05', '99.90', '100.05']]
+
+    assert orders.pop_crossed_orders('uid0', 100.05, 0) == [ids[1], ids[2], ids[4]]
+    assert orders.limit_orders[('uid0', OrderDirection.ORDER_DIRECTION_BUY)] == ([9990, 10000], [ids[3], ids[0]])
+    assert orders.pop_crossed_orders('uid0', 100.05, 0) == []
+    assert orders.pop_crossed_orders('uid0', 99.95, 0) == [ids[0]]
+
+
+# a cancelled order leaves the book, orders of the same price stay; an order no longer open is not cancelled,
+# and all the orders stay in the history returned by get_orders
+def test_book_cancel(orders):
+    ids = [post(orders, '100.00') for _ in range(3)]
+
+    orders.cancel_order(order_id=str(ids[1]))
+
+    assert orders.limit_orders[('uid0', OrderDirection.ORDER_DIRECTION_BUY)] == ([10000, 10000], [ids[0], ids[2]])
+    assert orders.pop_crossed_orders('uid0', 100, 0) == [ids[0], ids[2]]
+
+    orders.order_history[ids[0]].status = FILL
+    orders.cancel_order(order_id=str(ids[0]))
+
+    assert orders.order_history[ids[0]].status == FILL
+    assert orders.order_history[ids[1]].status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED
+    assert orders.state_changes == [ids[1]]
+    assert [order.order_id for order in orders.get_orders().orders] == [str(i) for i in ids]
@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+import pandas as pd
+import joblib
+import os
+from api.broker_list import t_invest
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.schemas.data_broker import Pipeline
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+from engine.transformers.returns import Returns
+
+pytest.importorskip('pomegranate')
+pytest.importorskip('torch')
+
+from engine.models.hmm import HMMLearn
+from engine.model_selection import select_n_components
+
+
+# every number of states is fitted, its best model saved and its results written, the larger numbers of states
+# are also warm-started from the smaller ones
+def test_select_n_components(ticker, candles, monkeypatch, tmp_path):
+    monkeypatch.setattr(Pipeline, 'nodes', {})
+    refined = CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(candles)
+    monkeypatch.setitem(LocalCandlesUploader.candles_in_memory, ticker, refined)
+
+    results = select_n_components(
+        ticker,
+        [Returns(keep_vol=False), HMMLearn(n_components=2, covariance_type='diag', n_iter=10, random_state=0)],
+        range(2, 5),
+        end_date=candles['time'].iloc[-1],
+        tries=2,
+        n_jobs=2,
+        seed=0,
+        path=str(tmp_path / 'models') + '/',
+        results_path=str(tmp_path / 'results' / 'model_selection.csv')
+    )
+
+    assert results['n_components'].tolist() == [2, 3, 4]
+    assert results['warm_start'].tolist()[0] == False
+    assert np.isfinite(results[['score', 'aic', 'bic', 'fit_time']].to_numpy()).all()
+    assert (results['n_iter'] > 0).all()
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'results' / 'model_selection.csv'), results)
+
+    X = Pipeline(ticker).make_pipeline([Returns(keep_vol=False)], end_date=candles['time'].iloc[-1]).compute()
+
+    for n_components, score in zip(results['n_components'], results['score']):
+        directory = tmp_path / 'models' / f'n_components={n_components}'
+        model = joblib.load(directory / os.listdir(directory)[0])['model']
+
+        assert model.n_components == n_components
+        assert model.score(X.to_numpy()) == pytest.approx(score)
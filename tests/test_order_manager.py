@@ -0,0 +1,156 @@
+import pytest
+from decimal import Decimal
+from queue import Queue, Empty
+from threading import Event
+from time import monotonic, sleep
+from conftest import make_ticker
+from fake_candles_server import FakeCandlesServer, FakeServices, FakeClient
+from engine.schemas.client import Account, OrderState
+from engine.schemas.enums import OrderDirection, OrderType, OrderExecutionReportStatus
+from engine.strategies.datatypes import OrderManager, LocalOrder
+
+NEW = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW
+FILL = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
+CANCELLED = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED
+
+
+def order_state(order_id: str, status: OrderExecutionReportStatus) -> OrderState:
+    return OrderState(
+        execution_report_status=status,
+        order_id=order_id,
+        executed_order_price=None,
+        total_order_amount=None,
+        executed_commission=None,
+        lots_executed=0,
+        direction=OrderDirection.ORDER_DIRECTION_BUY
+    )
+
+
+class FakeOrders:
+    def __init__(self):
+        self.states: dict[str, OrderExecutionReportStatus] = {}
+        self.n_requests = 0
+
+    def get_order_state(self, account_id: str = '', order_id: str = '') -> OrderState:
+        self.n_requests += 1
+
+        return order_state(order_id, self.states[order_id])
+
+
+# an order state stream fed by the test: a state is streamed, an error breaks the stream
+class OrderStreamServices(FakeServices):
+    def __init__(self):
+        super().__init__(FakeCandlesServer({}))
+        self.orders = FakeOrders()
+        self.events = Queue()
+
+    def order_state_events(self, account_id: str, stop: Event):
+        yield None
+
+        while not stop.is_set():
+            try:
+                event = self.events.get(timeout=0.01)
+            except Empty:
+                continue
+
+            if isinstance(event, Exception):
+                raise event
+
+            yield event
+
+
+def wait_for(condition):
+    deadline = monotonic() + 10
+
+    while not condition():
+        assert monotonic() < deadline
+        sleep(0.001)
+
+
+@pytest.fixture
+def manager():
+    client = FakeClient(FakeCandlesServer({}))
+    client.services = OrderStreamServices()
+
+    manager = OrderManager(client=client, account=Account(id='0'), tickers_collection=[make_ticker()])
+
+    for n in range(3):
+        client.services.orders.states[str(n)] = NEW
+        manager.relevant_orders[f'order{n}'] = LocalOrder(
+            order_name=f'order{n}', order_id=str(n), price=100., lots=1,
+            direction=OrderDirection.ORDER_DIRECTION_BUY, instrument_uid='uid0', ticker=make_ticker(),
+            order_type=OrderType.ORDER_TYPE_LIMIT, account_id='0', status=NEW
+        )
+
+    yield manager
+
+    manager.close()
+
+
+def test_without_stream(manager):
+    orders = manager.select_relevant_orders()
+
+    assert {order_id: state.execution_report_status for order_id, state in manager._order_states(orders).items()} \
+           == {'0': NEW, '1': NEW, '2': NEW}
+    assert manager.client.services.orders.n_requests == 3
+
+
+# the states are requested once a connection is made, streamed while it lasts, requested while the stream is down
+# and once more after it reconnects, as the states changed in between are not streamed; the break is passed
+# to on_error, nothing is printed from the thread
+def test_stream_break_and_resync(manager, capsys):
+    services = manager.client.services
+    orders = manager.select_relevant_orders()
+    errors = []
+
+    manager.subscribe()
+    manager.order_states_stream.reconnect_delay = 0.05
+    manager.order_states_stream.on_error = lambda error, delay: errors.append((error, delay))
+    wait_for(manager.order_states_stream.connected.is_set)
+
+    manager._order_states(orders)
+
+    assert services.orders.n_requests == 3
+
+    services.orders.states['0'] = FILL
+    services.events.put(order_state('0', FILL))
+    wait_for(lambda: not manager.order_states.empty())
+
+    assert {order_id: state.execution_report_status for order_id, state in manager._order_states(orders).items()} \
+           == {'0': FILL}
+    assert services.orders.n_requests == 3
+
+    # the stream breaks, the order cancelled meanwhile is not streamed
+    services.events.put(ConnectionError('The connection is reset.'))
+    wait_for(lambda: not manager.order_states_stream.connected.is_set())
+    services.orders.states['1'] = CANCELLED
+
+    assert manager._order_states(orders)['1'].execution_report_status == CANCELLED
+    assert services.orders.n_requests == 6
+
+    wait_for(lambda: manager.order_states_stream.n_connections == 2)
+
+    assert len(errors) == 1 and isinstance(errors[0][0], ConnectionError) and errors[0][1] == 0.05
+    assert manager.order_states_stream.last_error is errors[0][0]
+    assert capsys.readouterr().out == ''
+
+    assert manager._order_states(orders)['1'].execution_report_status == CANCELLED
+    assert services.orders.n_requests == 9
+
+    # connected, nothing is requested until the stream breaks again
+    assert manager._order_states(orders) == {}
+    assert services.orders.n_requests == 9
+
+
+def test_update_relevant_orders_from_stream(manager):
+    services = manager.client.services
+
+    manager.subscribe()
+    wait_for(manager.order_states_stream.connected.is_set)
+    manager.update_relevant_orders()
+
+    services.events.put(order_state('2', FILL))
+    wait_for(lambda: not manager.order_states.empty())
+
+    assert [order.order_id for order in manager.update_relevant_orders()] == ['2']
+    assert manager.relevant_orders['order2'].status == FILL and '2' in manager.transactions.keys()
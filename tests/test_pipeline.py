@@ -0,0 +1,73 @@
+import pytest
+import numpy as np
+import copy
+from api.broker_list import t_invest
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.schemas.data_broker import Pipeline
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+from engine.transformers.returns import Returns
+
+pytest.importorskip('pomegranate')
+pytest.importorskip('torch')
+
+from engine.models.hmm import HMMLearn
+
+SEED = 7
+
+
+# the refined candles of the ticker in memory, and no node interned by other tests
+@pytest.fixture
+def uploaded(ticker, candles, monkeypatch):
+    monkeypatch.setattr(Pipeline, 'nodes', {})
+    refined = CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(candles)
+    monkeypatch.setitem(LocalCandlesUploader.candles_in_memory, ticker, refined)
+
+
+def hmm_pipeline(ticker, candles) -> Pipeline:
+    return Pipeline(ticker).make_pipeline(
+        [Returns(keep_vol=False), HMMLearn(n_components=4, covariance_type='diag', n_iter=5, random_state=SEED)],
+        end_date=candles['time'].iloc[-1]
+    )
+
+
+# the restarts fitted in a pool are the restarts fitted one after another with the seeds drawn from the seed
+def test_fit_same_as_sequential(uploaded, ticker, candles):
+    pipe = hmm_pipeline(ticker, candles).fit(tries=4, n_jobs=2)
+
+    X = pipe.compute().to_numpy()
+    seeds = np.random.SeedSequence(SEED).generate_state(4).tolist()
+    models = [copy.deepcopy(hmm_pipeline(ticker, candles).model) for _ in seeds]
+    scores = []
+
+    for model, seed in zip(models, seeds):
+        model.random_state = seed
+        scores.append(model.fit(X).score(X))
+
+    best = models[int(np.argmax(scores))]
+
+    assert np.allclose(pipe.fit_scores, scores)
+    assert len(set(np.round(scores, 6))) > 1
+    assert np.allclose(pipe.model.means_, best.means_) and np.allclose(pipe.model.transmat_, best.transmat_)
+    assert pipe.model.score(X) == pytest.approx(max(scores))
+
+
+# restarts below the best score by more than the margin after the first iterations are abandoned, the best model
+# is the best of the restarts fitted to the end
+def test_fit_abandoned_excluded(uploaded, ticker, candles):
+    pipe = hmm_pipeline(ticker, candles).fit(tries=6, n_jobs=2, abandon_after=2, abandon_margin=1)
+    complete = [i for i in range(6) if i not in pipe.fit_abandoned]
+
+    assert 0 < len(pipe.fit_abandoned) < 6
+    assert max(pipe.fit_scores[i] for i in pipe.fit_abandoned) < max(pipe.fit_scores[i] for i in complete)
+    assert pipe.model.score(pipe.compute().to_numpy()) == pytest.approx(max(pipe.fit_scores[i] for i in complete))
+    assert pipe.model.filter is not None
+
+
+def test_fit_verbose(uploaded, ticker, candles, capsys):
+    hmm_pipeline(ticker, candles).fit(tries=2, n_jobs=1)
+
+    assert capsys.readouterr().out == ''
+
+    hmm_pipeline(ticker, candles).fit(tries=2, n_jobs=1, verbose=True)
+
+    assert capsys.readouterr().out.count('Score') == 2
@@ -0,0 +1,108 @@
+import pytest
+import pandas as pd
+import pickle
+from conftest import make_ticker
+from api.broker_list import t_invest
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.schemas.data_broker import Pipeline
+from engine.transformers.candles_processing import CandlesRefinerTransformer, RemoveZeroActivityCandles
+from engine.transformers.returns import Returns
+from engine.transformers.tech_indicators import EMA, RSI
+from engine.transformers.streaming import partial_transform
+
+
+# the refined candles of the ticker in memory, and no node interned by other tests
+@pytest.fixture
+def uploaded(ticker, candles, monkeypatch):
+    monkeypatch.setattr(Pipeline, 'nodes', {})
+    refined = CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(candles)
+    monkeypatch.setitem(LocalCandlesUploader.candles_in_memory, ticker, refined)
+
+
+def chain(pipe: Pipeline) -> list:
+    nodes, node = [], pipe.final_datanodes[0]
+
+    while node is not None:
+        nodes.append(node)
+        node = node.parent
+
+    return nodes[::-1]
+
+
+# pipelines of the same steps share all their nodes and the data computed by the first of them, pipelines
+# of the same first steps share the nodes of these steps
+def test_nodes_shared(uploaded, ticker, candles):
+    end_date = candles['time'].iloc[-1]
+    pipe = Pipeline(ticker).make_pipeline([RemoveZeroActivityCandles(), EMA(periods=10)], end_date=end_date)
+    same = Pipeline(ticker).make_pipeline([RemoveZeroActivityCandles(), EMA(periods=10)], end_date=end_date)
+    other = Pipeline(ticker).make_pipeline([RemoveZeroActivityCandles(), EMA(periods=20)], end_date=end_date)
+
+    assert all(node is same_node for node, same_node in zip(chain(pipe), chain(same)))
+    assert chain(other)[:2] == chain(pipe)[:2] and chain(other)[2] is not chain(pipe)[2]
+    assert len(chain(pipe)[1].children) == 2
+
+    pipe.compute()
+
+    assert chain(same)[-1].data is chain(pipe)[-1].data and same.compute().equals(pipe.compute())
+
+    for node in chain(pipe)[1:]:
+        assert node.key == (ticker, node.parent.key, repr(node.transformer))
+        assert Pipeline.nodes[node.key] is node
+
+
+# pipelines of other tickers, end dates or session filters build their own nodes
+def test_nodes_isolated(uploaded, ticker, candles):
+    end_date = candles['time'].iloc[-1]
+    pipe = Pipeline(ticker).make_pipeline([Returns()], end_date=end_date)
+
+    for other in [
+        Pipeline(make_ticker(1)).make_pipeline([Returns()], end_date=end_date),
+        Pipeline(ticker).make_pipeline([Returns()], end_date=candles['time'].iloc[-100]),
+        Pipeline(ticker, remove_session=['premarket']).make_pipeline([Returns()], end_date=end_date)
+    ]:
+        assert not set(map(id, chain(other))) & set(map(id, chain(pipe)))
+
+
+# after the registry is cleared, the pipelines built share new nodes, and the pipelines built before keep theirs
+def test_clear(uploaded, ticker, candles):
+    end_date = candles['time'].iloc[-1]
+    pipe = Pipeline(ticker).make_pipeline([RemoveZeroActivityCandles(), EMA()], end_date=end_date)
+    pipe.compute()
+    data = chain(pipe)[-1].data
+
+    Pipeline.clear()
+
+    new = Pipeline(ticker).make_pipeline([RemoveZeroActivityCandles(), EMA()], end_date=end_date)
+
+    assert not set(map(id, chain(new))) & set(map(id, chain(pipe)))
+    assert chain(new)[1].key == chain(pipe)[1].key
+    assert chain(Pipeline(ticker).make_pipeline([RemoveZeroActivityCandles(), EMA()], end_date=end_date))[-1] is chain(new)[-1]
+    assert chain(new)[-1].data is None
+
+    new.compute()
+
+    assert chain(new)[-1].data.equals(data) and chain(pipe)[-1].data is data
+
+
+# the nodes of a pipeline saved after the fit and loaded into a new pipeline continue from the saved state,
+# the data after the fit date is the stream of the fitted transformers
+@pytest.mark.parametrize('transformer', [EMA, RSI])
+def test_saved_state(uploaded, ticker, candles, transformer):
+    fit_date, end_date = candles['time'].iloc[-1000], candles['time'].iloc[-1]
+    fitted = Pipeline(ticker).make_pipeline([RemoveZeroActivityCandles(), transformer(periods=10)], end_date=fit_date)
+    fitted.compute()
+
+    data_list = []
+    chain(fitted)[-1].save_model(data_list)
+
+    Pipeline.clear()
+
+    loaded = Pipeline(ticker).make_pipeline([RemoveZeroActivityCandles(), transformer(periods=10)], end_date=end_date)
+    chain(loaded)[-1].load_model(pickle.loads(pickle.dumps(data_list)))
+    data = loaded.compute(fit_date=fit_date, end_date=end_date)
+
+    parent_data = chain(loaded)[1].data
+    expected, _ = partial_transform(chain(fitted)[-1].transformer, parent_data, chain(fitted)[-1].state)
+
+    assert parent_data.index[0] > fit_date and len(data) == len(expected) > 0
+    assert data.equals(pd.DataFrame(expected))
@@ -0,0 +1,167 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from threading import Event, Lock, Timer
+from typing import Callable
+from engine.scheduler import MinuteScheduler
+
+START = datetime(2024, 12, 3, 12, 0, 30, 500000, tzinfo=timezone.utc)
+
+
+# the clock of a test, sleeping moves it forward instead of waiting
+class Clock:
+    def __init__(self, start: datetime = START):
+        self.time = start
+        self._lock = Lock()
+
+    def __call__(self) -> datetime:
+        with self._lock:
+            return self.time
+
+    def sleep(self, seconds: float):
+        with self._lock:
+            self.time += timedelta(seconds=max(seconds, 0))
+
+
+# every call of next_period moves the period and runs the action of its number, if any
+class FakeClient:
+    def __init__(self, actions: dict[int, Callable[[], None]] = None):
+        self.actions = {} if actions is None else actions
+        self.period = 0
+
+    def next_period(self):
+        self.period += 1
+
+        if self.period in self.actions.keys():
+            self.actions[self.period]()
+
+
+# every execution takes the seconds of its number on the clock, 0 by default, then runs its action, if any;
+# the periods of the client at the start and at the end of the executions are kept
+class FakeStrategy:
+    def __init__(
+            self,
+            clock: Clock,
+            costs: dict[int, float] = None,
+            actions: dict[int, Callable[[], None]] = None,
+            active: bool = True
+    ):
+        self.clock = clock
+        self.costs = {} if costs is None else costs
+        self.actions = {} if actions is None else actions
+        self.active = active
+        self.n_calls = 0
+        self.n_calls_at_termination = None
+        self.periods: list[tuple[int, int]] = []
+
+    def execute(self, client, account, tickers_collection):
+        self.n_calls += 1
+        period = client.period
+        self.clock.sleep(self.costs.get(self.n_calls, 0))
+
+        if self.n_calls in self.actions.keys():
+            self.actions[self.n_calls]()
+
+        self.periods.append((period, client.period))
+
+    def terminate(self):
+        self.active = False
+        self.n_calls_at_termination = self.n_calls
+
+
+def run(clock: Clock, strategies: list[FakeStrategy], client: FakeClient, max_cycles: int = None):
+    scheduler = MinuteScheduler(clock=clock, sleep_for=clock.sleep)
+    scheduler.run(strategies, client, None, [], max_cycles=max_cycles)
+
+    return scheduler.report()
+
+
+def boundaries(report) -> list[str]:
+    return [boundary.strftime('%H:%M') for boundary in report['boundary']]
+
+
+def test_cycles():
+    clock = Clock()
+    report = run(clock, [FakeStrategy(clock, costs={1: 1, 2: 1, 3: 1})], FakeClient(), max_cycles=3)
+
+    assert boundaries(report) == ['12:01', '12:02', '12:03']
+    assert (report['lateness'] == 0).all() and (report['duration'] == 1).all()
+    assert (report['n_executed'] == 1).all()
+    assert (report[['n_overran', 'n_deferred', 'n_missed']] == 0).all().all()
+
+
+# a strategy running past the deadline makes the next cycle late
+def test_overrun():
+    clock = Clock()
+    report = run(clock, [FakeStrategy(clock, costs={2: 70})], FakeClient(), max_cycles=3)
+
+    assert boundaries(report) == ['12:01', '12:02', '12:03']
+    assert list(report['n_overran']) == [0, 1, 0]
+    assert list(report['lateness']) == [0, 0, 10]
+    assert (report['n_missed'] == 0).all()
+
+
+# a strategy running past the next deadline skips the boundaries in between
+def test_skipped_boundary():
+    clock = Clock()
+    report = run(clock, [FakeStrategy(clock, costs={1: 200})], FakeClient(), max_cycles=2)
+
+    assert boundaries(report) == ['12:01', '12:04']
+    assert list(report['n_missed']) == [0, 2]
+    assert list(report['lateness']) == [0, 20]
+
+
+# nothing is started after a stall of the loop past the deadline, the next cycle is at the next boundary whose
+# deadline is not passed
+def test_stall():
+    clock = Clock()
+    strategy = FakeStrategy(clock)
+    report = run(clock, [strategy], FakeClient(actions={2: lambda: clock.sleep(130)}), max_cycles=3)
+
+    assert boundaries(report) == ['12:01', '12:02', '12:04']
+    assert list(report['n_executed']) == [1, 0, 1] and list(report['n_deferred']) == [0, 1, 0]
+    assert list(report['duration']) == [0, 130, 0]
+    assert list(report['n_missed']) == [0, 0, 1]
+    assert report['lateness'].iloc[2] == 10
+    assert strategy.n_calls == 2
+
+
+# the period is not moved while a strategy overrunning its cycle still executes in it: a cycle whose deadline
+# passes before the strategy finishes is deferred, and every execution sees a single period
+def test_period_held_while_running():
+    clock = Clock()
+    release = Event()
+
+    # the clock passes the deadline of the next cycle while the strategy runs, then the strategy finishes
+    def block():
+        Timer(0.2, clock.sleep, [60]).start()
+        Timer(0.4, release.set).start()
+        release.wait()
+
+    strategy = FakeStrategy(clock, costs={2: 70}, actions={2: block})
+    report = run(clock, [strategy], FakeClient(), max_cycles=4)
+
+    assert boundaries(report) == ['12:01', '12:02', '12:03', '12:04']
+    assert list(report['n_executed']) == [1, 1, 0, 1]
+    assert list(report['n_overran']) == [0, 1, 0, 0]
+    assert list(report['n_deferred']) == [0, 0, 1, 0]
+    assert list(report['lateness']) == [0, 0, 10, 10]
+    assert strategy.periods == [(1, 1), (2, 2), (3, 3)]
+
+
+# the strategies are terminated once the running ones are done
+def test_stop_iteration():
+    clock = Clock()
+
+    def stop():
+        raise StopIteration
+
+    strategies = [FakeStrategy(clock, costs={2: 70}), FakeStrategy(clock)]
+    report = run(clock, strategies, FakeClient(actions={3: stop}))
+
+    assert boundaries(report) == ['12:01', '12:02']
+    assert all(not strategy.active and strategy.n_calls_at_termination == 2 for strategy in strategies)
+
+
+def test_invalid_deadline():
+    with pytest.raises(ValueError):
+        MinuteScheduler(offset=timedelta(seconds=30), deadline=timedelta(seconds=20))
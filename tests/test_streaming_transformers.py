@@ -0,0 +1,171 @@
+import pytest
+import numpy as np
+import pandas as pd
+import pickle
+from datetime import date, timedelta
+from conftest import split, make_ticker
+from api.broker_list import t_invest
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+from engine.transformers.returns import Returns, CandlesToDirection
+from engine.transformers.realized_measures import RV
+from engine.transformers.tech_indicators import RSI, EMA, EMATrendIdentifier
+from engine.transformers.preprocessing import StandardScaler
+from engine.transformers.streaming import partial_transform
+
+# the chunkings of a table: one row at a time and random cuts
+CHUNKINGS = [dict(n_cuts=None)] + [dict(n_cuts=n_cuts, seed=seed) for n_cuts, seed in [(3, 0), (15, 1), (60, 2)]]
+
+
+def streamed(transformer, chunks: list[pd.DataFrame]):
+    outputs, state = [], None
+
+    for chunk in chunks:
+        output, state = partial_transform(transformer, chunk, state)
+        outputs.append(output)
+
+    return pd.concat([output for output in outputs if len(output) > 0])
+
+
+def assert_same(batch, stream):
+    if isinstance(batch, pd.Series):
+        batch, stream = batch.to_frame(), stream.to_frame()
+
+    assert batch.index.equals(stream.index)
+    assert list(batch.columns) == list(stream.columns)
+    assert np.allclose(batch.to_numpy(np.float64), stream.to_numpy(np.float64), rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+def refiner(ticker, candles: pd.DataFrame) -> CandlesRefinerTransformer:
+    return CandlesRefinerTransformer(
+        broker=t_invest,
+        ticker=ticker,
+        candles_request_date=candles['time'].iloc[-1],
+        last_day_number=3
+    )
+
+
+@pytest.fixture(scope='module')
+def refined(candles) -> pd.DataFrame:
+    return refiner(make_ticker(), candles).transform(candles)
+
+
+@pytest.mark.parametrize('chunking', CHUNKINGS)
+def test_refiner(ticker, candles, chunking):
+    # the candles of the first days, refined one by one
+    candles = candles.iloc[:400] if chunking['n_cuts'] is None else candles
+    outputs, state = [], None
+
+    for chunk in split(candles, **chunking):
+        if len(chunk) == 0:
+            continue
+
+        output, state = refiner(ticker, chunk).partial_transform(chunk, state)
+        outputs.append(output)
+
+    assert_same(refiner(ticker, candles).transform(candles).astype(np.float64),
+                pd.concat(outputs).astype(np.float64))
+
+
+@pytest.mark.parametrize('chunking', CHUNKINGS)
+@pytest.mark.parametrize('transformer', [
+    Returns(candle_to_price='close'),
+    Returns(candle_to_price='mean', keep_overnight=True),
+    Returns(candle_to_price='two_way', day_number=True, keep_vol=False),
+    CandlesToDirection(),
+    CandlesToDirection(periods=1),
+    RSI(),
+    EMA(),
+    EMATrendIdentifier(),
+    StandardScaler()
+], ids=repr)
+def test_transformers(refined, transformer, chunking):
+    transformer.fit(refined)
+
+    assert_same(transformer.transform(refined), streamed(transformer, split(refined, **chunking)))
+
+
+
+# a transformer saved with its state after some chunks, and loaded as a pipeline loads it, continues the stream
+# it was saved from
+@pytest.mark.parametrize('transformer', [RSI(), RSI(periods=30), EMA(), EMA(periods=5)], ids=repr)
+def test_saved_state(refined, transformer):
+    chunks = split(refined, n_cuts=15, seed=3)
+    transformer.fit(pd.concat(chunks[:5]))
+
+    outputs, state = [], None
+
+    for chunk in chunks[:5]:
+        output, state = partial_transform(transformer, chunk, state)
+        outputs.append(output)
+
+    saved, state = pickle.loads(pickle.dumps((transformer.save_model(), state)))
+
+    if isinstance(saved, type(transformer)):
+        loaded = saved
+    else:
+        loaded = type(transformer)(**transformer.get_params())
+        loaded.load_model(saved)
+
+    for chunk in chunks[5:]:
+        output, state = partial_transform(loaded, chunk, state)
+        outputs.append(output)
+
+    stream = streamed(transformer, chunks)
+
+    assert pd.concat([output for output in outputs if len(output) > 0]).equals(stream)
+    assert_same(transformer.transform(refined), stream)
+
+@pytest.mark.parametrize('chunking', CHUNKINGS)
+def test_realized_variance(refined, chunking):
+    returns = Returns(candle_to_price='close', day_number=True).transform(refined)
+
+    assert_same(RV().transform(returns), streamed(RV(), split(returns, **chunking)))
+
+
+# fewer rows than a window are no output and continue to the rows of the first window
+def test_candles_to_direction_warm_up(refined):
+    transformer = CandlesToDirection(periods=5)
+    output, state = transformer.partial_transform(refined.iloc[:2])
+
+    assert len(output) == 0 and len(state) == 2
+
+    output, state = transformer.partial_transform(refined.iloc[2:6], state)
+
+    assert list(output.index) == list(refined.index[4:6]) and len(state) == 4
+    assert output['bull'].iloc[0] == pytest.approx(np.log(refined['high'].iloc[4] / refined['open'].iloc[0]))
+
+
+# a continuation without new candles fills the minutes without trades up to the request date
+def test_refiner_fills_to_request_date(ticker, candles):
+    head = candles.iloc[:50]
+    _, state = refiner(ticker, head).partial_transform(head)
+
+    last_time = state['candle']['time'].iloc[0]
+    request_date = last_time + timedelta(minutes=4, seconds=30)
+    output, state = CandlesRefinerTransformer(
+        broker=t_invest, ticker=ticker, candles_request_date=request_date
+    ).partial_transform(head.iloc[:0], state)
+
+    assert list(output.index) == [last_time + timedelta(minutes=k) for k in range(1, 4)]
+    assert (output['volume'] == 0).all() and (output['close'] == head['close'].iloc[-1]).all()
+
+
+# the batch output since the streaming protocol: the first day is refined on the grid of trading minutes from
+# the first candle like the other days, the last day ends at the last candle whatever the request date, and
+# the realized variance of the last day, still in progress, is not output
+def test_batch_output(ticker, candles):
+    refined = CandlesRefinerTransformer(
+        broker=t_invest, ticker=ticker, candles_request_date=candles['time'].iloc[-1] + timedelta(hours=2)
+    ).transform(candles)
+
+    assert refined.index[0] == candles['time'].iloc[0] and refined.index[-1] == candles['time'].iloc[-1]
+    assert refined.groupby('day_number').size().to_dict() == {0: 986, 1: 987, 2: 985}
+    assert refined['volume'].sum() == candles['volume'].sum()
+    assert refined['close'].sum() == pytest.approx(303511.64)
+
+    returns = Returns(candle_to_price='close', day_number=True).transform(refined)
+    rv = RV().transform(returns)
+
+    assert [day.date() for day in rv.index] == [date(2024, 12, 2), date(2024, 12, 3)]
+    assert np.allclose(rv['RV'], (returns['returns'] ** 2).groupby(returns['day_number']).sum().iloc[:2])
+    assert list(rv['volume']) == list(returns.groupby('day_number')['volume'].sum().iloc[:2])
@@ -0,0 +1,110 @@
+import pytest
+import pandas as pd
+from datetime import datetime, timezone
+from api.broker_list import t_invest
+import engine.candles.candles_storage as candles_storage
+from engine.candles.candles_storage import ParquetCandlesStorage
+from engine.candles.candles_uploader import LocalCandlesUploader
+from engine.schemas.data_broker import Pipeline, DataNode
+from engine.schemas.enums import OrderDirection, OrderType
+from engine.transformers.candles_processing import CandlesRefinerTransformer
+
+pytest.importorskip('tinkoff')
+
+import api.tinvest.utils as tinvest_utils
+import engine.strategies.strategy as strategy_module
+import engine.sweep as sweep
+from engine.strategies.datatypes import LocalOrder
+from engine.strategies.strategy import Strategy
+
+MOCK_CLIENT_CONFIG = {
+    'period': datetime(2024, 12, 4, 12, 0, tzinfo=timezone.utc),
+    'fast_forward': True,
+}
+
+
+# buys a lot of every ticker at the market every given number of minutes
+class BuyEvery(Strategy):
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self.n = 0
+        self.profits = []
+
+    def _determine_lots(self, ticker):
+        return 1
+
+    def _set_portfolio_prices(self, new_data):
+        return new_data
+
+    def _update(self):
+        self._executed = True
+        self._order_manager.update_relevant_orders()
+
+        if self.n % self.every == 0:
+            self._compute_portfolio_prices()
+
+            self._order_manager.add_new_orders([
+                LocalOrder(order_name=f'buy{self.n}', order_id='', price=self.portfolio_prices[ticker]['to_sell'][0],
+                           lots=1, direction=OrderDirection.ORDER_DIRECTION_BUY, instrument_uid=ticker.uid,
+                           ticker=ticker, order_type=OrderType.ORDER_TYPE_MARKET, account_id=self._account.id)
+                for ticker in self.tickers_collection
+            ])
+            self._trade()
+
+        self.n += 1
+
+
+def build_strategies(params: dict) -> list[Strategy]:
+    return [BuyEvery(params['every'])]
+
+
+# the instruments and the candles of the ticker stored under tmp_path, the workers of the sweep are forked
+# with the paths patched; the state the backtests leave in this process is restored afterwards
+@pytest.fixture
+def stored(ticker, candles, tmp_path, monkeypatch):
+    monkeypatch.setattr(tinvest_utils, 'instrument_path', str(tmp_path / 'instruments') + '/')
+    monkeypatch.setattr(candles_storage, 'candle_path', str(tmp_path / 'candles') + '/')
+    monkeypatch.setattr(strategy_module, 'log_path', str(tmp_path) + '/')
+    monkeypatch.setattr(LocalCandlesUploader, 'storage', ParquetCandlesStorage())
+    monkeypatch.setattr(LocalCandlesUploader, 'broker', t_invest, raising=False)
+    monkeypatch.setattr(DataNode, 'feature_cache', None)
+    monkeypatch.setattr(Pipeline, 'nodes', {})
+    monkeypatch.setattr(sweep, 'shared_candles', {})
+
+    for attribute in ['candles_in_memory', 'new_candles', 'last_candles', 'candles_start_dates']:
+        monkeypatch.setattr(LocalCandlesUploader, attribute, {})
+
+    (tmp_path / 'instruments' / t_invest.broker_name).mkdir(parents=True)
+    pd.DataFrame([{
+        'ticker': ticker.ticker_sign, 'uid': ticker.uid, 'lot': ticker.lot,
+        'min_price_increment': ticker.min_price_increment, 'klong': 2, 'short_enabled_flag': True
+    }]).to_csv(tmp_path / 'instruments' / t_invest.broker_name / 'STOCK.csv', index=False)
+
+    LocalCandlesUploader.storage.append(
+        CandlesRefinerTransformer(broker=t_invest, ticker=ticker).transform(candles),
+        t_invest.broker_name,
+        ticker.ticker_sign
+    )
+
+
+# every point of the grid is backtested in a worker as in this process, and the results are written
+def test_run_sweep(stored, ticker, tmp_path):
+    results = sweep.run_sweep(
+        build_strategies=build_strategies,
+        grid={'every': [5, 20]},
+        mock_client_config=MOCK_CLIENT_CONFIG,
+        tickers_collection=[ticker.ticker_sign],
+        n_jobs=2,
+        results_path=str(tmp_path / 'results' / 'sweep_results.csv')
+    )
+
+    assert results['every'].tolist() == [5, 20]
+    assert results['trades'].iloc[0] > results['trades'].iloc[1] > 0
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'results' / 'sweep_results.csv'), results)
+
+    sweep.share_candles([ticker.ticker_sign], str(tmp_path / 'shared') + '/')
+    sweep.load_shared_candles(str(tmp_path / 'shared') + '/', [ticker.ticker_sign])
+
+    for params, trades in zip(results[['every']].to_dict('records'), results['trades']):
+        assert sweep.run_backtest(build_strategies, params, MOCK_CLIENT_CONFIG, [ticker.ticker_sign])['trades'] == trades
@@ -0,0 +1,69 @@
+import pytest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import engine.trading_interface as trading_interface
+from engine.trading_interface import TradingInterface
+
+
+# the streams started by the tests, recording whether they are running
+streams: list['FakeStream'] = []
+
+
+class FakeStream:
+    def __init__(self, services, tickers):
+        self.running = False
+        streams.append(self)
+
+    def start(self):
+        self.running = True
+
+        return self
+
+    def stop(self):
+        self.running = False
+
+
+class FakeClient:
+    def __init__(self, period_duration: int = 0):
+        self.period_duration = period_duration
+        self.services = SimpleNamespace()
+        self.period = SimpleNamespace(time_period=datetime(2024, 12, 3, 12, 1, tzinfo=timezone.utc))
+        self._cash = 100000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class FailingStrategy:
+    active = True
+    profits = []
+
+    def execute(self, client, account, tickers_collection):
+        raise RuntimeError('The strategy failed.')
+
+
+class FailingScheduler:
+    def run(self, strategies, client, account, tickers_collection):
+        raise RuntimeError('The scheduler failed.')
+
+
+# the market data stream is stopped when the run of the periods or the scheduler raises
+@pytest.mark.parametrize('scheduler', [None, FailingScheduler()])
+def test_stream_stopped_on_error(monkeypatch, scheduler):
+    monkeypatch.setattr(trading_interface, 'CandlesStream', FakeStream)
+    monkeypatch.setattr(trading_interface.Metrics, 'enabled', False)
+    streams.clear()
+
+    with pytest.raises(RuntimeError):
+        TradingInterface(account=None, strategies=[FailingStrategy()]).launch(
+            client_constructor=FakeClient,
+            client_config={},
+            tickers_collection=[],
+            stream_market_data=True,
+            scheduler=scheduler
+        )
+
+    assert len(streams) == 1 and not streams[0].running